@@ -0,0 +1,187 @@
+"""partition log tables
+
+Revision ID: 3c9e1f7a2b4d
+Revises: 7286aa63c5b0
+Create Date: 2025-06-14 10:12:08.512340
+
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9e1f7a2b4d'
+down_revision: Union[str, None] = '7286aa63c5b0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LOG_TABLES = ('application_logs', 'audit_logs', 'performance_logs')
+
+
+log_level = postgresql.ENUM('INFO', 'WARNING', 'ERROR', 'CRITICAL', name='loglevel', create_type=False)
+audit_action = postgresql.ENUM(
+    'CREATE', 'READ', 'UPDATE', 'DELETE', 'LOGIN', 'LOGOUT', name='auditaction', create_type=False
+)
+
+
+def _common_columns():
+    """全ログテーブル共通の列（パーティションキーのtimestampを主キーに含める）"""
+    return [
+        sa.Column('id', sa.Integer, autoincrement=True, nullable=False),
+        sa.Column('timestamp', sa.TIMESTAMP(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    ]
+
+
+def _create_partitioned_tables() -> None:
+    """timestampでレンジパーティション化したログテーブルを作成"""
+    op.create_table(
+        'application_logs',
+        *_common_columns(),
+        sa.Column('level', log_level, nullable=False),
+        sa.Column('source', sa.String(length=50), nullable=False),
+        sa.Column('message', sa.Text, nullable=False),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id', ondelete='SET NULL')),
+        sa.Column('endpoint', sa.String(length=200)),
+        sa.Column('ip_address', sa.String(length=50)),
+        sa.Column('user_agent', sa.String(length=255)),
+        sa.Column('request_id', sa.String(length=50)),
+        sa.Column('additional_data', sa.JSON),
+        sa.PrimaryKeyConstraint('id', 'timestamp'),
+        postgresql_partition_by='RANGE (timestamp)',
+    )
+    op.create_index('ix_application_logs_timestamp', 'application_logs', ['timestamp'])
+    op.create_index('ix_application_logs_level', 'application_logs', ['level'])
+    op.create_index('ix_application_logs_source', 'application_logs', ['source'])
+    op.create_index('ix_application_logs_user_id', 'application_logs', ['user_id'])
+
+    op.create_table(
+        'audit_logs',
+        *_common_columns(),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id', ondelete='SET NULL'), nullable=False),
+        sa.Column('action', audit_action, nullable=False),
+        sa.Column('resource_type', sa.String(length=50), nullable=False),
+        sa.Column('resource_id', sa.Integer),
+        sa.Column('previous_state', sa.JSON),
+        sa.Column('new_state', sa.JSON),
+        sa.Column('ip_address', sa.String(length=50)),
+        sa.Column('user_agent', sa.String(length=255)),
+        sa.Column('additional_data', sa.JSON),
+        sa.PrimaryKeyConstraint('id', 'timestamp'),
+        postgresql_partition_by='RANGE (timestamp)',
+    )
+    op.create_index('ix_audit_logs_timestamp', 'audit_logs', ['timestamp'])
+    op.create_index('ix_audit_logs_user_id', 'audit_logs', ['user_id'])
+    op.create_index('ix_audit_logs_action', 'audit_logs', ['action'])
+    op.create_index('ix_audit_logs_resource_type', 'audit_logs', ['resource_type'])
+    op.create_index('ix_audit_logs_resource_type_resource_id', 'audit_logs', ['resource_type', 'resource_id'])
+
+    op.create_table(
+        'performance_logs',
+        *_common_columns(),
+        sa.Column('endpoint', sa.String(length=200), nullable=False),
+        sa.Column('response_time', sa.Integer, nullable=False),
+        sa.Column('status_code', sa.Integer),
+        sa.Column('request_method', sa.String(length=10)),
+        sa.Column('request_size', sa.Integer),
+        sa.Column('response_size', sa.Integer),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id', ondelete='SET NULL')),
+        sa.Column('ip_address', sa.String(length=50)),
+        sa.Column('user_agent', sa.String(length=255)),
+        sa.Column('additional_metrics', sa.JSON),
+        sa.PrimaryKeyConstraint('id', 'timestamp'),
+        postgresql_partition_by='RANGE (timestamp)',
+    )
+    op.create_index('ix_performance_logs_timestamp', 'performance_logs', ['timestamp'])
+    op.create_index('ix_performance_logs_endpoint', 'performance_logs', ['endpoint'])
+    op.create_index('ix_performance_logs_response_time', 'performance_logs', ['response_time'])
+    op.create_index('ix_performance_logs_user_id', 'performance_logs', ['user_id'])
+
+
+def _create_partitions(table: str, first_day: date, last_day: date) -> None:
+    """first_dayからlast_dayまでのパーティションとデフォルトパーティションを作成"""
+    # 以降はアプリのメンテナンスジョブ（app.logs.partitions）が同じ間隔・命名で作成する
+    weekly = settings.log_partition_interval == 'weekly'
+    step = timedelta(weeks=1) if weekly else timedelta(days=1)
+    start = first_day - timedelta(days=first_day.weekday()) if weekly else first_day
+    while start <= last_day:
+        op.execute(
+            f'CREATE TABLE "{table}_p{start:%Y%m%d}" PARTITION OF "{table}" '
+            # 境界はUTCの0時（日付だけだとセッションのTimeZoneで解釈される）
+            f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{(start + step).isoformat()} 00:00:00+00')"
+        )
+        start += step
+    # 範囲外の行を受け止めるデフォルトパーティション（通常は空のまま）
+    op.execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+
+
+def _legacy_expression(column: str) -> str:
+    """既存テーブルから移す列の式（文字列で保存されていた列は列挙型にキャスト）"""
+    if column == 'timestamp':
+        return 'COALESCE("timestamp", now())'
+    if column == 'level':
+        return '"level"::text::loglevel'
+    if column == 'action':
+        return '"action"::text::auditaction'
+    return f'"{column}"'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing = set(inspector.get_table_names())
+    today = datetime.now(timezone.utc).date()
+
+    # create_allなどで作られた既存のヒープテーブルは退避して、後で行を移す
+    legacy = {}
+    for table in LOG_TABLES:
+        if table not in existing:
+            continue
+        legacy_table = f'{table}_unpartitioned'
+        # 新しいテーブルと名前が衝突する主キー制約・インデックスは退避先では不要
+        indexes = [index['name'] for index in inspector.get_indexes(table)]
+        op.rename_table(table, legacy_table)
+        op.execute(f'ALTER TABLE "{legacy_table}" RENAME CONSTRAINT "{table}_pkey" TO "{legacy_table}_pkey"')
+        for index in indexes:
+            op.drop_index(index, table_name=legacy_table)
+        first = bind.execute(sa.text(f'SELECT min("timestamp") FROM "{legacy_table}"')).scalar()
+        legacy[table] = (legacy_table, first.date() if first else today)
+
+    log_level.create(bind, checkfirst=True)
+    audit_action.create(bind, checkfirst=True)
+    _create_partitioned_tables()
+
+    for table in LOG_TABLES:
+        first_day = min(legacy[table][1], today) if table in legacy else today
+        _create_partitions(table, first_day, today + timedelta(days=settings.log_partition_precreate))
+
+    # 既存の行を移して連番を引き継ぐ
+    for table, (legacy_table, _) in legacy.items():
+        columns = {column['name'] for column in inspector.get_columns(legacy_table)}
+        target = {column['name'] for column in inspector.get_columns(table)}
+        shared = sorted(columns & target)
+        column_list = ', '.join(f'"{name}"' for name in shared)
+        select_list = ', '.join(_legacy_expression(name) for name in shared)
+        op.execute(f'INSERT INTO "{table}" ({column_list}) SELECT {select_list} FROM "{legacy_table}"')
+        op.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f'COALESCE((SELECT max(id) FROM "{table}"), 0) + 1, false)'
+        )
+        op.drop_table(legacy_table)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # パーティションは親テーブルと一緒に削除される
+    for table in reversed(LOG_TABLES):
+        op.drop_table(table)
+    audit_action.drop(op.get_bind(), checkfirst=True)
+    log_level.drop(op.get_bind(), checkfirst=True)
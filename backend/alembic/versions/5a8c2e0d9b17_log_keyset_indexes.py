@@ -0,0 +1,68 @@
+"""composite (filter, timestamp, id) indexes for log keyset pagination
+
+Revision ID: 5a8c2e0d9b17
+Revises: d41a7c9e5f20
+Create Date: 2025-07-03 16:22:40.901377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a8c2e0d9b17'
+down_revision: Union[str, None] = 'd41a7c9e5f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 置き換える単一列のインデックス: (テーブル, インデックス名, 列)
+OLD_INDEXES = [
+    ('application_logs', 'ix_application_logs_timestamp', ['timestamp']),
+    ('application_logs', 'ix_application_logs_level', ['level']),
+    ('application_logs', 'ix_application_logs_source', ['source']),
+    ('application_logs', 'ix_application_logs_user_id', ['user_id']),
+    ('audit_logs', 'ix_audit_logs_timestamp', ['timestamp']),
+    ('audit_logs', 'ix_audit_logs_user_id', ['user_id']),
+    ('audit_logs', 'ix_audit_logs_action', ['action']),
+    ('audit_logs', 'ix_audit_logs_resource_type', ['resource_type']),
+    ('audit_logs', 'ix_audit_logs_resource_type_resource_id', ['resource_type', 'resource_id']),
+    ('performance_logs', 'ix_performance_logs_timestamp', ['timestamp']),
+    ('performance_logs', 'ix_performance_logs_endpoint', ['endpoint']),
+    ('performance_logs', 'ix_performance_logs_user_id', ['user_id']),
+]
+
+# 検索条件 + 並び順(timestamp, id)の複合インデックス
+# 先頭列だけの検索にも使えるため、単一列のインデックスは不要になる
+NEW_INDEXES = [
+    ('application_logs', 'ix_application_logs_timestamp_id', ['timestamp', 'id']),
+    ('application_logs', 'ix_application_logs_level_timestamp_id', ['level', 'timestamp', 'id']),
+    ('application_logs', 'ix_application_logs_source_timestamp_id', ['source', 'timestamp', 'id']),
+    ('application_logs', 'ix_application_logs_user_id_timestamp_id', ['user_id', 'timestamp', 'id']),
+    ('application_logs', 'ix_application_logs_endpoint_timestamp_id', ['endpoint', 'timestamp', 'id']),
+    ('audit_logs', 'ix_audit_logs_timestamp_id', ['timestamp', 'id']),
+    ('audit_logs', 'ix_audit_logs_user_id_timestamp_id', ['user_id', 'timestamp', 'id']),
+    ('audit_logs', 'ix_audit_logs_action_timestamp_id', ['action', 'timestamp', 'id']),
+    ('audit_logs', 'ix_audit_logs_resource_timestamp_id', ['resource_type', 'resource_id', 'timestamp', 'id']),
+    ('performance_logs', 'ix_performance_logs_timestamp_id', ['timestamp', 'id']),
+    ('performance_logs', 'ix_performance_logs_endpoint_timestamp_id', ['endpoint', 'timestamp', 'id']),
+    ('performance_logs', 'ix_performance_logs_status_code_timestamp_id', ['status_code', 'timestamp', 'id']),
+    ('performance_logs', 'ix_performance_logs_user_id_timestamp_id', ['user_id', 'timestamp', 'id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # パーティション化した親テーブルに作成すると全パーティションに作成される
+    for table, name, columns in NEW_INDEXES:
+        op.create_index(name, table, columns)
+    for table, name, _ in OLD_INDEXES:
+        op.drop_index(name, table_name=table)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, name, columns in OLD_INDEXES:
+        op.create_index(name, table, columns)
+    for table, name, _ in NEW_INDEXES:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,66 @@
+"""add performance rollups
+
+Revision ID: 8f2d4b6a1c3e
+Revises: 3c9e1f7a2b4d
+Create Date: 2025-06-21 09:40:27.184512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f2d4b6a1c3e'
+down_revision: Union[str, None] = '3c9e1f7a2b4d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'performance_rollups',
+        sa.Column('id', sa.Integer, autoincrement=True, nullable=False),
+        sa.Column('granularity', sa.String(length=10), nullable=False),
+        sa.Column('bucket_start', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('endpoint', sa.String(length=200), nullable=False),
+        sa.Column('request_method', sa.String(length=10), nullable=False),
+        sa.Column('status_class', sa.String(length=3), nullable=False),
+        sa.Column('request_count', sa.Integer, nullable=False),
+        sa.Column('total_time_ms', sa.BigInteger, nullable=False),
+        sa.Column('min_time_ms', sa.Integer),
+        sa.Column('max_time_ms', sa.Integer),
+        sa.Column('histogram', sa.JSON),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint(
+            'granularity', 'bucket_start', 'endpoint', 'request_method', 'status_class',
+            name='uq_performance_rollups_key',
+        ),
+    )
+    op.create_index('ix_performance_rollups_id', 'performance_rollups', ['id'])
+    op.create_index('ix_performance_rollups_bucket_start', 'performance_rollups', ['bucket_start'])
+    op.create_index(
+        'ix_performance_rollups_granularity_bucket_start', 'performance_rollups', ['granularity', 'bucket_start']
+    )
+
+    # 既存のパフォーマンスログから時間単位のロールアップを作成（ヒストグラムは作成しないため、この期間のp95は算出されない）
+    op.execute(
+        "INSERT INTO performance_rollups (granularity, bucket_start, endpoint, request_method, status_class, "
+        "request_count, total_time_ms, min_time_ms, max_time_ms) "
+        "SELECT 'hour', date_trunc('hour', \"timestamp\"), endpoint, COALESCE(request_method, ''), "
+        "COALESCE((status_code / 100)::text || 'xx', ''), count(*), sum(response_time), "
+        "min(response_time), max(response_time) "
+        "FROM performance_logs GROUP BY 2, 3, 4, 5"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_performance_rollups_granularity_bucket_start', table_name='performance_rollups')
+    op.drop_index('ix_performance_rollups_bucket_start', table_name='performance_rollups')
+    op.drop_index('ix_performance_rollups_id', table_name='performance_rollups')
+    op.drop_table('performance_rollups')
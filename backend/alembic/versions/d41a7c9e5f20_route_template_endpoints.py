@@ -0,0 +1,151 @@
+"""rewrite log endpoints to route templates
+
+Revision ID: d41a7c9e5f20
+Revises: 8f2d4b6a1c3e
+Create Date: 2025-06-28 14:03:51.760219
+
+"""
+from typing import Dict, List, Sequence, Tuple, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from starlette.routing import Route
+
+from app.logs.histogram import merge_histograms
+from app.logs.route_templates import compile_route_templates, endpoint_rewrites
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41a7c9e5f20'
+down_revision: Union[str, None] = '8f2d4b6a1c3e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LOG_TABLES = ('performance_logs', 'application_logs')
+ROLLUP_KEY = ('granularity', 'bucket_start', 'endpoint', 'request_method', 'status_class')
+
+# このリビジョン作成時点のAPIのルートテンプレート
+# 実行時のルーターを読み込むと結果がその時点のルート定義に左右されるため、ここで固定する。
+# 照合は先頭から行うので、同じ階層では固定のパスをパラメータ付きのパスより前に置く。
+ROUTE_TEMPLATES = (
+    '/api/v1/auth/register',
+    '/api/v1/auth/login',
+    '/api/v1/auth/refresh',
+    '/api/v1/auth/password-reset',
+    '/api/v1/auth/password-reset/confirm',
+    '/api/v1/logs/application',
+    '/api/v1/logs/audit',
+    '/api/v1/logs/performance',
+    '/api/v1/logs/application/export',
+    '/api/v1/logs/audit/export',
+    '/api/v1/logs/performance/export',
+    '/api/v1/logs/performance/slow-endpoints',
+    '/api/v1/logs/stats',
+    '/api/v1/logs/performance/analysis',
+    '/api/v1/logs/client',
+    '/api/v1/users/me',
+    '/api/v1/users/{user_id}',
+    '/api/v1/users/{user_id}/helpers',
+    '/api/v1/helpers/me',
+    '/api/v1/helpers/{helper_id}',
+    '/api/v1/helpers/{helper_id}/users',
+    '/api/v1/relationships/',
+    '/api/v1/relationships/{relationship_id}',
+    '/api/v1/recipe-requests/',
+    '/api/v1/recipe-requests/parse-url',
+    '/api/v1/recipe-requests/from-url',
+    '/api/v1/recipe-requests/users/{user_id}',
+    '/api/v1/recipe-requests/{request_id}',
+    '/api/v1/recipe-requests/{request_id}/status',
+    '/api/v1/recipe-requests/{request_id}/feedback',
+    '/api/v1/tasks/',
+    '/api/v1/tasks/users/{user_id}',
+    '/api/v1/tasks/{task_id}',
+    '/api/v1/tasks/{task_id}/status',
+    '/api/v1/qrcodes/',
+    '/api/v1/qrcodes/batch',
+    '/api/v1/qrcodes/{qrcode_id}',
+    '/api/v1/qrcodes/{qrcode_id}/image',
+    '/api/v1/feedback/',
+    '/api/v1/feedback/{feedback_id}',
+    '/api/v1/feedback/{feedback_id}/response',
+    '/api/v1/feedback/{feedback_id}/upload-image',
+)
+
+
+def _route_templates():
+    """固定したテンプレートから照合用のパターンを作成"""
+    return compile_route_templates(Route(path, endpoint=lambda request: None) for path in ROUTE_TEMPLATES)
+
+
+def _rewrite_logs(bind, rewrites: Dict[str, str]) -> None:
+    """生ログのendpointを実パスからテンプレートに書き換える"""
+    for table in LOG_TABLES:
+        endpoints = [row[0] for row in bind.execute(sa.text(f'SELECT DISTINCT endpoint FROM "{table}"'))]
+        params = [{'path': path, 'template': rewrites[path]} for path in endpoints if path in rewrites]
+        if params:
+            bind.execute(sa.text(f'UPDATE "{table}" SET endpoint = :template WHERE endpoint = :path'), params)
+
+
+def _merge_rollups(bind, rewrites: Dict[str, str]) -> None:
+    """実パスのロールアップをテンプレートの行にまとめる（同じキーの行は加算する）"""
+    rollups = sa.table(
+        'performance_rollups',
+        sa.column('id'), *(sa.column(name) for name in ROLLUP_KEY),
+        sa.column('request_count'), sa.column('total_time_ms'),
+        sa.column('min_time_ms'), sa.column('max_time_ms'), sa.column('histogram', sa.JSON),
+    )
+    endpoints = set(rewrites) | set(rewrites.values())
+    rows = bind.execute(sa.select(rollups).where(rollups.c.endpoint.in_(endpoints))).mappings().all()
+
+    groups: Dict[Tuple, List] = {}
+    for row in rows:
+        key = (row['granularity'], row['bucket_start'], rewrites.get(row['endpoint'], row['endpoint']),
+               row['request_method'], row['status_class'])
+        groups.setdefault(key, []).append(row)
+
+    merged = []
+    for key, group in groups.items():
+        if len(group) == 1 and group[0]['endpoint'] == key[2]:
+            continue  # 書き換え不要
+        min_times = [row['min_time_ms'] for row in group if row['min_time_ms'] is not None]
+        max_times = [row['max_time_ms'] for row in group if row['max_time_ms'] is not None]
+        histogram = merge_histograms(row['histogram'] for row in group)
+        merged.append((group, {
+            **dict(zip(ROLLUP_KEY, key)),
+            'request_count': sum(row['request_count'] for row in group),
+            'total_time_ms': sum(row['total_time_ms'] for row in group),
+            'min_time_ms': min(min_times) if min_times else None,
+            'max_time_ms': max(max_times) if max_times else None,
+            'histogram': histogram.to_list() if histogram.total else None,
+        }))
+
+    if not merged:
+        return
+    ids = [row['id'] for group, _ in merged for row in group]
+    for offset in range(0, len(ids), 1000):
+        bind.execute(sa.delete(rollups).where(rollups.c.id.in_(ids[offset:offset + 1000])))
+    bind.execute(sa.insert(rollups), [values for _, values in merged])
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 固定したルート定義からテンプレートを逆引きする（一致しない実パスはそのまま残す）
+    templates = _route_templates()
+    bind = op.get_bind()
+    endpoints = set()
+    for table in LOG_TABLES + ('performance_rollups',):
+        endpoints |= {row[0] for row in bind.execute(sa.text(f'SELECT DISTINCT endpoint FROM "{table}"'))}
+    rewrites = endpoint_rewrites(endpoints, templates)
+    if not rewrites:
+        return
+
+    _rewrite_logs(bind, rewrites)
+    _merge_rollups(bind, rewrites)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # 実パスは復元できないため何もしない
+    pass
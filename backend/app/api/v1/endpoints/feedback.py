@@ -11,7 +11,8 @@ from app.crud.recipe_request import crud_recipe_request
 from app.crud.users import crud_user
 from app.db.models.user import User, UserRole
 from app.core.auth import get_current_active_user
-from app.database import get_db
+from app.database import get_db, get_read_db
+from app.db.unit_of_work import unit_of_work
 from app.utils.image_upload import save_uploaded_image, delete_uploaded_image
 from app.schemas.feedback import (
     FeedbackCreate,
@@ -64,7 +65,8 @@ async def create_feedback(
         )
     
     # フィードバック作成
-    new_feedback = await crud_feedback.create(db, obj_in=feedback_data)
+    async with unit_of_work(db):
+        new_feedback = await crud_feedback.create(db, obj_in=feedback_data)
     return new_feedback
 
 
@@ -74,7 +76,7 @@ async def read_feedbacks(
     user_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 100,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -109,7 +111,7 @@ async def read_feedbacks(
 @router.get("/{feedback_id}", response_model=FeedbackResponse)
 async def read_feedback(
     feedback_id: int = Path(..., title="フィードバックID"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -168,7 +170,8 @@ async def update_feedback(
             detail="このフィードバックを更新する権限がありません。"
         )
     
-    updated_feedback = await crud_feedback.update(db, db_obj=feedback, obj_in=feedback_data)
+    async with unit_of_work(db):
+        updated_feedback = await crud_feedback.update(db, db_obj=feedback, obj_in=feedback_data)
     return updated_feedback
 
 
@@ -197,7 +200,8 @@ async def delete_feedback(
             detail="このフィードバックを削除する権限がありません。"
         )
     
-    await crud_feedback.delete(db, id=feedback_id)
+    async with unit_of_work(db):
+        await crud_feedback.delete(db, id=feedback_id)
     return None
 
 
@@ -246,7 +250,8 @@ async def create_helper_response(
     response_data.helper_id = current_user.id
     
     # 返信作成
-    new_response = await crud_helper_response.create(db, obj_in=response_data)
+    async with unit_of_work(db):
+        new_response = await crud_helper_response.create(db, obj_in=response_data)
     return new_response
 
 
@@ -279,7 +284,8 @@ async def update_helper_response(
         )
     
     # 返信更新
-    updated_response = await crud_helper_response.update(db, db_obj=response, obj_in=response_data)
+    async with unit_of_work(db):
+        updated_response = await crud_helper_response.update(db, db_obj=response, obj_in=response_data)
     return updated_response
 
 
@@ -319,6 +325,7 @@ async def upload_feedback_image(
     
     # フィードバックの更新
     update_data = FeedbackUpdate(photo_url=image_url)
-    updated_feedback = await crud_feedback.update(db, db_obj=feedback, obj_in=update_data)
+    async with unit_of_work(db):
+        updated_feedback = await crud_feedback.update(db, db_obj=feedback, obj_in=update_data)
     
     return updated_feedback
@@ -1,11 +1,12 @@
 """
 ログ関連のAPIエンドポイント
 """
-from fastapi import APIRouter, Depends, Query, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, Query, HTTPException, BackgroundTasks, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.services.auth_service import get_current_admin_user, get_current_user
-from app.logs.log_manager import LogManager
+from app.logs.log_manager import LogManager, export_response
+from app.logs.pagination import next_cursor
 from app.schemas.log import ApplicationLogResponse, AuditLogResponse, PerformanceLogResponse
 from app.schemas.user import User
 from typing import List, Optional
@@ -16,8 +17,12 @@ router = APIRouter(
     tags=["logs"]
 )
 
+# 次のページのカーソルを返すレスポンスヘッダー（最後のページでは付与しない）
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
 @router.get("/application", response_model=List[ApplicationLogResponse])
 async def get_application_logs(
+    response: Response,
     level: Optional[str] = Query(None, description="ログレベル (INFO, WARNING, ERROR, CRITICAL)"),
     source: Optional[str] = Query(None, description="ログソース (API, UI, SYSTEM)"),
     user_id: Optional[int] = Query(None, description="ユーザーID"),
@@ -25,8 +30,9 @@ async def get_application_logs(
     start_time: Optional[datetime] = Query(None, description="開始日時"),
     end_time: Optional[datetime] = Query(None, description="終了日時"),
     limit: int = Query(100, ge=1, le=1000, description="取得する最大結果数"),
-    offset: int = Query(0, ge=0, description="結果をスキップする数"),
-    db: AsyncSession = Depends(get_db),
+    offset: int = Query(0, ge=0, description="結果をスキップする数（cursor指定時は無視）"),
+    cursor: Optional[str] = Query(None, description="前のページのX-Next-Cursorヘッダーの値"),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_admin_user)
 ):
     """アプリケーションログを取得する（管理者専用）"""
@@ -39,12 +45,17 @@ async def get_application_logs(
         start_time=start_time,
         end_time=end_time,
         limit=limit,
-        offset=offset
+        offset=offset,
+        cursor=cursor
     )
+    next_page = next_cursor(logs, limit)
+    if next_page:
+        response.headers[NEXT_CURSOR_HEADER] = next_page
     return logs
 
 @router.get("/audit", response_model=List[AuditLogResponse])
 async def get_audit_logs(
+    response: Response,
     user_id: Optional[int] = Query(None, description="ユーザーID"),
     action: Optional[str] = Query(None, description="アクションタイプ"),
     resource_type: Optional[str] = Query(None, description="リソースタイプ"),
@@ -52,8 +63,9 @@ async def get_audit_logs(
     start_time: Optional[datetime] = Query(None, description="開始日時"),
     end_time: Optional[datetime] = Query(None, description="終了日時"),
     limit: int = Query(100, ge=1, le=1000, description="取得する最大結果数"),
-    offset: int = Query(0, ge=0, description="結果をスキップする数"),
-    db: AsyncSession = Depends(get_db),
+    offset: int = Query(0, ge=0, description="結果をスキップする数（cursor指定時は無視）"),
+    cursor: Optional[str] = Query(None, description="前のページのX-Next-Cursorヘッダーの値"),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_admin_user)
 ):
     """監査ログを取得する（管理者専用）"""
@@ -66,12 +78,17 @@ async def get_audit_logs(
         start_time=start_time,
         end_time=end_time,
         limit=limit,
-        offset=offset
+        offset=offset,
+        cursor=cursor
     )
+    next_page = next_cursor(logs, limit)
+    if next_page:
+        response.headers[NEXT_CURSOR_HEADER] = next_page
     return logs
 
 @router.get("/performance", response_model=List[PerformanceLogResponse])
 async def get_performance_logs(
+    response: Response,
     endpoint: Optional[str] = Query(None, description="エンドポイント"),
     min_response_time: Optional[int] = Query(None, description="最小レスポンス時間（ミリ秒）"),
     max_response_time: Optional[int] = Query(None, description="最大レスポンス時間（ミリ秒）"),
@@ -81,8 +98,9 @@ async def get_performance_logs(
     start_time: Optional[datetime] = Query(None, description="開始日時"),
     end_time: Optional[datetime] = Query(None, description="終了日時"),
     limit: int = Query(100, ge=1, le=1000, description="取得する最大結果数"),
-    offset: int = Query(0, ge=0, description="結果をスキップする数"),
-    db: AsyncSession = Depends(get_db),
+    offset: int = Query(0, ge=0, description="結果をスキップする数（cursor指定時は無視）"),
+    cursor: Optional[str] = Query(None, description="前のページのX-Next-Cursorヘッダーの値"),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_admin_user)
 ):
     """パフォーマンスログを取得する（管理者専用）"""
@@ -97,15 +115,80 @@ async def get_performance_logs(
         start_time=start_time,
         end_time=end_time,
         limit=limit,
-        offset=offset
+        offset=offset,
+        cursor=cursor
     )
+    next_page = next_cursor(logs, limit)
+    if next_page:
+        response.headers[NEXT_CURSOR_HEADER] = next_page
     return logs
 
+@router.get("/application/export", summary="アプリケーションログをエクスポート")
+async def export_application_logs(
+    level: Optional[str] = Query(None, description="ログレベル (INFO, WARNING, ERROR, CRITICAL)"),
+    source: Optional[str] = Query(None, description="ログソース (API, UI, SYSTEM)"),
+    user_id: Optional[int] = Query(None, description="ユーザーID"),
+    endpoint: Optional[str] = Query(None, description="エンドポイント"),
+    start_time: Optional[datetime] = Query(None, description="開始日時"),
+    end_time: Optional[datetime] = Query(None, description="終了日時"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="出力形式 (ndjson, csv)"),
+    gzip: bool = Query(False, description="gzipで圧縮する"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    アプリケーションログをNDJSON/CSVでストリーミング出力する（管理者専用）
+
+    サーバーサイドカーソルで少しずつ読み出すため、件数に関係なくメモリ使用量は一定
+    """
+    filters = dict(level=level, source=source, user_id=user_id, endpoint=endpoint,
+                   start_time=start_time, end_time=end_time)
+    return export_response(db, "application", format, gzip, filters)
+
+@router.get("/audit/export", summary="監査ログをエクスポート")
+async def export_audit_logs(
+    user_id: Optional[int] = Query(None, description="ユーザーID"),
+    action: Optional[str] = Query(None, description="アクションタイプ"),
+    resource_type: Optional[str] = Query(None, description="リソースタイプ"),
+    resource_id: Optional[int] = Query(None, description="リソースID"),
+    start_time: Optional[datetime] = Query(None, description="開始日時"),
+    end_time: Optional[datetime] = Query(None, description="終了日時"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="出力形式 (ndjson, csv)"),
+    gzip: bool = Query(False, description="gzipで圧縮する"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """監査ログをNDJSON/CSVでストリーミング出力する（管理者専用）"""
+    filters = dict(user_id=user_id, action=action, resource_type=resource_type, resource_id=resource_id,
+                   start_time=start_time, end_time=end_time)
+    return export_response(db, "audit", format, gzip, filters)
+
+@router.get("/performance/export", summary="パフォーマンスログをエクスポート")
+async def export_performance_logs(
+    endpoint: Optional[str] = Query(None, description="エンドポイント"),
+    min_response_time: Optional[int] = Query(None, description="最小レスポンス時間（ミリ秒）"),
+    max_response_time: Optional[int] = Query(None, description="最大レスポンス時間（ミリ秒）"),
+    status_code: Optional[int] = Query(None, description="HTTPステータスコード"),
+    request_method: Optional[str] = Query(None, description="HTTPメソッド"),
+    user_id: Optional[int] = Query(None, description="ユーザーID"),
+    start_time: Optional[datetime] = Query(None, description="開始日時"),
+    end_time: Optional[datetime] = Query(None, description="終了日時"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="出力形式 (ndjson, csv)"),
+    gzip: bool = Query(False, description="gzipで圧縮する"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """パフォーマンスログをNDJSON/CSVでストリーミング出力する（管理者専用）"""
+    filters = dict(endpoint=endpoint, min_response_time=min_response_time, max_response_time=max_response_time,
+                   status_code=status_code, request_method=request_method, user_id=user_id,
+                   start_time=start_time, end_time=end_time)
+    return export_response(db, "performance", format, gzip, filters)
+
 @router.get("/performance/slow-endpoints")
 async def get_slow_endpoints(
     threshold_ms: int = Query(500, description="閾値（ミリ秒）"),
     limit: int = Query(10, ge=1, le=100, description="取得する最大結果数"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_admin_user)
 ):
     """遅いエンドポイントの統計を取得する（管理者専用）"""
@@ -115,7 +198,7 @@ async def get_slow_endpoints(
 @router.get("/stats", summary="ログ統計情報を取得")
 async def get_log_statistics(
     days: int = Query(7, ge=1, le=30, description="統計期間（日数）"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_admin_user)
 ):
     """
@@ -132,15 +215,17 @@ async def get_log_statistics(
 async def analyze_performance_logs(
     days: int = Query(7, ge=1, le=30, description="分析期間（日数）"),
     min_requests: int = Query(10, ge=1, description="分析対象とする最小リクエスト数"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_admin_user)
 ):
     """
     パフォーマンスログの分析結果を取得（管理者専用）
 
-    - エンドポイント別の平均/最大/最小レスポンス時間
+    - エンドポイント別の平均/最大/最小/p95レスポンス時間と5xxの件数
     - 異常に遅いエンドポイントの検出
     - リクエスト頻度の高いエンドポイント
+    - ステータスコード別の件数（status_code_distribution。キーは"200"、"404"など）
+    - ステータスクラス別の件数（status_class_distribution。キーは"2xx"、"4xx"など）
     """
     log_manager = LogManager(db)
     return await log_manager.analyze_performance(days=days, min_requests=min_requests)
@@ -11,6 +11,7 @@ from urllib.parse import urljoin
 
 from app.core.auth import get_current_active_user
 from app.database import get_db
+from app.db.unit_of_work import unit_of_work
 from app.db.models.user import User, UserRole
 from app.db.models.qrcode import QRCode, QRCodeTargetType
 from app.schemas.qrcode import (
@@ -58,18 +59,17 @@ async def create_qrcode(
             detail="サポートされていない対象タイプです"
         )
     
-    # QRコードの作成
+    # QRコードの作成と画像パスの更新を1回のコミットで行う
     qrcode_create = qrcode_data.to_qrcode_create(target_url, current_user.id)
-    db_qrcode = await crud_qrcode.create(db, obj_in=qrcode_create)
-    
-    # QRコード画像の生成と保存
-    file_path = get_qrcode_storage_path(db_qrcode.id)
-    base64_image, saved_path = generate_qrcode(target_url, 300, file_path)
-    
-    # 画像パスの更新
-    db_qrcode.image_path = saved_path
-    await db.commit()
-    await db.refresh(db_qrcode)
+    async with unit_of_work(db):
+        db_qrcode = await crud_qrcode.create(db, obj_in=qrcode_create)
+        
+        # QRコード画像の生成と保存
+        file_path = get_qrcode_storage_path(db_qrcode.id)
+        base64_image, saved_path = generate_qrcode(target_url, 300, file_path)
+        
+        # 画像パスの更新
+        db_qrcode.image_path = saved_path
     
     # レスポンス用に画像URLを設定
     response = QRCodeResponse.model_validate(db_qrcode)
@@ -180,10 +180,10 @@ async def get_qrcode_image(
         
         # パスを更新
         qrcode.image_path = saved_path
-        await db.commit()
     
-    # アクセスカウンターのインクリメント
-    await crud_qrcode.increment_access_count(db, qrcode_id=qrcode_id)
+    # 画像パスの更新とアクセスカウンターのインクリメントを1回のコミットで行う
+    async with unit_of_work(db):
+        await crud_qrcode.increment_access_count(db, qrcode_id=qrcode_id)
     
     return FileResponse(qrcode.image_path)
 
@@ -223,7 +223,8 @@ async def delete_qrcode(
             pass
     
     # データベースからQRコードを削除
-    await crud_qrcode.remove(db, id=qrcode_id)
+    async with unit_of_work(db):
+        await crud_qrcode.remove(db, id=qrcode_id)
     
     return None
 
@@ -246,33 +247,34 @@ async def create_qrcodes_batch(
     results = []
     base_url = settings.base_url
     
-    for qrcode_item in qrcodes_data.qrcodes:
-        # 対象URLの生成
-        if qrcode_item.target_type == QRCodeTargetType.RECIPE:
-            target_url = f"{base_url}/api/v1/recipe-requests/{qrcode_item.target_id}"
-        elif qrcode_item.target_type == QRCodeTargetType.TASK:
-            target_url = f"{base_url}/api/v1/tasks/{qrcode_item.target_id}"
-        elif qrcode_item.target_type == QRCodeTargetType.FEEDBACK_FORM:
-            target_url = f"{base_url}/api/v1/feedback/form/{qrcode_item.target_id}"
-        else:
-            continue  # サポートされていないタイプはスキップ
-        
-        # QRコードの作成
-        qrcode_create = qrcode_item.to_qrcode_create(target_url, current_user.id)
-        db_qrcode = await crud_qrcode.create(db, obj_in=qrcode_create)
-        
-        # QRコード画像の生成と保存
-        file_path = get_qrcode_storage_path(db_qrcode.id)
-        base64_image, saved_path = generate_qrcode(target_url, 300, file_path)
-        
-        # 画像パスの更新
-        db_qrcode.image_path = saved_path
-        await db.commit()
-        await db.refresh(db_qrcode)
-        
-        # レスポンス用に画像URLを設定
-        response = QRCodeResponse.model_validate(db_qrcode)
-        response.image_url = f"{base_url}/api/v1/qrcodes/{db_qrcode.id}/image"
-        results.append(response)
+    # すべてのQRコードを1つのトランザクションで作成する
+    async with unit_of_work(db):
+        for qrcode_item in qrcodes_data.qrcodes:
+            # 対象URLの生成
+            if qrcode_item.target_type == QRCodeTargetType.RECIPE:
+                target_url = f"{base_url}/api/v1/recipe-requests/{qrcode_item.target_id}"
+            elif qrcode_item.target_type == QRCodeTargetType.TASK:
+                target_url = f"{base_url}/api/v1/tasks/{qrcode_item.target_id}"
+            elif qrcode_item.target_type == QRCodeTargetType.FEEDBACK_FORM:
+                target_url = f"{base_url}/api/v1/feedback/form/{qrcode_item.target_id}"
+            else:
+                continue  # サポートされていないタイプはスキップ
+            
+            # QRコードの作成
+            qrcode_create = qrcode_item.to_qrcode_create(target_url, current_user.id)
+            db_qrcode = await crud_qrcode.create(db, obj_in=qrcode_create)
+            
+            # QRコード画像の生成と保存
+            file_path = get_qrcode_storage_path(db_qrcode.id)
+            base64_image, saved_path = generate_qrcode(target_url, 300, file_path)
+            
+            # 画像パスの更新
+            db_qrcode.image_path = saved_path
+            await db.flush()
+            
+            # レスポンス用に画像URLを設定
+            response = QRCodeResponse.model_validate(db_qrcode)
+            response.image_url = f"{base_url}/api/v1/qrcodes/{db_qrcode.id}/image"
+            results.append(response)
     
     return results
@@ -12,7 +12,8 @@ from app.crud.feedback import feedback as crud_feedback
 from app.db.models.user import User, UserRole
 from app.db.models.recipe_request import RecipeRequestStatus
 from app.core.auth import get_current_active_user
-from app.database import get_db
+from app.database import get_db, get_read_db
+from app.db.unit_of_work import unit_of_work
 from app.services.recipe_parser import RecipeParserFactory, RecipeUrlValidator
 from app.schemas.recipe_request import (
     RecipeRequestCreate,
@@ -91,7 +92,8 @@ async def create_recipe_request(
             pass
     
     # リクエスト作成
-    db_recipe_request = await crud_recipe_request.create(db, obj_in=recipe_request)
+    async with unit_of_work(db):
+        db_recipe_request = await crud_recipe_request.create(db, obj_in=recipe_request)
     return db_recipe_request
 
 
@@ -103,7 +105,7 @@ async def read_recipe_requests(
     search: Optional[str] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -141,7 +143,7 @@ async def read_recipe_requests(
 @router.get("/{request_id}", response_model=RecipeRequestResponse)
 async def read_recipe_request(
     request_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -193,9 +195,10 @@ async def update_recipe_request(
         )
     
     # リクエスト更新
-    updated_recipe_request = await crud_recipe_request.update(
-        db, db_obj=db_recipe_request, obj_in=recipe_request_update
-    )
+    async with unit_of_work(db):
+        updated_recipe_request = await crud_recipe_request.update(
+            db, db_obj=db_recipe_request, obj_in=recipe_request_update
+        )
     return updated_recipe_request
 
 
@@ -231,9 +234,10 @@ async def update_recipe_request_status(
     
     # ステータス更新
     update_data = {"status": status}
-    updated_recipe_request = await crud_recipe_request.update(
-        db, db_obj=db_recipe_request, obj_in=update_data
-    )
+    async with unit_of_work(db):
+        updated_recipe_request = await crud_recipe_request.update(
+            db, db_obj=db_recipe_request, obj_in=update_data
+        )
     return updated_recipe_request
 
 
@@ -268,7 +272,8 @@ async def delete_recipe_request(
         )
     
     # リクエスト削除
-    await crud_recipe_request.remove(db, id=request_id)
+    async with unit_of_work(db):
+        await crud_recipe_request.remove(db, id=request_id)
     return None
 
 
@@ -278,7 +283,7 @@ async def read_user_recipe_requests(
     status: Optional[RecipeRequestStatus] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -451,7 +456,8 @@ async def create_recipe_request_from_url(
         )
         
         # DBに保存
-        db_recipe_request = await crud_recipe_request.create(db, obj_in=recipe_request)
+        async with unit_of_work(db):
+            db_recipe_request = await crud_recipe_request.create(db, obj_in=recipe_request)
         return db_recipe_request
         
     except HTTPException:
@@ -466,7 +472,7 @@ async def create_recipe_request_from_url(
 @router.get("/{request_id}/feedback", response_model=List[FeedbackResponse])
 async def read_recipe_request_feedback(
     request_id: int = Path(..., title="料理リクエストID"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -11,6 +11,7 @@ from app.db.models.user import User, UserRole
 from app.db.models.user_helper_assignment import RelationshipStatus
 from app.core.auth import get_current_active_user
 from app.database import get_db
+from app.db.unit_of_work import unit_of_work
 from app.schemas.user_helper_assignment import (
     UserHelperAssignmentCreate,
     UserHelperAssignmentUpdate,
@@ -64,7 +65,8 @@ async def create_user_helper_relationship(
         )
     
     # 関連付けを作成
-    assignment = await crud_user_helper_assignment.create(db, obj_in=relationship)
+    async with unit_of_work(db):
+        assignment = await crud_user_helper_assignment.create(db, obj_in=relationship)
     return assignment
 
 
@@ -95,9 +97,10 @@ async def update_user_helper_relationship(
         )
     
     # 関連付けを更新
-    updated = await crud_user_helper_assignment.update(
-        db, db_obj=existing, obj_in=update_data
-    )
+    async with unit_of_work(db):
+        updated = await crud_user_helper_assignment.update(
+            db, db_obj=existing, obj_in=update_data
+        )
     return updated
 
 
@@ -127,5 +130,6 @@ async def delete_user_helper_relationship(
         )
     
     # 関連付けを削除
-    await crud_user_helper_assignment.remove(db, id=relationship_id)
+    async with unit_of_work(db):
+        await crud_user_helper_assignment.remove(db, id=relationship_id)
     return None
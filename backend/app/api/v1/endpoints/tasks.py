@@ -11,7 +11,8 @@ from app.crud.users import crud_user
 from app.db.models.user import User, UserRole
 from app.db.models.task import TaskStatus
 from app.core.auth import get_current_active_user
-from app.database import get_db
+from app.database import get_db, get_read_db
+from app.db.unit_of_work import unit_of_work
 from app.schemas.task import (
     TaskCreate,
     TaskUpdate,
@@ -48,7 +49,8 @@ async def create_task(
         )
     
     # お願いごと作成
-    db_task = await crud_task.create(db, obj_in=task)
+    async with unit_of_work(db):
+        db_task = await crud_task.create(db, obj_in=task)
     return db_task
 
 
@@ -61,7 +63,7 @@ async def read_tasks(
     search: Optional[str] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -101,7 +103,7 @@ async def read_tasks(
 @router.get("/{task_id}", response_model=TaskResponse)
 async def read_task(
     task_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -153,9 +155,10 @@ async def update_task(
         )
     
     # お願いごと更新
-    updated_task = await crud_task.update(
-        db, db_obj=db_task, obj_in=task_update
-    )
+    async with unit_of_work(db):
+        updated_task = await crud_task.update(
+            db, db_obj=db_task, obj_in=task_update
+        )
     return updated_task
 
 
@@ -191,9 +194,10 @@ async def update_task_status(
     
     # ステータス更新
     update_data = {"status": status}
-    updated_task = await crud_task.update(
-        db, db_obj=db_task, obj_in=update_data
-    )
+    async with unit_of_work(db):
+        updated_task = await crud_task.update(
+            db, db_obj=db_task, obj_in=update_data
+        )
     return updated_task
 
 
@@ -228,7 +232,8 @@ async def delete_task(
         )
     
     # お願いごと削除
-    await crud_task.remove(db, id=task_id)
+    async with unit_of_work(db):
+        await crud_task.remove(db, id=task_id)
     return None
 
 
@@ -239,7 +244,7 @@ async def read_user_tasks(
     priority: Optional[int] = Query(None, ge=1, le=5),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
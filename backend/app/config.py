@@ -27,6 +27,11 @@ class Settings(BaseSettings):
     database_pool_size: int = 20
     database_max_overflow: int = 10
     database_pool_recycle: int = 3600
+    database_pool_timeout: int = 30  # プールの空きを待つ最大秒数
+    database_read_url: str = ""  # 読み取り用（レプリカ）の接続URL（空ならdatabase_urlを使用）
+    database_read_your_writes_seconds: float = 5.0  # 変更後、同じユーザーの読み取りをプライマリに送る秒数（レプリカの遅延より長く）
+    database_echo: bool = False  # 実行したSQLをログに出力する（開発時のみ）
+    database_statement_cache_size: int = 500  # asyncpgの接続ごとのプリペアドステートメントキャッシュ数（PgBouncer経由なら0）
     
     # Redis設定
     redis_url: str = "redis://localhost:6379/0"
@@ -66,6 +71,24 @@ class Settings(BaseSettings):
     log_rotation: bool = True
     log_rotation_size: str = "10 MB"
     log_retention_days: int = 30
+    log_partition_interval: str = "daily"  # ログテーブルのパーティション間隔: daily / weekly
+    log_partition_precreate: int = 7  # 事前に作成しておく将来のパーティション数
+    log_partition_maintenance_interval_seconds: int = 3600  # パーティション作成・削除を実行する間隔（秒）
+    log_queue_max_size: int = 10000  # ログ種別ごとのキューの上限件数
+    log_batch_size: int = 500  # この件数が溜まったら即座に書き込む
+    log_flush_interval_ms: int = 1000  # 最初のログが積まれてから書き込むまでの最大待ち時間（ミリ秒）
+    log_overflow_policy: str = "drop_oldest"  # キュー満杯時の動作: drop_oldest / drop_by_level / block
+    log_overflow_keep_level: str = "WARNING"  # drop_by_levelでこのレベル以上のログは古いものを捨ててでも残す
+    log_write_method: str = "auto"  # ログの書き込み方式: auto（asyncpgならcopy、それ以外はorm）/ copy / insert / orm
+    log_db_pool_size: int = 2  # ログ書き込み専用のコネクションプールのサイズ
+    log_spill_dir: str = "logs/spill"  # DBに書き込めない間のログ退避先（空文字で無効）
+    log_spill_segment_size_bytes: int = 16 * 1024 * 1024  # 退避用セグメントファイル1つのサイズ
+    log_spill_fsync: str = "interval"  # 退避時のfsync: always / interval / never
+    log_spill_fsync_interval_ms: int = 1000  # fsyncがintervalのときの同期間隔（ミリ秒）
+    log_spill_retry_interval_ms: int = 5000  # 退避中にDBへの再生を試みる間隔（ミリ秒）
+    log_rollup_minute_retention_hours: int = 48  # 分単位のパフォーマンスロールアップの保持時間
+    log_rollup_hour_retention_days: int = 90  # 時間単位のパフォーマンスロールアップの保持日数
+    metrics_enabled: bool = True  # /metrics（Prometheus形式）を公開する
     
     # 多言語対応
     default_language: str = "ja"
@@ -73,11 +96,27 @@ class Settings(BaseSettings):
     
     # キャッシュ設定
     cache_ttl_seconds: int = 300
+    cache_local_max_entries: int = 1024  # プロセス内（L1）キャッシュの最大エントリ数
+    cache_invalidation_channel: str = "cache:invalidate"  # ワーカー間無効化通知用のPub/Subチャンネル
+    cache_generation_local_ttl_seconds: int = 5  # 世代番号をプロセス内に保持する秒数
+    cache_scan_batch_size: int = 500  # SCANによる一括削除の1回あたりの件数
+    cache_lock_poll_interval_ms: int = 50  # 分散ロック待機中にキャッシュを確認する間隔（ミリ秒）
+    cache_serializer: str = "json"  # json / msgpack
+    cache_compression: str = "none"  # none / zlib / lz4
+    cache_compression_threshold_bytes: int = 1024  # この大きさ以上の値を圧縮する
+    cache_key_max_part_length: int = 64  # これより長い引数はハッシュ化してキーに含める
     
     # レート制限設定
     rate_limit_enabled: bool = True
     rate_limit_requests: int = 100
-    rate_limit_timeframe_seconds: int = 60    # モデル設定
+    rate_limit_timeframe_seconds: int = 60
+    rate_limit_strategy: str = "fixed_window"  # fixed_window / sliding_window / token_bucket
+    rate_limit_user_requests: int = 300  # 認証済みユーザー単位の上限（timeframeあたり）
+    rate_limit_route_limits: str = "{}"  # ルート別上限（例: {"/api/v1/auth/login": "5/60"}）
+    rate_limit_local_max_entries: int = 10000  # ワーカー内で遮断中として保持する識別子の最大数
+    rate_limit_local_sync_seconds: float = 1.0  # 遮断中の識別子をRedisで再確認する間隔（秒、0で無効）
+    
+    # モデル設定
     model_config = SettingsConfigDict(
         env_file = f".env.{os.getenv('APP_ENV', 'development')}",
         case_sensitive = True,
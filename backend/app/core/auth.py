@@ -69,6 +69,21 @@ def decode_jwt_token(token: str) -> Dict[str, Any]:
     """
     return jwt.decode(token, settings.secret_key, algorithms=[ALGORITHM])
 
+def bearer_subject(authorization: Optional[str]) -> Optional[str]:
+    """
+    Authorizationヘッダーのアクセストークンからユーザー（sub）を取得
+    :param authorization: Authorizationヘッダーの値
+    :return: 有効なBearerトークンならsub、それ以外はNone
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        subject = decode_jwt_token(token).get("sub")
+    except JWTError:
+        return None
+    return str(subject) if subject else None
+
 async def get_current_user(token: str, db: "AsyncSession") -> "User":
     """
     現在のユーザーを取得
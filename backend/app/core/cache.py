@@ -1,68 +1,642 @@
 """
 Redisキャッシュユーティリティ
+
+Redis（L2）の手前にプロセス内LRUキャッシュ（L1）を置く2層構成。
+L1はワーカーごとに保持され、Redis Pub/Subの無効化通知で整合性を保つ。
+
+@cachedのキーにはプレフィックス/関数ごとの世代番号を含める。
+@invalidate_cacheは世代番号をINCRするだけで（O(1)）、古い世代のキーは
+参照されなくなり有効期限で自然に消える。
+
+キャッシュミス時の再計算はプロセス内で1つにまとめ（single-flight）、
+必要に応じてRedisロックでワーカー間でも1つに絞る。
 """
+import asyncio
+import enum
+import fnmatch
+import hashlib
 import json
 import inspect
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
 from functools import wraps
-from typing import Any, Callable, Dict, List, Optional, TypeVar, cast
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar, cast
 import redis.asyncio as redis
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing_extensions import TypedDict
 from app.config import settings
+from app.core.cache_serializers import CacheSerializer, build_serializer, get_default_serializer
+
+logger = logging.getLogger(__name__)
+
+# Redis接続プールの初期化（キャッシュとレート制限で共有）
+# 上限に達した場合はエラーにせず、redis_timeout秒まで空きを待つ
+redis_pool = redis.BlockingConnectionPool.from_url(
+    getattr(settings, 'redis_url', getattr(settings, 'REDIS_URL', 'redis://localhost:6379/0')),
+    max_connections=settings.redis_pool_size,
+    timeout=settings.redis_timeout,
+    socket_timeout=settings.redis_timeout,
+    socket_connect_timeout=settings.redis_timeout,
+    health_check_interval=30,
+)
 
 # Redisクライアントの初期化
-redis_client = redis.from_url(getattr(settings, 'redis_url', getattr(settings, 'REDIS_URL', 'redis://localhost:6379/0')))
+redis_client = redis.Redis(connection_pool=redis_pool)
 
 # 戻り値の型変数
 T = TypeVar("T")
 
-async def set_cache(key: str, value: Any, expire: int = 3600) -> None:
+# L1キャッシュに値が存在しないことを表す番兵
+_MISSING = object()
+
+# 世代番号を保持するRedisキーのプレフィックス
+GENERATION_KEY_PREFIX = "cache:gen"
+
+# 再計算用分散ロックのRedisキーのプレフィックス
+LOCK_KEY_PREFIX = "cache:lock"
+
+# 自分が取得したロックのみ解放するLuaスクリプト
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# キャッシュキーに含めない引数名（インスタンス、DBセッション）
+DEFAULT_IGNORED_ARGS = ("self", "cls", "db", "session")
+
+# キーごとの実行中の再計算（single-flight）。呼び出し元とは別のタスクで実行する
+_inflight: Dict[str, asyncio.Task] = {}
+
+# 実行中のバックグラウンド再計算タスク（GCされないよう参照を保持）
+_background_refreshes: Set[asyncio.Task] = set()
+
+
+class LocalCacheStats:
+    """プレフィックスごとのL1キャッシュ統計"""
+
+    __slots__ = ("hits", "misses", "evictions")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        """統計を辞書に変換"""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class LocalCache:
+    """
+    プロセス内LRU/TTLキャッシュ（L1）
+
+    最大エントリ数を超えると最も古く使われたエントリから追い出す。
+    値はデシリアライズ済みのオブジェクトをそのまま保持するため、
+    呼び出し側で返却値を書き換えないこと。
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._stats: Dict[str, LocalCacheStats] = {}
+
+    def _stats_for(self, key: str) -> LocalCacheStats:
+        prefix = key.split(":", 1)[0]
+        stats = self._stats.get(prefix)
+        if stats is None:
+            stats = self._stats[prefix] = LocalCacheStats()
+        return stats
+
+    def get(self, key: str) -> Any:
+        """
+        L1から値を取得
+        Args:
+            key (str): キャッシュキー
+        Returns:
+            Any: 取得した値、存在しないか期限切れの場合は_MISSING
+        """
+        entry = self._entries.get(key)
+        stats = self._stats_for(key)
+        if entry is None:
+            stats.misses += 1
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            stats.misses += 1
+            stats.evictions += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        stats.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        """
+        L1に値を設定
+        Args:
+            key (str): キャッシュキー
+            value (Any): 保存する値
+            ttl (int): 有効期限（秒）
+        """
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted_key, _ = self._entries.popitem(last=False)
+            self._stats_for(evicted_key).evictions += 1
+
+    def delete(self, key: str) -> None:
+        """L1から値を削除"""
+        self._entries.pop(key, None)
+
+    def delete_pattern(self, pattern: str) -> None:
+        """Redisのglobパターンに一致するL1エントリを削除"""
+        for key in [k for k in self._entries if fnmatch.fnmatchcase(k, pattern)]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        """L1の全エントリを削除"""
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """プレフィックスごとのヒット/ミス/追い出し回数を取得"""
+        return {prefix: stats.to_dict() for prefix, stats in self._stats.items()}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# プロセス内キャッシュのインスタンス
+local_cache = LocalCache(max_entries=settings.cache_local_max_entries)
+
+# 世代番号のプロセス内メモ（キー -> (有効期限, 世代番号)）
+# local_cacheに置くとLRUで追い出されたり統計に混ざったりするため、別に持つ。
+# 件数はプレフィックス・関数の数しかない
+_generations: Dict[str, Tuple[float, int]] = {}
+
+
+def _clear_local() -> None:
+    """L1と世代番号のメモをすべて破棄"""
+    local_cache.clear()
+    _generations.clear()
+
+# 無効化通知購読タスク
+_invalidation_task: Optional[asyncio.Task] = None
+
+
+def get_local_cache_stats() -> Dict[str, Dict[str, int]]:
+    """
+    L1キャッシュのプレフィックス別統計を取得
+    Returns:
+        Dict[str, Dict[str, int]]: {prefix: {"hits", "misses", "evictions"}}
+    """
+    return local_cache.get_stats()
+
+
+async def check_redis_health() -> bool:
+    """
+    Redisへの疎通を確認（起動時のヘルスチェック）
+    Returns:
+        bool: 疎通できればTrue
+    """
+    try:
+        await redis_client.ping()
+    except Exception as e:
+        logger.warning("Redisに接続できません: %s", e)
+        return False
+    logger.info("Redis接続プールを初期化しました（最大%d接続）", settings.redis_pool_size)
+    return True
+
+
+async def close_redis() -> None:
+    """Redisクライアントと接続プールを閉じる（終了時）"""
+    await redis_client.aclose()
+    await redis_pool.disconnect()
+
+
+def _apply_invalidation(data: Any) -> None:
+    """無効化通知をL1に反映"""
+    try:
+        message = json.loads(data)
+    except (TypeError, ValueError):
+        logger.warning("不正なキャッシュ無効化通知を無視しました: %r", data)
+        return
+    if "key" in message:
+        local_cache.delete(message["key"])
+        _generations.pop(message["key"], None)
+    elif "pattern" in message:
+        local_cache.delete_pattern(message["pattern"])
+
+
+async def _publish_invalidation(**message: str) -> None:
+    """他ワーカーへL1無効化を通知"""
+    await redis_client.publish(settings.cache_invalidation_channel, json.dumps(message))
+
+
+async def _listen_invalidations() -> None:
+    """無効化通知を購読し続けるバックグラウンド処理"""
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(settings.cache_invalidation_channel)
+            # 購読が切れていた間の通知は失われているためL1を破棄する
+            _clear_local()
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    _apply_invalidation(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("キャッシュ無効化通知の購読に失敗しました: %s", e)
+            _clear_local()
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+
+async def start_invalidation_listener() -> None:
+    """L1無効化通知の購読を開始"""
+    global _invalidation_task
+    if _invalidation_task is None or _invalidation_task.done():
+        _invalidation_task = asyncio.create_task(_listen_invalidations())
+
+
+async def stop_invalidation_listener() -> None:
+    """L1無効化通知の購読を停止"""
+    global _invalidation_task
+    if _invalidation_task is not None:
+        _invalidation_task.cancel()
+        try:
+            await _invalidation_task
+        except asyncio.CancelledError:
+            pass
+        _invalidation_task = None
+
+async def set_cache(
+    key: str, value: Any, expire: int = 3600, serializer: Optional[CacheSerializer] = None
+) -> None:
     """
     キャッシュに値を設定
     Args:
         key (str): キャッシュキー
         value (Any): 保存する値
         expire (int): 有効期限（秒）
+        serializer (CacheSerializer, optional): シリアライザ（省略時は設定値）。
+            schemaと同時には指定できない（schema指定時の圧縮は設定値に従う）
     """
-    serialized = json.dumps(value, default=str)
+    serialized = (serializer or get_default_serializer()).dumps(value)
     await redis_client.set(key, serialized, ex=expire)
 
-async def get_cache(key: str) -> Optional[Any]:
+async def get_cache(key: str, serializer: Optional[CacheSerializer] = None) -> Optional[Any]:
     """
     キャッシュから値を取得
     Args:
         key (str): キャッシュキー
+        serializer (CacheSerializer, optional): シリアライザ（省略時は設定値）。
+            schemaと同時には指定できない（schema指定時の圧縮は設定値に従う）
     Returns:
         Optional[Any]: 取得した値、存在しない場合はNone
     """
     cached = await redis_client.get(key)
     if cached:
-        return json.loads(cached)
+        try:
+            return (serializer or get_default_serializer()).loads(cached)
+        except Exception as e:
+            # シリアライザ変更前の値などは復元できないためミス扱いにする
+            logger.debug("キャッシュ値を復元できませんでした: %s: %s", key, e)
     return None
 
+async def get_many(
+    keys: List[str], serializer: Optional[CacheSerializer] = None
+) -> Dict[str, Any]:
+    """
+    複数のキャッシュを1往復（MGET）でまとめて取得
+    Args:
+        keys (List[str]): キャッシュキーのリスト
+        serializer (CacheSerializer, optional): シリアライザ（省略時は設定値）。
+            schemaと同時には指定できない（schema指定時の圧縮は設定値に従う）
+    Returns:
+        Dict[str, Any]: 取得できたキーと値（存在しないキーは含まない）
+    """
+    if not keys:
+        return {}
+    codec = serializer or get_default_serializer()
+    values = await redis_client.mget(keys)
+    results: Dict[str, Any] = {}
+    for key, cached in zip(keys, values):
+        if not cached:
+            continue
+        try:
+            results[key] = codec.loads(cached)
+        except Exception as e:
+            logger.debug("キャッシュ値を復元できませんでした: %s: %s", key, e)
+    return results
+
+async def set_many(
+    items: Dict[str, Any], expire: int = 3600, serializer: Optional[CacheSerializer] = None
+) -> None:
+    """
+    複数のキャッシュをパイプラインで1往復にまとめて設定
+    Args:
+        items (Dict[str, Any]): キャッシュキーと値
+        expire (int): 有効期限（秒）
+        serializer (CacheSerializer, optional): シリアライザ（省略時は設定値）。
+            schemaと同時には指定できない（schema指定時の圧縮は設定値に従う）
+    """
+    if not items:
+        return
+    codec = serializer or get_default_serializer()
+    pipe = redis_client.pipeline(transaction=False)
+    for key, value in items.items():
+        pipe.set(key, codec.dumps(value), ex=expire)
+    await pipe.execute()
+
 async def delete_cache(key: str) -> None:
     """
     キャッシュから値を削除
     Args:
         key (str): 削除するキャッシュキー
     """
+    local_cache.delete(key)
     await redis_client.delete(key)
+    await _publish_invalidation(key=key)
 
-async def delete_pattern(pattern: str) -> None:
+async def delete_pattern(pattern: str) -> int:
     """
-    パターンに一致するキャッシュをすべて削除
+    パターンに一致するキャッシュをすべて削除（管理用の一括パージ）
+
+    KEYSはキー空間全体を走査してRedisをブロックするため、SCANで少しずつ
+    取得して削除する。通常の無効化には世代番号（bump_generation）を使うこと。
     Args:
         pattern (str): 削除するキャッシュキーのパターン
+    Returns:
+        int: 削除したキー数
+    """
+    local_cache.delete_pattern(pattern)
+    batch_size = settings.cache_scan_batch_size
+    deleted = 0
+    batch: List[Any] = []
+    async for key in redis_client.scan_iter(match=pattern, count=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            await redis_client.delete(*batch)
+            deleted += len(batch)
+            batch = []
+    if batch:
+        await redis_client.delete(*batch)
+        deleted += len(batch)
+    await _publish_invalidation(pattern=pattern)
+    return deleted
+
+def _generation_key(prefix: str, func_name: Optional[str] = None) -> str:
+    """世代番号のRedisキーを作成"""
+    if func_name:
+        return f"{GENERATION_KEY_PREFIX}:{prefix}:{func_name}"
+    return f"{GENERATION_KEY_PREFIX}:{prefix}"
+
+async def get_generation(prefix: str, func_name: str) -> str:
+    """
+    プレフィックスと関数の現在の世代番号を取得
+    
+    世代番号は短時間プロセス内に保持し、毎回のRedis往復を避ける。
+    他ワーカーでの更新はPub/Sub通知で破棄される。
+    Args:
+        prefix (str): キャッシュキーのプレフィックス
+        func_name (str): 関数名
+    Returns:
+        str: キャッシュキーに埋め込む世代トークン（例: "v3.1"）
     """
-    keys = await redis_client.keys(pattern)
-    if keys:
-        await redis_client.delete(*keys)
+    prefix_key = _generation_key(prefix)
+    func_key = _generation_key(prefix, func_name)
+    now = time.monotonic()
+    prefix_memo = _generations.get(prefix_key)
+    func_memo = _generations.get(func_key)
+    if prefix_memo is None or func_memo is None or min(prefix_memo[0], func_memo[0]) <= now:
+        values = await redis_client.mget(prefix_key, func_key)
+        prefix_gen, func_gen = (int(v) if v else 0 for v in values)
+        expires_at = now + settings.cache_generation_local_ttl_seconds
+        _generations[prefix_key] = (expires_at, prefix_gen)
+        _generations[func_key] = (expires_at, func_gen)
+    else:
+        prefix_gen, func_gen = prefix_memo[1], func_memo[1]
+    return f"v{prefix_gen}.{func_gen}"
 
-def cached(prefix: str, expire: int = 3600):
+async def bump_generation(prefix: str, func_name: Optional[str] = None) -> int:
+    """
+    世代番号を進めてプレフィックス（または関数）のキャッシュを一括無効化
+    Args:
+        prefix (str): 無効化するキャッシュのプレフィックス
+        func_name (str, optional): 特定の関数のキャッシュのみ無効化する場合の関数名
+    Returns:
+        int: 新しい世代番号
+    """
+    key = _generation_key(prefix, func_name)
+    generation = await redis_client.incr(key)
+    _generations[key] = (time.monotonic() + settings.cache_generation_local_ttl_seconds, generation)
+    await _publish_invalidation(key=key)
+    return generation
+
+def hash_key_part(value: str) -> str:
+    """
+    長いキー要素を固定長のハッシュに変換
+    Args:
+        value (str): キー要素
+    Returns:
+        str: "h" + 32桁の16進ハッシュ
+    """
+    return "h" + hashlib.blake2b(value.encode(), digest_size=16).hexdigest()
+
+def _normalize_arg(value: Any) -> Any:
+    """引数を実行ごとに変わらないJSON互換の値に変換"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, enum.Enum):
+        return _normalize_arg(value.value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, BaseModel):
+        return _normalize_arg(value.model_dump(mode="json"))
+    if isinstance(value, dict):
+        return {str(k): _normalize_arg(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (set, frozenset)):
+        return sorted((_normalize_arg(v) for v in value), key=repr)
+    if isinstance(value, (list, tuple)):
+        return [_normalize_arg(v) for v in value]
+    if type(value).__repr__ is object.__repr__ and type(value).__str__ is object.__str__:
+        # デフォルトのreprはメモリアドレスを含み、キーが毎回変わってしまう
+        raise TypeError(
+            f"{type(value).__name__}型の引数からは安定したキャッシュキーを作れません。"
+            "ignoreで除外するかkey_builderを指定してください"
+        )
+    return str(value)
+
+def _format_key_part(value: Any) -> str:
+    """キー要素を文字列化し、長すぎる場合はハッシュ化"""
+    normalized = _normalize_arg(value)
+    part = normalized if isinstance(normalized, str) else json.dumps(
+        normalized, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    if len(part) > settings.cache_key_max_part_length:
+        return hash_key_part(part)
+    return part
+
+def default_key_builder(arguments: Dict[str, Any]) -> str:
+    """
+    引数名と値からキャッシュキーの引数部分を作成
+    
+    同じ引数なら位置引数/キーワード引数の違いやプロセスに関わらず同じキーになり、
+    長い引数はハッシュ化されるためキー長も一定以下に収まる。
+    Args:
+        arguments (Dict[str, Any]): 除外対象を取り除いた引数名と値（定義順）
+    Returns:
+        str: キーの引数部分（例: "id=1:role=helper"）
+    """
+    return ":".join(f"{name}={_format_key_part(value)}" for name, value in arguments.items())
+
+def _cache_arguments(
+    signature: inspect.Signature, ignored: Set[str], args: tuple, kwargs: dict
+) -> Dict[str, Any]:
+    """呼び出し引数を引数名に束縛し、キャッシュキーに含めるものだけを返す"""
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    return {
+        name: value
+        for name, value in bound.arguments.items()
+        if name not in ignored and not isinstance(value, AsyncSession)
+    }
+
+def _start_flight(key: str, compute: Callable[[], Awaitable[T]]) -> "asyncio.Task[T]":
+    """
+    再計算を呼び出し元とは別のタスクで開始し、_inflightに登録する
+    計算を始めた呼び出し元がキャンセルされても計算は続き、同じキーの待機者は結果を受け取れる。
+    """
+    task = asyncio.create_task(compute())
+    _inflight[key] = task
+    
+    def _done(t: asyncio.Task) -> None:
+        if _inflight.get(key) is t:
+            del _inflight[key]
+        # 待機者がいない場合に未取得例外の警告を出さない
+        if not t.cancelled():
+            t.exception()
+    
+    task.add_done_callback(_done)
+    return task
+
+async def _single_flight(key: str, compute: Callable[[], Awaitable[T]]) -> T:
+    """
+    同一キーの同時再計算を1つにまとめる
+    
+    実行中の計算があればその結果を待ち、なければ計算を開始してその結果を待つ。
+    待機はshieldするため、呼び出し元のキャンセルは計算にも他の待機者にも伝わらない。
+    Args:
+        key (str): キャッシュキー
+        compute (Callable): 値を計算してキャッシュに保存するコルーチン関数
+    Returns:
+        T: 計算結果
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = _start_flight(key, compute)
+    return await asyncio.shield(task)
+
+async def _compute_with_lock(
+    key: str,
+    lock_timeout: int,
+    compute: Callable[[], Awaitable[T]],
+    read: Callable[[], Awaitable[Any]],
+) -> T:
+    """
+    Redisロックを取得したワーカーだけが再計算する
+    
+    ロックを取得できなかった場合は、他ワーカーの計算結果がキャッシュに
+    入るのを待つ。lock_timeout秒待っても入らなければ自分で計算する。
+    Args:
+        key (str): キャッシュキー
+        lock_timeout (int): ロックの有効期限兼最大待機時間（秒）
+        compute (Callable): 値を計算してキャッシュに保存するコルーチン関数
+        read (Callable): キャッシュから新鮮な値を読むコルーチン関数（なければ_MISSING）
+    Returns:
+        T: 計算結果またはキャッシュから読んだ値
+    """
+    lock_key = f"{LOCK_KEY_PREFIX}:{key}"
+    token = uuid.uuid4().hex
+    if await redis_client.set(lock_key, token, nx=True, ex=lock_timeout):
+        try:
+            return await compute()
+        finally:
+            await redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+    
+    poll_interval = settings.cache_lock_poll_interval_ms / 1000
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(poll_interval)
+        value = await read()
+        if value is not _MISSING:
+            return value
+    
+    logger.warning("キャッシュ再計算ロックの待機がタイムアウトしました: %s", key)
+    return await compute()
+
+def _schedule_refresh(key: str, compute: Callable[[], Awaitable[Any]]) -> None:
+    """古い値を返した後、バックグラウンドで1件だけ再計算する"""
+    if key in _inflight:
+        return
+    
+    # 開始と同時に登録し、後続の呼び出しが重複して再計算しないようにする
+    task = _start_flight(key, compute)
+    _background_refreshes.add(task)
+    
+    def _done(t: asyncio.Task) -> None:
+        _background_refreshes.discard(t)
+        if not t.cancelled() and t.exception() is not None:
+            logger.warning("キャッシュのバックグラウンド再計算に失敗しました: %s: %s", key, t.exception())
+    
+    task.add_done_callback(_done)
+
+def cached(
+    prefix: str,
+    expire: int = 3600,
+    local_ttl: Optional[int] = None,
+    lock_timeout: Optional[int] = None,
+    stale_ttl: Optional[int] = None,
+    schema: Optional[Any] = None,
+    serializer: Optional[CacheSerializer] = None,
+    ignore: Iterable[str] = (),
+    key_builder: Optional[Callable[[Dict[str, Any]], str]] = None,
+):
     """
     関数の結果をキャッシュするデコレータ
     
+    キャッシュミス時の同時呼び出しはプロセス内で1回の計算にまとめる。
+    キーは引数名に束縛した値から作るため、self/db/セッションは自動で除外され、
+    リクエストごとにセッションが変わっても同じキーになる。
+    
     Args:
         prefix (str): キャッシュキーのプレフィックス
         expire (int): キャッシュの有効期間（秒）
+        local_ttl (int, optional): 指定するとプロセス内キャッシュ（L1）も併用する。
+            L1の有効期間（秒）。頻繁に読まれ滅多に変わらないデータ向け
+        lock_timeout (int, optional): 指定するとRedisロックで全ワーカー中1つだけが
+            再計算する。ロックの有効期限兼最大待機時間（秒）
+        stale_ttl (int, optional): 指定すると有効期間切れ後さらにこの秒数は古い値を
+            返し、裏で1件だけ再計算する（stale-while-revalidate）。
+            再計算は呼び出し元のリクエストと並行して走るため、
+            リクエストスコープのDBセッションを共有する関数には使わないこと
+        schema (Any, optional): 戻り値のPydanticスキーマ（例: TaskResponse, List[TaskResponse]）。
+            指定すると型付きのまま保存・復元し、キャッシュミス時もスキーマで返す
+        serializer (CacheSerializer, optional): シリアライザ（省略時は設定値）。
+            schemaと同時には指定できない（schema指定時の圧縮は設定値に従う）
+        ignore (Iterable[str], optional): DEFAULT_IGNORED_ARGSに加えてキーから除外する引数名
+        key_builder (Callable, optional): 引数名→値の辞書からキーの引数部分を作る関数
+            （省略時はdefault_key_builder）
     
     Returns:
         Callable: デコレータ関数
@@ -71,38 +645,110 @@ def cached(prefix: str, expire: int = 3600):
         @cached(prefix="user", expire=300)
         async def get_user_by_id(db, user_id):
             ...
+
+        @cached(prefix="helper_profile", expire=300, local_ttl=30)
+        async def get_helper_profile(db, helper_id):
+            ...
+
+        @cached(prefix="task", expire=300, schema=TaskResponse)
+        async def get_task(db, task_id):
+            ...
+
+        @cached(prefix="recipe", expire=300, ignore=("current_user",))
+        async def list_recipes(db, current_user, status, skip=0, limit=100):
+            ...
     """
+    if schema is not None and serializer is not None:
+        # schemaはPydantic用のシリアライザに置き換えるため、指定したシリアライザが黙って使われなくなる
+        raise ValueError("schemaとserializerは同時に指定できません")
+    if schema is not None:
+        entry_schema = schema
+        if stale_ttl:
+            entry_schema = TypedDict("CachedEntry", {"value": schema, "fresh_until": float})
+        serializer = build_serializer(
+            compression=settings.cache_compression,
+            threshold=settings.cache_compression_threshold_bytes,
+            schema=entry_schema,
+        )
+    
+    ignored = set(DEFAULT_IGNORED_ARGS) | set(ignore)
+    build_key = key_builder or default_key_builder
+    
     def decorator(func: Callable[..., T]) -> Callable[..., T]:
+        signature = inspect.signature(func)
+        
         @wraps(func)
         async def wrapper(*args, **kwargs) -> T:
-            # 最初の引数がselfの場合は除外（クラスメソッド用）
-            cache_args = args[1:] if args and hasattr(args[0], "__class__") else args
+            # キャッシュキーの作成（世代番号を含めて無効化をO(1)にする）
+            generation = await get_generation(prefix, func.__name__)
+            key_parts = [prefix, func.__name__, generation]
+            
+            # 引数をキーに含める（self/db等は除外）
+            arguments_part = build_key(_cache_arguments(signature, ignored, args, kwargs))
+            if arguments_part:
+                key_parts.append(arguments_part)
             
-            # キャッシュキーの作成
-            key_parts = [prefix, func.__name__]
+            cache_key = ":".join(key_parts)
             
-            # 引数をキーに含める
-            if cache_args:
-                key_parts.extend([str(arg) for arg in cache_args])
+            local_expire = min(local_ttl, expire) if local_ttl else None
             
-            # キーワード引数をソートしてキーに含める
-            if kwargs:
-                key_parts.extend([f"{k}:{v}" for k, v in sorted(kwargs.items())])
+            # L1（プロセス内）から取得を試みる
+            if local_ttl:
+                local_result = local_cache.get(cache_key)
+                if local_result is not _MISSING:
+                    return local_result
             
-            cache_key = ":".join(key_parts)
+            async def read_fresh() -> Any:
+                """Redisから新鮮な値を取得（なければ_MISSING）"""
+                entry = await get_cache(cache_key, serializer)
+                if entry is None:
+                    return _MISSING
+                if stale_ttl:
+                    if entry["fresh_until"] <= time.time():
+                        return _MISSING
+                    return entry["value"]
+                return entry
+            
+            async def load() -> Any:
+                """関数を実行して結果をキャッシュに保存"""
+                result = await func(*args, **kwargs)
+                codec = serializer or get_default_serializer()
+                if stale_ttl:
+                    entry = {"value": result, "fresh_until": time.time() + expire}
+                    data = codec.dumps(entry)
+                    await redis_client.set(cache_key, data, ex=expire + stale_ttl)
+                else:
+                    data = codec.dumps(result)
+                    await redis_client.set(cache_key, data, ex=expire)
+                if local_ttl or schema is not None:
+                    # Redisヒット時と同じ形（復元後）で返し、L1にも保持する
+                    stored = codec.loads(data)
+                    result = stored["value"] if stale_ttl else stored
+                    if local_ttl:
+                        local_cache.set(cache_key, result, local_expire)
+                return result
+            
+            async def refresh() -> Any:
+                """必要に応じて分散ロックを取りながら再計算"""
+                if lock_timeout:
+                    return await _compute_with_lock(cache_key, lock_timeout, load, read_fresh)
+                return await load()
             
             # キャッシュから取得を試みる
-            cached_result = await get_cache(cache_key)
+            cached_result = await get_cache(cache_key, serializer)
             if cached_result is not None:
+                if stale_ttl:
+                    if cached_result["fresh_until"] <= time.time():
+                        # 期限切れの値を返しつつ、裏で1件だけ再計算する
+                        _schedule_refresh(cache_key, refresh)
+                        return cached_result["value"]
+                    cached_result = cached_result["value"]
+                if local_ttl:
+                    local_cache.set(cache_key, cached_result, local_expire)
                 return cached_result
             
-            # キャッシュにない場合は関数を実行
-            result = await func(*args, **kwargs)
-            
-            # 結果をキャッシュ
-            await set_cache(cache_key, result, expire)
-            
-            return result
+            # キャッシュにない場合は関数を実行（同時呼び出しは1回にまとめる）
+            return await _single_flight(cache_key, refresh)
         
         return cast(Callable[..., T], wrapper)
     
@@ -129,13 +775,8 @@ def invalidate_cache(prefix: str, func_name: str = None):
         async def wrapper(*args, **kwargs):
             result = await func(*args, **kwargs)
             
-            # キャッシュ無効化パターンの作成
-            pattern = f"{prefix}:*"
-            if func_name:
-                pattern = f"{prefix}:{func_name}:*"
-            
-            # 一致するキャッシュを削除
-            await delete_pattern(pattern)
+            # 世代番号を進めて既存キャッシュを参照されなくする
+            await bump_generation(prefix, func_name)
             
             return result
         
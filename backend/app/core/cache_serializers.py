@@ -0,0 +1,211 @@
+"""
+キャッシュ値のシリアライザ
+
+set_cache/get_cache/@cachedがRedisへ保存する形式を差し替えるための層。
+- JSONSerializer: 従来互換。datetime等は文字列になる
+- MsgpackSerializer: コンパクトなバイナリ形式。datetime/date/Decimal/UUIDを型付きで復元
+- PydanticSerializer: スキーマ指定で型付きオブジェクトとして往復（pydantic-coreで一括処理）
+- CompressedSerializer: 一定サイズ以上の値をzlib/lz4で圧縮するラッパー
+"""
+import json
+import uuid
+from abc import ABC, abstractmethod
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Optional, Union
+
+from pydantic import BaseModel, TypeAdapter
+
+from app.config import settings
+
+try:
+    import msgpack
+except ImportError:  # msgpackはオプション依存
+    msgpack = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # lz4はオプション依存
+    lz4_frame = None
+
+# msgpack拡張型コード
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+_EXT_DECIMAL = 3
+_EXT_UUID = 4
+
+# 圧縮ヘッダー（先頭1バイト）
+_HEADER_RAW = b"\x00"
+_HEADER_ZLIB = b"\x01"
+_HEADER_LZ4 = b"\x02"
+
+
+class CacheSerializer(ABC):
+    """キャッシュ用シリアライザの基底クラス"""
+
+    @abstractmethod
+    def dumps(self, value: Any) -> Union[str, bytes]:
+        """値をRedisに保存する形式に変換"""
+
+    @abstractmethod
+    def loads(self, data: Union[str, bytes]) -> Any:
+        """Redisから取得したデータを値に復元"""
+
+
+class JSONSerializer(CacheSerializer):
+    """従来互換のJSONシリアライザ"""
+
+    def dumps(self, value: Any) -> str:
+        return json.dumps(value, default=str)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+def _msgpack_default(obj: Any) -> Any:
+    """msgpackが直接扱えない型の変換"""
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, obj.isoformat().encode())
+    if isinstance(obj, date):
+        return msgpack.ExtType(_EXT_DATE, obj.isoformat().encode())
+    if isinstance(obj, Decimal):
+        return msgpack.ExtType(_EXT_DECIMAL, str(obj).encode())
+    if isinstance(obj, uuid.UUID):
+        return msgpack.ExtType(_EXT_UUID, obj.bytes)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if hasattr(obj, "to_dict"):
+        # SQLAlchemyモデル（app.db.base.BaseModel）
+        return obj.to_dict()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return str(obj)
+
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    """msgpack拡張型の復元"""
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == _EXT_DATE:
+        return date.fromisoformat(data.decode())
+    if code == _EXT_DECIMAL:
+        return Decimal(data.decode())
+    if code == _EXT_UUID:
+        return uuid.UUID(bytes=data)
+    return msgpack.ExtType(code, data)
+
+
+class MsgpackSerializer(CacheSerializer):
+    """msgpackによるバイナリシリアライザ（pickle不使用）"""
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError("MsgpackSerializerを使うにはmsgpackをインストールしてください")
+
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return msgpack.unpackb(data, ext_hook=_msgpack_ext_hook, raw=False)
+
+
+class PydanticSerializer(CacheSerializer):
+    """
+    Pydanticスキーマ対応シリアライザ
+
+    保存時に一度だけスキーマへ変換（ORMオブジェクトはfrom_attributes）し、
+    取得時はpydantic-coreがJSONから直接型付きオブジェクトを組み立てる。
+    中間のdictを経由しないため、json.loads後にmodel_validateするより速い。
+    """
+
+    def __init__(self, schema: Any):
+        self.schema = schema
+        self._adapter = TypeAdapter(schema)
+
+    def dumps(self, value: Any) -> bytes:
+        value = self._adapter.validate_python(value, from_attributes=True)
+        return self._adapter.dump_json(value)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return self._adapter.validate_json(data)
+
+
+class CompressedSerializer(CacheSerializer):
+    """
+    閾値以上のサイズの値を圧縮するラッパー
+
+    先頭1バイトに圧縮方式を記録するため、閾値未満の値と混在しても復元できる。
+    """
+
+    def __init__(self, inner: CacheSerializer, algorithm: str = "zlib", threshold: int = 1024):
+        if algorithm == "lz4" and lz4_frame is None:
+            raise RuntimeError("lz4圧縮を使うにはlz4をインストールしてください")
+        if algorithm not in ("zlib", "lz4"):
+            raise ValueError(f"未対応の圧縮方式です: {algorithm}")
+        self.inner = inner
+        self.algorithm = algorithm
+        self.threshold = threshold
+
+    def dumps(self, value: Any) -> bytes:
+        data = self.inner.dumps(value)
+        if isinstance(data, str):
+            data = data.encode()
+        if len(data) < self.threshold:
+            return _HEADER_RAW + data
+        if self.algorithm == "lz4":
+            return _HEADER_LZ4 + lz4_frame.compress(data)
+        return _HEADER_ZLIB + zlib.compress(data)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        if isinstance(data, str):
+            data = data.encode()
+        header, body = data[:1], data[1:]
+        if header == _HEADER_ZLIB:
+            body = zlib.decompress(body)
+        elif header == _HEADER_LZ4:
+            body = lz4_frame.decompress(body)
+        elif header != _HEADER_RAW:
+            raise ValueError("圧縮ヘッダーが不正です")
+        return self.inner.loads(body)
+
+
+def build_serializer(
+    name: str = "json",
+    compression: str = "none",
+    threshold: int = 1024,
+    schema: Optional[Any] = None,
+) -> CacheSerializer:
+    """
+    設定値からシリアライザを組み立てる
+
+    Args:
+        name: "json" または "msgpack"（schema指定時は無視）
+        compression: "none", "zlib", "lz4"
+        threshold: 圧縮する最小サイズ（バイト）
+        schema: 指定するとPydanticスキーマ対応シリアライザを使う
+    Returns:
+        CacheSerializer: シリアライザ
+    """
+    if schema is not None:
+        serializer: CacheSerializer = PydanticSerializer(schema)
+    elif name == "msgpack":
+        serializer = MsgpackSerializer()
+    elif name == "json":
+        serializer = JSONSerializer()
+    else:
+        raise ValueError(f"未対応のシリアライザです: {name}")
+    if compression and compression != "none":
+        serializer = CompressedSerializer(serializer, compression, threshold)
+    return serializer
+
+
+@lru_cache()
+def get_default_serializer() -> CacheSerializer:
+    """設定に基づくデフォルトのシリアライザを返す"""
+    return build_serializer(
+        settings.cache_serializer,
+        settings.cache_compression,
+        settings.cache_compression_threshold_bytes,
+    )
@@ -1,96 +1,326 @@
 """
 レート制限ミドルウェア
+
+制限の判定はLuaスクリプトでRedis上でアトミックに行い、1リクエストあたり
+1往復（EVALSHA）で済ませる。方式は設定で選択できる。
+- fixed_window: 固定ウィンドウ（最初のリクエストからtimeframe秒でリセット）
+- sliding_window: スライディングウィンドウログ（直近timeframe秒のリクエスト数）
+- token_bucket: トークンバケット（timeframe秒でlimit個まで補充）
+
+超過と判定された識別子はワーカー内のLocalBlocklistに記憶し、
+リセットまでの間はRedisへ問い合わせずに拒否する。
 """
+import json
 import time
-from typing import Dict, Tuple, Optional
+import uuid
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
 import redis.asyncio as redis
-from fastapi import FastAPI, Request, Response
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
 from starlette.status import HTTP_429_TOO_MANY_REQUESTS
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from app.config import settings
+from app.core.auth import bearer_subject
+
+# 固定ウィンドウ: 初回のみ有効期限を設定するためTTLは延長されない
+FIXED_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local current = redis.call("INCR", KEYS[1])
+local ttl = redis.call("PTTL", KEYS[1])
+if ttl < 0 then
+    redis.call("PEXPIRE", KEYS[1], window)
+    ttl = window
+end
+local allowed = 0
+if current <= limit then allowed = 1 end
+return {allowed, math.max(limit - current, 0), ttl}
+"""
+
+# スライディングウィンドウログ: ソート済みセットに直近のリクエスト時刻を保持
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local t = redis.call("TIME")
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now - window)
+local count = redis.call("ZCARD", KEYS[1])
+if count < limit then
+    redis.call("ZADD", KEYS[1], now, ARGV[3])
+    redis.call("PEXPIRE", KEYS[1], window)
+    return {1, limit - count - 1, window}
+end
+local reset = window
+local oldest = redis.call("ZRANGE", KEYS[1], 0, 0, "WITHSCORES")
+if oldest[2] then reset = tonumber(oldest[2]) + window - now end
+return {0, 0, reset}
+"""
+
+# トークンバケット: 経過時間に応じてトークンを補充し、1リクエストで1個消費
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local t = redis.call("TIME")
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local rate = capacity / window
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", now)
+redis.call("PEXPIRE", KEYS[1], window)
+local reset
+if allowed == 1 then
+    reset = math.ceil((capacity - tokens) / rate)
+else
+    reset = math.ceil((1 - tokens) / rate)
+end
+return {allowed, math.floor(tokens), reset}
+"""
+
+STRATEGY_SCRIPTS = {
+    "fixed_window": FIXED_WINDOW_SCRIPT,
+    "sliding_window": SLIDING_WINDOW_SCRIPT,
+    "token_bucket": TOKEN_BUCKET_SCRIPT,
+}
+
+
+class RateLimitRule(NamedTuple):
+    """レート制限ルール（timeframe秒あたりlimit回）"""
+    limit: int
+    timeframe: int
+
+
+class RateLimitResult(NamedTuple):
+    """レート制限の判定結果"""
+    allowed: bool
+    remaining: int
+    reset_after_ms: int
 
-class RateLimiter(BaseHTTPMiddleware):
+
+def parse_route_limits(value: str) -> Dict[str, RateLimitRule]:
+    """
+    ルート別制限の設定値を解析
+
+    Args:
+        value: JSON文字列（例: '{"/api/v1/auth/login": "5/60"}'）
+    Returns:
+        Dict[str, RateLimitRule]: パスのプレフィックスとルール
     """
-    レート制限ミドルウェア
-    
+    rules = {}
+    for prefix, rule in json.loads(value or "{}").items():
+        limit, timeframe = str(rule).split("/")
+        rules[prefix] = RateLimitRule(int(limit), int(timeframe))
+    return rules
+
+
+class LocalBlocklist:
+    """
+    制限超過中の識別子を保持するプロセス内LRU
+
+    Redisで超過と判定されたキーをリセット時刻まで記憶し、その間の
+    リクエストはRedisへ問い合わせずに拒否する。ただし記憶は最長
+    sync_seconds秒で打ち切り、次のリクエストをRedisへ通して状態を同期する。
+    そのため攻撃中もRedisへの問い合わせはキーあたり一定間隔に抑えられる。
+    """
+
+    def __init__(self, max_entries: int = 10000, sync_seconds: float = 1.0):
+        self.max_entries = max_entries
+        self.sync_seconds = sync_seconds
+        # キー -> (Redisで再確認する時刻, リセット時刻)（いずれもmonotonic）
+        self._entries: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.rejections = 0
+
+    def check(self, key: str) -> Optional[int]:
+        """
+        遮断中かを確認
+        Args:
+            key (str): レート制限キー
+        Returns:
+            Optional[int]: 遮断中ならリセットまでのミリ秒、そうでなければNone
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        recheck_at, reset_at = entry
+        now = time.monotonic()
+        if now >= recheck_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.rejections += 1
+        return max(0, int((reset_at - now) * 1000))
+
+    def block(self, key: str, reset_after_ms: int) -> None:
+        """
+        超過したキーを記憶
+        Args:
+            key (str): レート制限キー
+            reset_after_ms (int): Redisが返したリセットまでのミリ秒
+        """
+        if self.sync_seconds <= 0:
+            return
+        now = time.monotonic()
+        reset_after = reset_after_ms / 1000
+        self._entries[key] = (now + min(reset_after, self.sync_seconds), now + reset_after)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RateLimiter:
+    """
+    レート制限ミドルウェア（純粋なASGIミドルウェア）
+
     指定した期間内のリクエスト数を制限し、
     制限を超えた場合は429エラーを返す。
+    認証済みリクエストはユーザー単位、それ以外はIP単位で数える。
+    BaseHTTPMiddlewareを使わないため、タスク生成のオーバーヘッドがなく
+    ストリーミングレスポンスもそのまま通過する。
     """
     def __init__(
         self,
-        app: FastAPI,
+        app: ASGIApp,
         redis_client: redis.Redis,
         limit: int = 100,
         timeframe: int = 60,
         whitelist_paths: list = None,
-        whitelist_ips: list = None
+        whitelist_ips: list = None,
+        strategy: str = "fixed_window",
+        user_limit: Optional[int] = None,
+        route_limits: Optional[Dict[str, RateLimitRule]] = None,
+        local_max_entries: int = 10000,
+        local_sync_seconds: float = 1.0,
     ):
-        super().__init__(app)
+        if strategy not in STRATEGY_SCRIPTS:
+            raise ValueError(f"未対応のレート制限方式です: {strategy}")
+        self.app = app
         self.redis_client = redis_client
         self.limit = limit
         self.timeframe = timeframe
         self.whitelist_paths = whitelist_paths or ["/api/v1/health", "/ping"]
         self.whitelist_ips = whitelist_ips or ["127.0.0.1", "::1"]
-    
-    async def dispatch(self, request: Request, call_next):
+        self.strategy = strategy
+        self.user_limit = user_limit or limit
+        # 長いプレフィックスを優先して照合する
+        self.route_limits = sorted(
+            (route_limits or {}).items(), key=lambda item: len(item[0]), reverse=True
+        )
+        # register_scriptはEVALSHAで実行し、未ロード時のみEVALにフォールバックする
+        self._script = redis_client.register_script(STRATEGY_SCRIPTS[strategy])
+        # 超過中のクライアントをRedisへ問い合わせずに拒否するための前段フィルタ
+        self.blocklist = LocalBlocklist(local_max_entries, local_sync_seconds)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """リクエストの処理とレート制限のチェック"""
-        # 設定で無効化されている場合はスキップ
-        if not settings.rate_limit_enabled:
-            return await call_next(request)
-        
+        # HTTP以外（lifespan, websocket）と設定で無効化されている場合はスキップ
+        if scope["type"] != "http" or not settings.rate_limit_enabled:
+            await self.app(scope, receive, send)
+            return
+
         # ホワイトリストパスの確認
-        if any(request.url.path.startswith(path) for path in self.whitelist_paths):
-            return await call_next(request)
-        
+        path = scope["path"]
+        if any(path.startswith(p) for p in self.whitelist_paths):
+            await self.app(scope, receive, send)
+            return
+
         # クライアントIPの取得
-        client_ip = request.client.host
-        
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+
         # ホワイトリストIPの確認
         if client_ip in self.whitelist_ips:
-            return await call_next(request)
-        
-        # リクエストカウント更新
-        current_count, is_limited = await self._increment_counter(client_ip)
-        
-        # リクエストヘッダーに制限情報を追加
-        response = await call_next(request) if not is_limited else self._rate_limited_response()
-        response.headers["X-RateLimit-Limit"] = str(self.limit)
-        response.headers["X-RateLimit-Remaining"] = str(max(0, self.limit - current_count))
-        response.headers["X-RateLimit-Reset"] = str(int(time.time() + self.timeframe))
-        
-        return response
-    
-    async def _increment_counter(self, client_ip: str) -> Tuple[int, bool]:
+            await self.app(scope, receive, send)
+            return
+
+        # 制限対象（ユーザーまたはIP）とルールの決定
+        identity = self._identify(Headers(scope=scope), client_ip)
+        route, rule = self._resolve_rule(path, identity)
+
+        # 遮断中ならローカルで拒否し、そうでなければRedisでカウント更新
+        key = f"rate_limit:{self.strategy}:{route}:{identity}"
+        blocked_ms = self.blocklist.check(key)
+        if blocked_ms is not None:
+            result = RateLimitResult(False, 0, blocked_ms)
+        else:
+            result = await self._check_limit(key, rule)
+            if not result.allowed:
+                self.blocklist.block(key, result.reset_after_ms)
+
+        # レスポンスヘッダーに付ける制限情報
+        limit_headers = {
+            "X-RateLimit-Limit": str(rule.limit),
+            "X-RateLimit-Remaining": str(result.remaining),
+            "X-RateLimit-Reset": str(int(time.time() + result.reset_after_ms / 1000)),
+        }
+
+        if not result.allowed:
+            response = self._rate_limited_response(rule, result)
+            response.headers.update(limit_headers)
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                for name, value in limit_headers.items():
+                    headers[name] = value
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    def _identify(self, headers: Headers, client_ip: str) -> str:
+        """有効なアクセストークンがあればユーザー、なければIPで識別"""
+        subject = bearer_subject(headers.get("authorization"))
+        if subject:
+            return f"user:{subject}"
+        return f"ip:{client_ip}"
+
+    def _resolve_rule(self, path: str, identity: str) -> Tuple[str, RateLimitRule]:
+        """パスと識別子に適用するルールを決定"""
+        for prefix, rule in self.route_limits:
+            if path.startswith(prefix):
+                return prefix, rule
+        if identity.startswith("user:"):
+            return "*", RateLimitRule(self.user_limit, self.timeframe)
+        return "*", RateLimitRule(self.limit, self.timeframe)
+
+    async def _check_limit(self, key: str, rule: RateLimitRule) -> RateLimitResult:
         """
-        クライアントIPに対するカウンターを更新
-        
+        Luaスクリプトでカウンターを更新し制限を判定
+
         Returns:
-            Tuple[int, bool]: (現在のカウント, 制限超過フラグ)
+            RateLimitResult: (許可フラグ, 残り回数, リセットまでのミリ秒)
         """
-        key = f"rate_limit:{client_ip}"
-        
-        # パイプラインを使用して複数操作をアトミックに実行
-        pipe = self.redis_client.pipeline()
-        
-        # カウンターが存在しない場合は作成
-        pipe.incr(key)
-        pipe.expire(key, self.timeframe)
-        
-        # 結果の取得
-        results = await pipe.execute()
-        current_count = results[0]
-        
-        # 制限を超えているかどうかの確認
-        return current_count, current_count > self.limit
-    
-    def _rate_limited_response(self) -> Response:
+        args = [rule.limit, rule.timeframe * 1000]
+        if self.strategy == "sliding_window":
+            # 同一ミリ秒のリクエストを区別するための一意なメンバー
+            args.append(uuid.uuid4().hex)
+        allowed, remaining, reset_after_ms = await self._script(keys=[key], args=args)
+        return RateLimitResult(bool(allowed), int(remaining), int(reset_after_ms))
+
+    def _rate_limited_response(self, rule: RateLimitRule, result: RateLimitResult) -> Response:
         """レート制限超過時のレスポンス"""
         content = {
             "error": "Too many requests",
-            "detail": f"リクエスト数の上限（{self.limit}回/{self.timeframe}秒）を超過しました。少し時間を空けてからもう一度お試しください。"
+            "detail": f"リクエスト数の上限（{rule.limit}回/{rule.timeframe}秒）を超過しました。少し時間を空けてからもう一度お試しください。"
         }
         return JSONResponse(
             status_code=HTTP_429_TOO_MANY_REQUESTS,
-            content=content
+            content=content,
+            headers={"Retry-After": str(max(1, -(-result.reset_after_ms // 1000)))},
         )
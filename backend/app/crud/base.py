@@ -1,13 +1,17 @@
 """
 CRUD操作の基本クラス。すべてのモデル用CRUDクラスはこれを継承する。
+
+変更系のメソッドはflushまでを行い、コミットしない。コミットは呼び出し側が
+unit_of_work（app.db.unit_of_work）でまとめて行う。
 """
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+from typing import Any, Dict, Generic, Iterable, List, Optional, Sequence, Type, TypeVar, Union
 
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import update, delete
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy import insert, update, delete
 
 from app.db.base import Base
 
@@ -16,6 +20,17 @@ CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
 
+def _upsert_insert(dialect: str):
+    """ON CONFLICTに対応したINSERTを返す（PostgreSQL / SQLite）"""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise NotImplementedError(f"{dialect}ではupsertを使用できません")
+    return dialect_insert
+
+
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     """
     CRUD操作の基本クラス。
@@ -80,8 +95,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         obj_in_data = jsonable_encoder(obj_in)
         db_obj = self.model(**obj_in_data)  # type: ignore
         db.add(db_obj)
-        await db.commit()
-        await db.refresh(db_obj)
+        await db.flush()
         return db_obj
 
     async def update(
@@ -113,8 +127,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
                 setattr(db_obj, field, update_data[field])
                 
         db.add(db_obj)
-        await db.commit()
-        await db.refresh(db_obj)
+        await db.flush()
         return db_obj
 
     async def delete(self, db: AsyncSession, *, id: int) -> Optional[ModelType]:
@@ -132,5 +145,163 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         obj = result.scalars().first()
         if obj:
             await db.delete(obj)
-            await db.commit()
+            await db.flush()
         return obj
+
+    @staticmethod
+    def _values(obj_in: Union[BaseModel, Dict[str, Any]], exclude_unset: bool = False) -> Dict[str, Any]:
+        """Pydanticモデルまたは辞書を列名と値の辞書に変換"""
+        if isinstance(obj_in, dict):
+            return dict(obj_in)
+        return obj_in.dict(exclude_unset=exclude_unset)
+
+    async def create_many(
+        self,
+        db: AsyncSession,
+        *,
+        objs_in: Sequence[Union[CreateSchemaType, Dict[str, Any]]]
+    ) -> List[ModelType]:
+        """
+        複数オブジェクトの一括作成
+        
+        INSERT ... RETURNINGで作成した行を受け取るため、行ごとのrefreshは行わない。
+        
+        Args:
+            db: データベースセッション
+            objs_in: 作成するオブジェクトのデータ
+            
+        Returns:
+            作成されたオブジェクトのリスト（objs_inと同じ順）
+        """
+        rows = [self._values(obj_in) for obj_in in objs_in]
+        if not rows:
+            return []
+        stmt = insert(self.model).returning(self.model, sort_by_parameter_order=True)
+        result = await db.scalars(stmt, rows)
+        return list(result.all())
+
+    async def update_many(
+        self,
+        db: AsyncSession,
+        *,
+        filters: Iterable[ColumnElement[bool]],
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+    ) -> List[ModelType]:
+        """
+        条件に一致するオブジェクトの一括更新
+        
+        UPDATE ... WHERE ... RETURNINGの1文で更新し、更新後の行を受け取る。
+        セッションに読み込み済みのオブジェクトにも更新後の値が反映される。
+        
+        Args:
+            db: データベースセッション
+            filters: 更新対象の条件（例: [Task.status == TaskStatus.PENDING]）
+            obj_in: 更新するデータ（Pydanticモデルまたは辞書）
+            
+        Returns:
+            更新されたオブジェクトのリスト
+        """
+        conditions = list(filters)
+        if not conditions:
+            # 条件の指定漏れで全件を更新しないようにする
+            raise ValueError("update_manyには条件を指定してください")
+        update_data = self._values(obj_in, exclude_unset=True)
+        if not update_data:
+            return []
+        stmt = (
+            update(self.model)
+            .where(*conditions)
+            .values(**update_data)
+            .returning(self.model)
+            .execution_options(synchronize_session="fetch")
+        )
+        result = await db.scalars(stmt)
+        return list(result.all())
+
+    async def delete_many(
+        self,
+        db: AsyncSession,
+        *,
+        filters: Iterable[ColumnElement[bool]]
+    ) -> List[Any]:
+        """
+        条件に一致するオブジェクトの一括削除
+        
+        DELETE ... WHERE ... RETURNING idの1文で削除する。
+        
+        Args:
+            db: データベースセッション
+            filters: 削除対象の条件（例: [QRCode.expire_at < now]）
+            
+        Returns:
+            削除されたオブジェクトのIDのリスト
+        """
+        conditions = list(filters)
+        if not conditions:
+            # 条件の指定漏れで全件を削除しないようにする
+            raise ValueError("delete_manyには条件を指定してください")
+        stmt = (
+            delete(self.model)
+            .where(*conditions)
+            .returning(self.model.id)
+            .execution_options(synchronize_session="fetch")
+        )
+        result = await db.scalars(stmt)
+        return list(result.all())
+
+    async def upsert(
+        self,
+        db: AsyncSession,
+        *,
+        objs_in: Sequence[Union[CreateSchemaType, Dict[str, Any]]],
+        index_elements: Sequence[str],
+        update_fields: Optional[Sequence[str]] = None
+    ) -> List[Optional[ModelType]]:
+        """
+        複数オブジェクトの一括作成または更新（INSERT ... ON CONFLICT DO UPDATE ... RETURNING）
+        
+        objs_inの中でindex_elementsの値が重複する場合は、後に指定したものを使う
+        （同じ行を1つの文で2回更新するとPostgreSQLではエラーになるため）。
+        
+        Args:
+            db: データベースセッション
+            objs_in: 作成または更新するオブジェクトのデータ
+            index_elements: 重複を判定する一意制約の列名（例: ["name"]）
+            update_fields: 重複時に更新する列名（省略時はindex_elements以外の指定された列すべて）
+            
+        Returns:
+            objs_inと同じ長さ・同じ順のリスト（重複した要素には同じオブジェクト）。
+            更新する列がない場合はON CONFLICT DO NOTHINGになり、既存の行だった要素はNone
+        """
+        rows_by_key: Dict[tuple, Dict[str, Any]] = {}
+        keys = []
+        for obj_in in objs_in:
+            row = self._values(obj_in)
+            key = tuple(row.get(name) for name in index_elements)
+            # 後に指定したものを優先する（挿入順は最初に現れた位置のまま）
+            rows_by_key[key] = row
+            keys.append(key)
+        if not rows_by_key:
+            return []
+        rows = list(rows_by_key.values())
+        if update_fields is None:
+            update_fields = sorted({key for row in rows for key in row} - set(index_elements))
+
+        dialect_insert = _upsert_insert(db.get_bind().dialect.name)
+        stmt = dialect_insert(self.model)
+        if update_fields:
+            set_ = {name: stmt.excluded[name] for name in update_fields}
+            # ON CONFLICT DO UPDATEではonupdateが適用されないため、SQL式のもの（updated_atなど）を補う
+            for column in self.model.__table__.columns:
+                onupdate = column.onupdate
+                if onupdate is not None and onupdate.is_clause_element and column.name not in set_:
+                    set_[column.name] = onupdate.arg
+            stmt = stmt.on_conflict_do_update(index_elements=list(index_elements), set_=set_)
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(index_elements))
+        stmt = stmt.returning(self.model).execution_options(populate_existing=True)
+
+        # DO NOTHINGでは返らない行があるため、返った行は一意制約の値で入力と対応付ける
+        result = await db.scalars(stmt, rows)
+        by_key = {tuple(getattr(obj, name) for name in index_elements): obj for obj in result.all()}
+        return [by_key.get(key) for key in keys]
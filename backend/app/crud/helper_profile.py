@@ -46,8 +46,7 @@ class CRUDHelperProfile(CRUDBase[HelperProfile, HelperProfileCreate, HelperProfi
         db_obj = result.scalars().first()
         if db_obj:
             db_obj.availability = availability
-            await db.commit()
-            await db.refresh(db_obj)
+            await db.flush()
         return db_obj
 
     async def update_specialties(
@@ -68,8 +67,7 @@ class CRUDHelperProfile(CRUDBase[HelperProfile, HelperProfileCreate, HelperProfi
         db_obj = result.scalars().first()
         if db_obj:
             db_obj.specialties = specialties
-            await db.commit()
-            await db.refresh(db_obj)
+            await db.flush()
         return db_obj
 
 helper_profile = CRUDHelperProfile(HelperProfile)
@@ -112,8 +112,7 @@ class CRUDQRCode(CRUDBase[QRCode, QRCodeCreate, QRCodeUpdate]):
         db_obj = result.scalars().first()
         if db_obj:
             db_obj.access_count += 1
-            await db.commit()
-            await db.refresh(db_obj)
+            await db.flush()
         return db_obj
 
 qrcode = CRUDQRCode(QRCode)
@@ -114,8 +114,7 @@ class CRUDRecipeRequest(CRUDBase[RecipeRequest, RecipeRequestCreate, RecipeReque
         db_obj = result.scalars().first()
         if db_obj:
             db_obj.status = new_status
-            await db.commit()
-            await db.refresh(db_obj)
+            await db.flush()
         return db_obj
 
 recipe_request = CRUDRecipeRequest(RecipeRequest)
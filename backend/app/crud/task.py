@@ -119,8 +119,7 @@ class CRUDTask(CRUDBase[Task, TaskCreate, TaskUpdate]):
         db_obj = result.scalars().first()
         if db_obj:
             db_obj.status = new_status
-            await db.commit()
-            await db.refresh(db_obj)
+            await db.flush()
         return db_obj
 
     async def update_priority(
@@ -141,8 +140,7 @@ class CRUDTask(CRUDBase[Task, TaskCreate, TaskUpdate]):
         db_obj = result.scalars().first()
         if db_obj:
             db_obj.priority = new_priority
-            await db.commit()
-            await db.refresh(db_obj)
+            await db.flush()
         return db_obj
 
 task = CRUDTask(Task)
@@ -98,8 +98,7 @@ class CRUDUserHelperAssignment(CRUDBase[UserHelperAssignment, UserHelperAssignme
         assignment = await self.get_by_user_and_helper(db, user_id=user_id, helper_id=helper_id)
         if assignment:
             assignment.status = new_status
-            await db.commit()
-            await db.refresh(assignment)
+            await db.flush()
         return assignment
 
 user_helper_assignment = CRUDUserHelperAssignment(UserHelperAssignment)
@@ -63,8 +63,7 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
             is_active=obj_in.is_active if hasattr(obj_in, "is_active") else True
         )
         db.add(db_obj)
-        await db.commit()
-        await db.refresh(db_obj)
+        await db.flush()
         return db_obj
 
     async def update_password(
@@ -85,8 +84,7 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         db_obj = result.scalars().first()
         if db_obj:
             db_obj.password_hash = new_password_hash
-            await db.commit()
-            await db.refresh(db_obj)
+            await db.flush()
         return db_obj
 
     async def activate(self, db: AsyncSession, *, user_id: int) -> Optional[User]:
@@ -104,8 +102,7 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         db_obj = result.scalars().first()
         if db_obj:
             db_obj.is_active = True
-            await db.commit()
-            await db.refresh(db_obj)
+            await db.flush()
         return db_obj
 
     async def deactivate(self, db: AsyncSession, *, user_id: int) -> Optional[User]:
@@ -123,8 +120,7 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         db_obj = result.scalars().first()
         if db_obj:
             db_obj.is_active = False
-            await db.commit()
-            await db.refresh(db_obj)
+            await db.flush()
         return db_obj
 
     async def get_helpers(
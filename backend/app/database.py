@@ -1,14 +1,102 @@
 """
 データベース接続設定（PostgreSQL/SQLAlchemy/asyncpg）。
+
+エンジンは設定（database_*）から作成する。
+- engine: 書き込み用（プライマリ）
+- read_engine: 読み取り用（database_read_urlが空ならengineと同じ）
+どちらも計測付きのプール（app.db.pool）を使い、/metricsで取り出し回数と待ち時間を公開する。
+
+読み取り専用のエンドポイントはget_dbの代わりにget_read_dbを使う（振り分けはapp.db.routing）。
 """
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from typing import Any, Dict, Optional
+
+from fastapi import Depends, Request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
-DATABASE_URL = "postgresql+asyncpg://postgres:postgres@db:5432/markdown_cms"
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+
+from app.config import settings
+from app.core.auth import bearer_subject
+from app.db.pool import InstrumentedAsyncQueuePool
+from app.db.routing import recent_writes
+
+
+def build_engine(
+    url: str,
+    pool_size: Optional[int] = None,
+    max_overflow: Optional[int] = None,
+) -> AsyncEngine:
+    """
+    設定に従ってエンジンを作成
+    Args:
+        url: 接続URL
+        pool_size: プールサイズ（省略時はdatabase_pool_size）
+        max_overflow: プールサイズを超えて作成できる接続数（省略時はdatabase_max_overflow）
+    Returns:
+        AsyncEngine: エンジン
+    """
+    kwargs: Dict[str, Any] = {"echo": settings.database_echo, "pool_pre_ping": True}
+    if make_url(url).get_backend_name() != "sqlite":
+        kwargs.update(
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_size=settings.database_pool_size if pool_size is None else pool_size,
+            max_overflow=settings.database_max_overflow if max_overflow is None else max_overflow,
+            pool_recycle=settings.database_pool_recycle,
+            pool_timeout=settings.database_pool_timeout,
+        )
+    if make_url(url).get_driver_name() == "asyncpg":
+        # 接続ごとのプリペアドステートメントのキャッシュ（PgBouncerのトランザクションモードでは0にする）
+        kwargs["connect_args"] = {"prepared_statement_cache_size": settings.database_statement_cache_size}
+    return create_async_engine(url, **kwargs)
+
+
+engine = build_engine(settings.database_url)
+read_engine = build_engine(settings.database_read_url) if settings.database_read_url else engine
+
 AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False, autoflush=False, autocommit=False)
+AsyncReadSessionLocal = sessionmaker(bind=read_engine, class_=AsyncSession, expire_on_commit=False, autoflush=False, autocommit=False)
+
+
 async def get_db():
+    """
+    リクエスト単位のセッション
+    同じリクエスト内の依存関係（認証など）とはFastAPIの依存関係キャッシュで同じセッションを共有する。
+    プールの接続は最初にクエリを実行したときに取り出すため、DBを使わずに済んだ
+    リクエスト（キャッシュヒットなど）は接続を取り出さない。
+    """
     db = AsyncSessionLocal()
     try:
         yield db
     finally:
         await db.close()
+
+
+async def get_read_db(request: Request, primary: AsyncSession = Depends(get_db)):
+    """
+    読み取り専用エンドポイント用のセッション
+    レプリカのセッションを返す。ただし直近に変更を行ったユーザーには、
+    自分の変更が見えるようプライマリのセッション（get_dbと共有）を返す（read-your-writes）。
+    レプリカを設定していない場合は常にプライマリ。
+    Args:
+        request: リクエスト（Authorizationヘッダーからユーザーを特定する）
+        primary: リクエスト単位のプライマリのセッション
+    """
+    if read_engine is engine:
+        yield primary
+        return
+    subject = bearer_subject(request.headers.get("authorization"))
+    if subject is not None and await recent_writes.is_recent(subject):
+        yield primary
+        return
+    db = AsyncReadSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+async def dispose_engines() -> None:
+    """全エンジンの接続を閉じる（アプリケーション終了時）"""
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
@@ -27,6 +27,10 @@ class BaseModel:
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
+    # flush時にDB側で設定される値（id, created_at, updated_at）をRETURNINGで受け取る。
+    # CRUDはコミットせずflushだけ行うため、refreshせずにレスポンスへ使える
+    __mapper_args__ = {"eager_defaults": True}
+
     def to_dict(self) -> Dict[str, Any]:
         """
         モデルを辞書に変換
@@ -26,4 +26,5 @@ from .log import (
     AuditLog,
     AuditAction,
     PerformanceLog,
+    PerformanceRollup,
 )
@@ -1,7 +1,11 @@
 """
 ログ関連モデル定義
+
+PostgreSQLではログテーブルはtimestampによるレンジパーティションで、
+主キーは(id, timestamp)になっている（alembic/versions/3c9e1f7a2b4d参照）。
+パーティションの作成と保持期間切れの削除はapp.logs.partitionsが行う。
 """
-from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, JSON, ForeignKey, Enum, Index
+from sqlalchemy import Column, Integer, BigInteger, String, Text, TIMESTAMP, JSON, ForeignKey, Enum, Index, UniqueConstraint, func
 from app.db.base import Base, BaseModel
 import enum
 from sqlalchemy.orm import relationship
@@ -17,11 +21,11 @@ class ApplicationLog(Base, BaseModel):
     """アプリケーションログモデル"""
     __tablename__ = "application_logs"
     
-    timestamp = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
-    level = Column(Enum(LogLevel), nullable=False, index=True)
-    source = Column(String(50), nullable=False, index=True)
+    timestamp = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    level = Column(Enum(LogLevel), nullable=False)
+    source = Column(String(50), nullable=False)
     message = Column(Text, nullable=False)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
     endpoint = Column(String(200))
     ip_address = Column(String(50))
     user_agent = Column(String(255))
@@ -31,6 +35,15 @@ class ApplicationLog(Base, BaseModel):
     # リレーションシップ
     user = relationship("User", backref="application_logs")
     
+    # 検索条件 + 並び順(timestamp, id)の複合インデックス（キーセットページネーション用）
+    __table_args__ = (
+        Index('ix_application_logs_timestamp_id', 'timestamp', 'id'),
+        Index('ix_application_logs_level_timestamp_id', 'level', 'timestamp', 'id'),
+        Index('ix_application_logs_source_timestamp_id', 'source', 'timestamp', 'id'),
+        Index('ix_application_logs_user_id_timestamp_id', 'user_id', 'timestamp', 'id'),
+        Index('ix_application_logs_endpoint_timestamp_id', 'endpoint', 'timestamp', 'id'),
+    )
+    
     def __repr__(self) -> str:
         """文字列表現"""
         return f"<ApplicationLog(id={self.id}, level={self.level}, source={self.source})>"
@@ -48,10 +61,10 @@ class AuditLog(Base, BaseModel):
     """監査ログモデル"""
     __tablename__ = "audit_logs"
     
-    timestamp = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=False, index=True)
-    action = Column(Enum(AuditAction), nullable=False, index=True)
-    resource_type = Column(String(50), nullable=False, index=True)
+    timestamp = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=False)
+    action = Column(Enum(AuditAction), nullable=False)
+    resource_type = Column(String(50), nullable=False)
     resource_id = Column(Integer)
     previous_state = Column(JSON)
     new_state = Column(JSON)
@@ -61,9 +74,15 @@ class AuditLog(Base, BaseModel):
     
     # リレーションシップ
     user = relationship("User", backref="audit_logs")
-      # インデックス用のテーブル引数
+    # 検索条件 + 並び順(timestamp, id)の複合インデックス（キーセットページネーション用）
     __table_args__ = (
-        Index('ix_audit_logs_resource_type_resource_id', 'resource_type', 'resource_id', postgresql_using='btree'),
+        Index('ix_audit_logs_timestamp_id', 'timestamp', 'id'),
+        Index('ix_audit_logs_user_id_timestamp_id', 'user_id', 'timestamp', 'id'),
+        Index('ix_audit_logs_action_timestamp_id', 'action', 'timestamp', 'id'),
+        Index(
+            'ix_audit_logs_resource_timestamp_id', 'resource_type', 'resource_id', 'timestamp', 'id',
+            postgresql_using='btree',
+        ),
     )
     
     def __repr__(self) -> str:
@@ -74,20 +93,62 @@ class PerformanceLog(Base, BaseModel):
     """パフォーマンスログモデル"""
     __tablename__ = "performance_logs"
     
-    timestamp = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
-    endpoint = Column(String(200), nullable=False, index=True)
+    timestamp = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    endpoint = Column(String(200), nullable=False)  # ルートのテンプレート（例: /api/v1/tasks/{task_id}）
     response_time = Column(Integer, nullable=False, index=True)  # ミリ秒
     status_code = Column(Integer)
     request_method = Column(String(10))
     request_size = Column(Integer)
     response_size = Column(Integer)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
     ip_address = Column(String(50))
+    user_agent = Column(String(255))
     additional_metrics = Column(JSON)
     
     # リレーションシップ
     user = relationship("User", backref="performance_logs")
     
+    # 検索条件 + 並び順(timestamp, id)の複合インデックス（キーセットページネーション用）
+    __table_args__ = (
+        Index('ix_performance_logs_timestamp_id', 'timestamp', 'id'),
+        Index('ix_performance_logs_endpoint_timestamp_id', 'endpoint', 'timestamp', 'id'),
+        Index('ix_performance_logs_status_code_timestamp_id', 'status_code', 'timestamp', 'id'),
+        Index('ix_performance_logs_user_id_timestamp_id', 'user_id', 'timestamp', 'id'),
+    )
+    
     def __repr__(self) -> str:
         """文字列表現"""
         return f"<PerformanceLog(id={self.id}, endpoint={self.endpoint}, response_time={self.response_time}ms)>"
+
+class PerformanceRollup(Base, BaseModel):
+    """
+    パフォーマンスログの事前集計モデル
+
+    分・時間単位のバケットごとに(endpoint, request_method, status_class)で集計し、
+    件数・合計・最小・最大とレイテンシヒストグラム（app.logs.histogram）を保持する。
+    AsyncLogHandlerがパフォーマンスログの書き込みと同じトランザクションで加算する。
+    """
+    __tablename__ = "performance_rollups"
+
+    granularity = Column(String(10), nullable=False)  # minute / hour
+    bucket_start = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
+    endpoint = Column(String(200), nullable=False)
+    request_method = Column(String(10), nullable=False)
+    status_class = Column(String(3), nullable=False)  # 2xx, 4xx, 5xx など
+    request_count = Column(Integer, nullable=False, default=0)
+    total_time_ms = Column(BigInteger, nullable=False, default=0)
+    min_time_ms = Column(Integer)
+    max_time_ms = Column(Integer)
+    histogram = Column(JSON)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "granularity", "bucket_start", "endpoint", "request_method", "status_class",
+            name="uq_performance_rollups_key",
+        ),
+        Index("ix_performance_rollups_granularity_bucket_start", "granularity", "bucket_start"),
+    )
+
+    def __repr__(self) -> str:
+        """文字列表現"""
+        return f"<PerformanceRollup(granularity={self.granularity}, bucket_start={self.bucket_start}, endpoint={self.endpoint}, count={self.request_count})>"
@@ -0,0 +1,52 @@
+"""
+計測付きのコネクションプール
+
+プールから接続を取り出すまでの時間（空きを待つ時間と、新規接続の確立時間を含む）と
+取り出し回数・タイムアウト回数を記録する。/metrics（app.logs.metrics）から参照する。
+"""
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.logs.histogram import BucketHistogram
+
+
+class PoolStats:
+    """プールの取り出し統計"""
+
+    __slots__ = ("checkouts", "timeouts", "wait_histogram")
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_histogram = BucketHistogram()
+
+    def record(self, wait_ms: float) -> None:
+        """取り出し1回分の待ち時間を記録"""
+        self.checkouts += 1
+        self.wait_histogram.record(wait_ms)
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """取り出しの待ち時間を計測するAsyncAdaptedQueuePool"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        self.stats.record((time.perf_counter() - started) * 1000)
+        return connection
+
+    def recreate(self):
+        # dispose()などで作り直しても統計は引き継ぐ
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
@@ -0,0 +1,138 @@
+"""
+読み取りのレプリカへの振り分け
+
+読み取り専用のエンドポイントはget_read_db（app.database）でレプリカのセッションを使う。
+ただしレプリカはプライマリから遅れて反映されるため、変更系のリクエスト
+（POST / PUT / PATCH / DELETE）を送ったユーザーは、その後database_read_your_writes_seconds秒間
+読み取りもプライマリに送る（read-your-writes）。
+
+変更の記録はRedis（ワーカー間で共有）とプロセス内の辞書の両方に残す。
+Redisに問い合わせられない場合は安全側に倒してプライマリを使う。
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import redis.asyncio as redis
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.core.auth import bearer_subject
+from app.core.cache import redis_client
+
+logger = logging.getLogger(__name__)
+
+# 変更を記録するRedisキーのプレフィックス
+RECENT_WRITE_KEY_PREFIX = "db:recent_write"
+
+# 読み取りのみのHTTPメソッド（これ以外は変更系とみなす）
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class RecentWrites:
+    """
+    直近に変更を行ったユーザーの記録
+
+    Args:
+        redis_client: Redisクライアント（Noneならプロセス内の記録のみ）
+        ttl_seconds: 変更後にプライマリを読む秒数（レプリカの遅延より長くする）
+        max_entries: プロセス内に記録するユーザー数の上限
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis], ttl_seconds: float, max_entries: int = 10000):
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # ユーザー -> 記録の期限（monotonic）
+        self._local: "OrderedDict[str, float]" = OrderedDict()
+
+    @staticmethod
+    def _key(subject: str) -> str:
+        return f"{RECENT_WRITE_KEY_PREFIX}:{subject}"
+
+    async def mark(self, subject: str) -> None:
+        """
+        ユーザーの変更を記録
+        Args:
+            subject: ユーザー（JWTのsub）
+        """
+        if self.ttl_seconds <= 0:
+            return
+        self._local[subject] = time.monotonic() + self.ttl_seconds
+        self._local.move_to_end(subject)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(self._key(subject), 1, px=int(self.ttl_seconds * 1000))
+        except redis.RedisError as e:
+            logger.warning(f"変更の記録に失敗しました: {e}")
+
+    async def is_recent(self, subject: str) -> bool:
+        """
+        ユーザーが直近に変更を行ったか
+        Args:
+            subject: ユーザー（JWTのsub）
+        Returns:
+            bool: 記録の期限内ならTrue（Redisに問い合わせられない場合もTrue）
+        """
+        if self.ttl_seconds <= 0:
+            return False
+        expires_at = self._local.get(subject)
+        if expires_at is not None:
+            if time.monotonic() < expires_at:
+                return True
+            del self._local[subject]
+        if self.redis is None:
+            return False
+        try:
+            return bool(await self.redis.exists(self._key(subject)))
+        except redis.RedisError as e:
+            logger.warning(f"変更の記録を確認できないためプライマリを使用します: {e}")
+            return True
+
+
+class ReadYourWritesMiddleware:
+    """
+    変更系のリクエストを送ったユーザーをRecentWritesに記録するミドルウェア
+
+    レスポンスを返し始める前に記録するため、クライアントが結果を受け取ってから
+    送る次の読み取りは必ずプライマリに送られる。
+    失敗したリクエストでも途中までコミットされている可能性があるため、結果にかかわらず記録する。
+    """
+
+    def __init__(self, app: ASGIApp, recent_writes: RecentWrites):
+        self.app = app
+        self.recent_writes = recent_writes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        subject = bearer_subject(Headers(scope=scope).get("authorization"))
+        if subject is None:
+            await self.app(scope, receive, send)
+            return
+
+        marked = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal marked
+            if message["type"] == "http.response.start" and not marked:
+                marked = True
+                await self.recent_writes.mark(subject)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # 例外でレスポンスを返す前に抜けた場合（500は外側のハンドラーが返す）
+            if not marked:
+                await self.recent_writes.mark(subject)
+
+
+recent_writes = RecentWrites(redis_client, settings.database_read_your_writes_seconds)
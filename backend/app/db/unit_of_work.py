@@ -0,0 +1,43 @@
+"""
+トランザクション単位の作業（Unit of Work）
+
+CRUDの変更系メソッドはflushだけを行い、コミットはしない。エンドポイントは
+一連のCRUD呼び出しをunit_of_workで囲み、ブロックを抜けたときに1回だけコミットする。
+    async with unit_of_work(db):
+        qrcode = await crud_qrcode.create(db, obj_in=...)
+        await crud_qrcode.increment_access_count(db, qrcode_id=qrcode.id)
+途中で例外が発生した場合はロールバックするため、複数の変更がまとめて反映されるか、
+まったく反映されないかのどちらかになる。
+"""
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# 実行中のunit_of_workをセッションのinfoに記録するキー
+_ACTIVE_KEY = "unit_of_work"
+
+
+@asynccontextmanager
+async def unit_of_work(db: AsyncSession) -> AsyncIterator[AsyncSession]:
+    """
+    ブロック内の変更を1つのトランザクションとしてコミットする
+    ネストした場合は内側のブロックは外側のトランザクションに含め、最も外側でのみコミットする。
+    Args:
+        db: データベースセッション
+    Returns:
+        AsyncIterator[AsyncSession]: 同じセッション
+    """
+    if db.info.get(_ACTIVE_KEY):
+        yield db
+        return
+
+    db.info[_ACTIVE_KEY] = True
+    try:
+        yield db
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    finally:
+        db.info.pop(_ACTIVE_KEY, None)
@@ -1,11 +1,14 @@
 """
 アプリケーションのグローバル例外ハンドラー
+
+エラーログは非同期ログハンドラーのキューに渡す。リクエストのDBセッションは
+例外の原因になった（ロールバックが必要な）状態のこともあるため使わない。
 """
 from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from sqlalchemy.exc import SQLAlchemyError
-from app.logs.app_logger import ApplicationLogger
+from app.logs.app_logger import request_id_var
 
 class NotFoundException(Exception):
     """リソースが見つからない例外"""
@@ -19,6 +22,27 @@ class BadRequestException(Exception):
     """不正リクエストの例外"""
     pass
 
+async def _log_error(request: Request, level: str, source: str, message: str, additional_data: dict) -> None:
+    """
+    例外をアプリケーションログとして記録
+    endpointにはミドルウェアと同じく一致したルートのテンプレートを記録し、実パスは追加情報に残す。
+    （長さは列に合わせてキューに積む前に切り詰められる）
+    """
+    from app.logs.async_log_handler import async_log_handler
+    from app.logs.metrics import UNMATCHED_ROUTE
+    from app.logs.middleware import route_template
+
+    await async_log_handler.add_application_log({
+        "level": level,
+        "source": source,
+        "message": message,
+        "endpoint": route_template(request.scope) or UNMATCHED_ROUTE,
+        "ip_address": request.client.host if request.client else None,
+        "user_agent": request.headers.get("user-agent"),
+        "request_id": request_id_var.get(),
+        "additional_data": {**additional_data, "path": request.url.path},
+    })
+
 def setup_exception_handlers(app: FastAPI) -> None:
     """アプリケーションに例外ハンドラを登録"""
     
@@ -26,16 +50,12 @@ def setup_exception_handlers(app: FastAPI) -> None:
     async def validation_exception_handler(request: Request, exc: RequestValidationError):
         """リクエスト検証エラーのハンドラ"""
         # エラーログの記録
-        db = request.state.db
-        logger = ApplicationLogger(db)
-        await logger.log(
+        await _log_error(
+            request,
             level="WARNING",
             source="API",
             message="リクエスト検証エラー",
-            endpoint=request.url.path,
-            ip_address=request.client.host,
-            user_agent=request.headers.get("user-agent"),
-            additional_data={"errors": exc.errors()}
+            additional_data={"errors": exc.errors()},
         )
         
         return JSONResponse(
@@ -50,16 +70,12 @@ def setup_exception_handlers(app: FastAPI) -> None:
     async def sqlalchemy_exception_handler(request: Request, exc: SQLAlchemyError):
         """データベースエラーのハンドラ"""
         # エラーログの記録
-        db = request.state.db
-        logger = ApplicationLogger(db)
-        await logger.log(
+        await _log_error(
+            request,
             level="ERROR",
             source="DATABASE",
             message=f"データベースエラー: {str(exc)}",
-            endpoint=request.url.path,
-            ip_address=request.client.host,
-            user_agent=request.headers.get("user-agent"),
-            additional_data={"error_details": str(exc)}
+            additional_data={"error_details": str(exc)},
         )
         
         return JSONResponse(
@@ -97,16 +113,12 @@ def setup_exception_handlers(app: FastAPI) -> None:
     async def general_exception_handler(request: Request, exc: Exception):
         """一般的な例外のハンドラ"""
         # エラーログの記録
-        db = request.state.db
-        logger = ApplicationLogger(db)
-        await logger.log(
+        await _log_error(
+            request,
             level="ERROR",
             source="SERVER",
             message=f"予期しないエラー: {str(exc)}",
-            endpoint=request.url.path,
-            ip_address=request.client.host,
-            user_agent=request.headers.get("user-agent"),
-            additional_data={"error_details": str(exc), "error_type": type(exc).__name__}
+            additional_data={"error_details": str(exc), "error_type": type(exc).__name__},
         )
         
         return JSONResponse(
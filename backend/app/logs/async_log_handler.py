@@ -2,154 +2,419 @@
 非同期でログを処理するためのハンドラー
 """
 import asyncio
-from typing import List, Dict, Any
+import logging
+import time
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy import Enum, String
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from app.database import build_engine
 from app.db.models.logs import ApplicationLog, AuditLog, PerformanceLog
+from app.logs.bulk_insert import write_rows
+from app.logs.rollups import apply_rollups, build_rollups
+from app.logs.spill_buffer import SpillBuffer
 from app.config import settings
 
+logger = logging.getLogger("app")
+
+# キュー満杯時の動作
+OVERFLOW_POLICIES = ("drop_oldest", "drop_by_level", "block")
+
+# ログレベルの優先度（drop_by_levelで使用）
+LEVEL_PRIORITY = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
+
+# ログ種別とモデルの対応（ディスク退避からの再生で使用）
+LOG_MODELS = {"application": ApplicationLog, "audit": AuditLog, "performance": PerformanceLog}
+
+
+
+def _string_lengths(model) -> Dict[str, int]:
+    """長さ制限のある文字列列の名前と長さ"""
+    return {
+        column.name: column.type.length
+        for column in model.__table__.columns
+        if isinstance(column.type, String) and not isinstance(column.type, Enum) and column.type.length
+    }
+
+
+# ログ種別ごとの文字列列の長さ（クライアント由来の値を列の長さに切り詰めるために使用）
+STRING_LENGTHS = {kind: _string_lengths(model) for kind, model in LOG_MODELS.items()}
+
+
+def truncate_strings(kind: str, log_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    文字列の値を列の長さに切り詰める
+    User-Agentなどクライアントが決める値が列の長さを超えると、その行は書き込めないため
+    キューに積む前に切り詰めておく。
+    Args:
+        kind: ログ種別（application / audit / performance）
+        log_data: ログデータ
+    Returns:
+        Dict[str, Any]: 切り詰めたログデータ（変更がなければ同じ辞書）
+    """
+    lengths = STRING_LENGTHS[kind]
+    long_values = {
+        name: value[:lengths[name]]
+        for name, value in log_data.items()
+        if name in lengths and isinstance(value, str) and len(value) > lengths[name]
+    }
+    return {**log_data, **long_values} if long_values else log_data
+
+
+# 再試行すれば成功しうるエラーのSQLSTATEクラス
+# （08: 接続、40: トランザクションのロールバック、53: リソース不足、57: 管理者の介入、58: システムエラー）
+TRANSIENT_SQLSTATE_CLASSES = ("08", "40", "53", "57", "58")
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    一時的な（DBの復旧後に再試行すれば成功しうる）エラーか
+    接続・タイムアウト・リソース不足などは一時的、値の長さ超過や制約違反など
+    行の内容が原因のエラーは恒久的とみなす。
+    Args:
+        error: 書き込み時に発生した例外
+    Returns:
+        bool: 一時的ならTrue
+    """
+    orig = getattr(error, "orig", None)
+    sqlstate = getattr(error, "sqlstate", None) or getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+    if sqlstate:
+        return str(sqlstate)[:2] in TRANSIENT_SQLSTATE_CLASSES
+    if isinstance(error, sa_exc.DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (
+        sa_exc.OperationalError,
+        sa_exc.InterfaceError,
+        sa_exc.DisconnectionError,
+        sa_exc.TimeoutError,
+        asyncio.TimeoutError,
+        ConnectionError,
+        OSError,
+    ))
+
 class AsyncLogHandler:
     """
     非同期ログハンドラー
     バックグラウンドでログをキューから取得し、バッチ処理で保存する
+
+    キューは上限付きで、ワーカーはポーリングせずに次のいずれかで書き込む。
+    - サイズ: 未処理のログがbatch_size件に達した
+    - 期限: 最初のログが積まれてからflush_interval_ms経過した
+    キューが満杯のときはoverflow_policyに従う。
+    - drop_oldest: 最も古いログを捨てて追加する
+    - drop_by_level: keep_level未満のログ（パフォーマンスログを含む）は新しい方を捨て、
+      keep_level以上のログと監査ログは最も古いログを捨てて追加する
+    - block: 空きができるまで呼び出し側を待たせる
+    書き込みはORMを通さずにCOPYまたは複数行INSERTで行う（write_method、bulk_insert参照）。
+    1回の書き込みでは3種類のログを1トランザクションにまとめ、パフォーマンスログの
+    ロールアップ（rollups参照）も同じトランザクションで加算する。
+    engineを渡すとそのエンジンを共有し、渡さない場合はstart()でlog_db_pool_sizeの
+    専用プールを作成してstop()で破棄する。
+    DBに書き込めない場合（接続断などの一時的なエラー）は、ワーカーがログをspill_dirの
+    セグメントファイルへ退避し、spill_retry_interval_msごとに古い順に再生を試みる（起動時にも再生する）。
+    退避が残っている間は、順序を保つため新しいログも退避の後ろに追記する。
+    値の長さ超過など行の内容が原因のエラー（恒久的なエラー）では退避せず、バッチを1行ずつ
+    書き直して書き込めない行だけを破棄する（rejectedに計上）。再生時も同様に扱うため、
+    再試行しても成功しないセグメントで再生が止まることはない。
     """
-    def __init__(self):
-        self.app_log_queue = asyncio.Queue()
-        self.audit_log_queue = asyncio.Queue()
-        self.perf_log_queue = asyncio.Queue()
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval_ms: Optional[int] = None,
+        overflow_policy: Optional[str] = None,
+        keep_level: Optional[str] = None,
+        write_method: Optional[str] = None,
+        engine: Optional[AsyncEngine] = None,
+        spill_dir: Optional[str] = None,
+    ):
+        self.max_size = max_size or settings.log_queue_max_size
+        self.batch_size = batch_size or settings.log_batch_size
+        self.flush_interval = (flush_interval_ms or settings.log_flush_interval_ms) / 1000
+        self.overflow_policy = overflow_policy or settings.log_overflow_policy
+        if self.overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"未対応のオーバーフロー方式です: {self.overflow_policy}")
+        self.keep_priority = LEVEL_PRIORITY.get((keep_level or settings.log_overflow_keep_level).upper(), 30)
+        self.write_method = write_method or settings.log_write_method
+
+        self.app_log_queue = asyncio.Queue(maxsize=self.max_size)
+        self.audit_log_queue = asyncio.Queue(maxsize=self.max_size)
+        self.perf_log_queue = asyncio.Queue(maxsize=self.max_size)
+        # キュー名ごとの破棄件数
+        self.dropped = {"application": 0, "audit": 0, "performance": 0}
+        # 恒久的なエラーで書き込めずに破棄した件数
+        self.rejected = {"application": 0, "audit": 0, "performance": 0}
+        # ログが積まれた／バッチサイズに達したことをワーカーへ通知するイベント
+        self._has_logs = asyncio.Event()
+        self._batch_ready = asyncio.Event()
+        self.engine = engine
+        self._owns_engine = engine is None
+        self._session_factory = None
+        self.spill_dir = settings.log_spill_dir if spill_dir is None else spill_dir
+        self.spill_retry_interval = settings.log_spill_retry_interval_ms / 1000
+        self.spill: Optional[SpillBuffer] = None
+        self._next_replay_at = 0.0
         self.running = False
         self.worker_task = None
-    
+
     async def start(self):
         """ログハンドラーを起動"""
         if not self.running:
+            if self.engine is None:
+                # ログ書き込み専用の小さなプール（リクエスト処理用のプールとは分離）
+                # アプリと同じ設定（計測付きプール・再接続・ステートメントキャッシュ）で専用プールを作る
+                self.engine = build_engine(settings.database_url, pool_size=settings.log_db_pool_size, max_overflow=0)
+            self._session_factory = sessionmaker(
+                self.engine, class_=AsyncSession, expire_on_commit=False
+            )
+            if self.spill_dir and self.spill is None:
+                self.spill = SpillBuffer(
+                    self.spill_dir,
+                    segment_size=settings.log_spill_segment_size_bytes,
+                    fsync=settings.log_spill_fsync,
+                    fsync_interval_ms=settings.log_spill_fsync_interval_ms,
+                )
             self.running = True
             self.worker_task = asyncio.create_task(self._worker())
-    
+
     async def stop(self):
-        """ログハンドラーを停止"""
+        """ログハンドラーを停止（残っているログは書き込んでから終了）"""
         if self.running:
             self.running = False
+            self._has_logs.set()
+            self._batch_ready.set()
             if self.worker_task:
                 await self.worker_task
-    
+            if self.spill is not None:
+                await asyncio.to_thread(self.spill.close)
+                self.spill = None
+            if self._owns_engine and self.engine is not None:
+                await self.engine.dispose()
+                self.engine = None
+
     async def add_application_log(self, log_data: Dict[str, Any]):
         """アプリケーションログをキューに追加"""
-        await self.app_log_queue.put(log_data)
-    
+        priority = LEVEL_PRIORITY.get(str(log_data.get("level", "INFO")).upper(), 20)
+        await self._enqueue("application", self.app_log_queue, log_data, priority >= self.keep_priority)
+
     async def add_audit_log(self, log_data: Dict[str, Any]):
         """監査ログをキューに追加"""
-        await self.audit_log_queue.put(log_data)
-    
+        await self._enqueue("audit", self.audit_log_queue, log_data, True)
+
     async def add_performance_log(self, log_data: Dict[str, Any]):
         """パフォーマンスログをキューに追加"""
-        await self.perf_log_queue.put(log_data)
-    
+        await self._enqueue("performance", self.perf_log_queue, log_data, False)
+
+    def pending(self) -> int:
+        """未処理のログ件数"""
+        return self.app_log_queue.qsize() + self.audit_log_queue.qsize() + self.perf_log_queue.qsize()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """キューの滞留件数と破棄件数を返す"""
+        return {
+            "queued": {
+                "application": self.app_log_queue.qsize(),
+                "audit": self.audit_log_queue.qsize(),
+                "performance": self.perf_log_queue.qsize(),
+            },
+            "dropped": dict(self.dropped),
+            "rejected": dict(self.rejected),
+            "overflow_policy": self.overflow_policy,
+            "spilled": self.spill.spilled if self.spill else 0,
+            "replayed": self.spill.replayed if self.spill else 0,
+        }
+
+    async def _enqueue(self, name: str, queue: asyncio.Queue, log_data: Dict[str, Any], keep: bool):
+        """
+        オーバーフロー方式に従ってキューに追加
+        Args:
+            name: キュー名（破棄件数の集計用）
+            queue: 追加先のキュー
+            log_data: ログデータ
+            keep: drop_by_levelで古いログを捨ててでも残すか
+        """
+        log_data = truncate_strings(name, log_data)
+        if self.overflow_policy == "block":
+            await queue.put(log_data)
+        elif not queue.full():
+            queue.put_nowait(log_data)
+        elif self.overflow_policy == "drop_by_level" and not keep:
+            # 重要度の低いログは新しい方を捨てる
+            self.dropped[name] += 1
+            return
+        else:
+            # 最も古いログを捨てて追加する
+            queue.get_nowait()
+            queue.task_done()
+            self.dropped[name] += 1
+            queue.put_nowait(log_data)
+
+        self._has_logs.set()
+        if self.pending() >= self.batch_size:
+            self._batch_ready.set()
+
     async def _worker(self):
         """バックグラウンドでログを処理するワーカー"""
-        # 非同期セッションの作成
-        engine = create_async_engine(settings.database_url)
-        async_session = sessionmaker(
-            engine, class_=AsyncSession, expire_on_commit=False
-        )
-        
-        while self.running or not (
-            self.app_log_queue.empty() and 
-            self.audit_log_queue.empty() and 
-            self.perf_log_queue.empty()
-        ):
-            # バッチサイズ（一度に処理するログの数）
-            batch_size = 50
-            
-            # 各ログタイプのバッチを処理
-            await self._process_app_logs(batch_size, async_session)
-            await self._process_audit_logs(batch_size, async_session)
-            await self._process_perf_logs(batch_size, async_session)
-            
-            # 短い待機時間
-            await asyncio.sleep(0.1)
-    
-    async def _process_app_logs(self, batch_size: int, async_session):
-        """アプリケーションログのバッチ処理"""
-        if self.app_log_queue.empty():
-            return
-        
-        async with async_session() as session:
-            async with session.begin():
-                logs_to_process = []
-                
-                # キューからログを取得
-                for _ in range(min(batch_size, self.app_log_queue.qsize())):
+        # 前回までに退避されたログを再生
+        await self._replay_spill()
+
+        while self.running:
+            # ログが積まれるまで待機（アイドル時は起床しない。退避中は再生のために定期的に起床）
+            if self.pending() == 0:
+                if self._spill_pending():
                     try:
-                        log_data = self.app_log_queue.get_nowait()
-                        logs_to_process.append(log_data)
-                    except asyncio.QueueEmpty:
-                        break
-                
-                if logs_to_process:
-                    # ログをデータベースに一括挿入
-                    session.add_all([
-                        ApplicationLog(**log_data) for log_data in logs_to_process
-                    ])
-                    
-                    # 各ログの処理完了をマーク
-                    for _ in range(len(logs_to_process)):
-                        self.app_log_queue.task_done()
-    
-    async def _process_audit_logs(self, batch_size: int, async_session):
-        """監査ログのバッチ処理"""
-        if self.audit_log_queue.empty():
+                        await asyncio.wait_for(self._has_logs.wait(), timeout=self.spill_retry_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await self._has_logs.wait()
+                if not self.running:
+                    break
+
+            # バッチサイズに達するか期限まで待って書き込む
+            if 0 < self.pending() < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._has_logs.clear()
+            self._batch_ready.clear()
+            await self._flush()
+
+        # 停止時に残っているログを書き込む（書き込めなければ退避）
+        await self._flush()
+
+    def _spill_pending(self) -> bool:
+        """再生待ちの退避ログがあるか"""
+        return self.spill is not None and self.spill.has_pending()
+
+    async def _flush(self):
+        """全キューの未処理ログを1トランザクションで書き込む"""
+        # 退避中なら再生を試みる（間隔はspill_retry_interval_ms）
+        if self._spill_pending() and time.monotonic() >= self._next_replay_at:
+            await self._replay_spill()
+
+        batches = [
+            (model, self._drain(queue))
+            for queue, model in (
+                (self.app_log_queue, ApplicationLog),
+                (self.audit_log_queue, AuditLog),
+                (self.perf_log_queue, PerformanceLog),
+            )
+        ]
+        batches = [(model, logs) for model, logs in batches if logs]
+        if not batches:
             return
-        
-        async with async_session() as session:
-            async with session.begin():
-                logs_to_process = []
-                
-                # キューからログを取得
-                for _ in range(min(batch_size, self.audit_log_queue.qsize())):
-                    try:
-                        log_data = self.audit_log_queue.get_nowait()
-                        logs_to_process.append(log_data)
-                    except asyncio.QueueEmpty:
-                        break
-                
-                if logs_to_process:
-                    # ログをデータベースに一括挿入
-                    session.add_all([
-                        AuditLog(**log_data) for log_data in logs_to_process
-                    ])
-                    
-                    # 各ログの処理完了をマーク
-                    for _ in range(len(logs_to_process)):
-                        self.audit_log_queue.task_done()
-    
-    async def _process_perf_logs(self, batch_size: int, async_session):
-        """パフォーマンスログのバッチ処理"""
-        if self.perf_log_queue.empty():
+
+        # 再生し切れていない退避がある間は、順序を保つため後ろに追記する
+        if self._spill_pending():
+            await self._spill(batches)
             return
-        
-        async with async_session() as session:
+
+        try:
+            await self._write_batches(batches)
+        except Exception as e:
+            if not is_transient_error(e):
+                logger.warning("ログのバッチを書き込めないため1行ずつ書き込みます", exc_info=True)
+                try:
+                    await self._write_rows_individually(batches)
+                    return
+                except Exception as retry_error:
+                    if not is_transient_error(retry_error):
+                        count = sum(len(logs) for _, logs in batches)
+                        logger.exception(f"ログの書き込みに失敗しました: {count}件")
+                        return
+            count = sum(len(logs) for _, logs in batches)
+            if self.spill is not None:
+                logger.warning(f"ログを書き込めないためディスクに退避します: {count}件", exc_info=True)
+                await self._spill(batches)
+                self._next_replay_at = time.monotonic() + self.spill_retry_interval
+            else:
+                # 書き込みに失敗してもワーカーは止めない（そのバッチは破棄）
+                logger.exception(f"ログの書き込みに失敗しました: {count}件")
+
+    async def _spill(self, batches: List[Tuple[Any, List[Dict[str, Any]]]]):
+        """ログをディスクへ退避（mmapへの書き込みとmsyncはスレッドで実行）"""
+        kinds = {model: kind for kind, model in LOG_MODELS.items()}
+        records = [(kinds[model], log) for model, logs in batches for log in logs]
+        await asyncio.to_thread(self.spill.append, records)
+
+    async def _replay_spill(self):
+        """退避したログを古いセグメントから順にDBへ書き込む"""
+        while self._spill_pending():
+            path, records = await asyncio.to_thread(self.spill.oldest)
+            batches: Dict[Any, List[Dict[str, Any]]] = {}
+            for kind, data in records:
+                batches.setdefault(LOG_MODELS[kind], []).append(data)
+            try:
+                if batches:
+                    await self._write_batches(list(batches.items()))
+            except Exception as e:
+                try:
+                    if is_transient_error(e):
+                        raise
+                    # 行の内容が原因なら、書き込める行だけを書き込んでセグメントを消費する
+                    logger.warning("退避したログを1行ずつ再生します", exc_info=True)
+                    await self._write_rows_individually(list(batches.items()))
+                except Exception as retry_error:
+                    if is_transient_error(retry_error):
+                        logger.warning("退避したログの再生に失敗しました。後で再試行します", exc_info=True)
+                        self._next_replay_at = time.monotonic() + self.spill_retry_interval
+                        return
+                    logger.exception(f"退避したログを再生できないため破棄します: {len(records)}件")
+            await asyncio.to_thread(self.spill.remove, path, len(records))
+            logger.info(f"退避したログを再生しました: {len(records)}件")
+
+    def _drain(self, queue: asyncio.Queue) -> List[Dict[str, Any]]:
+        """キューに溜まっているログをすべて取り出す"""
+        logs = []
+        while True:
+            try:
+                logs.append(queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+            # 各ログの処理完了をマーク
+            queue.task_done()
+        return logs
+
+    async def _write_batches(self, batches: List[Tuple[Any, List[Dict[str, Any]]]]):
+        """ログをbatch_size件ずつデータベースに一括挿入"""
+        async with self._session_factory() as session:
             async with session.begin():
-                logs_to_process = []
-                
-                # キューからログを取得
-                for _ in range(min(batch_size, self.perf_log_queue.qsize())):
-                    try:
-                        log_data = self.perf_log_queue.get_nowait()
-                        logs_to_process.append(log_data)
-                    except asyncio.QueueEmpty:
-                        break
-                
-                if logs_to_process:
-                    # ログをデータベースに一括挿入
-                    session.add_all([
-                        PerformanceLog(**log_data) for log_data in logs_to_process
-                    ])
-                    
-                    # 各ログの処理完了をマーク
-                    for _ in range(len(logs_to_process)):
-                        self.perf_log_queue.task_done()
+                for model, logs in batches:
+                    for offset in range(0, len(logs), self.batch_size):
+                        await write_rows(
+                            session, model, logs[offset:offset + self.batch_size], self.write_method
+                        )
+                    if model is PerformanceLog:
+                        # 分析用のロールアップも同じトランザクションで加算する
+                        await apply_rollups(session, build_rollups(logs))
+
+    async def _write_rows_individually(self, batches: List[Tuple[Any, List[Dict[str, Any]]]]):
+        """
+        ログを1行ずつ（行ごとのセーブポイントで）書き込み、恒久的なエラーになる行は破棄する
+        一時的なエラーが発生した場合は、トランザクション全体をロールバックして例外を送出する。
+        """
+        kinds = {model: kind for kind, model in LOG_MODELS.items()}
+        async with self._session_factory() as session:
+            async with session.begin():
+                for model, logs in batches:
+                    written = []
+                    for log in logs:
+                        try:
+                            async with session.begin_nested():
+                                await write_rows(session, model, [log], "insert")
+                        except Exception as e:
+                            if is_transient_error(e):
+                                raise
+                            self.rejected[kinds[model]] += 1
+                            logger.error(f"書き込めないログを破棄しました（{kinds[model]}）: {e}: {repr(log)[:500]}")
+                            continue
+                        written.append(log)
+                    if model is PerformanceLog and written:
+                        await apply_rollups(session, build_rollups(written))
 
 # グローバルなインスタンス
 async_log_handler = AsyncLogHandler()
@@ -0,0 +1,133 @@
+"""
+ログテーブルへの一括書き込み
+
+ORMのユニットオブワーク（オブジェクト生成・状態追跡・flush）を通さずに
+大量のログ行を挿入するための関数群。
+- copy: asyncpgのcopy_records_to_table（PostgreSQLのCOPYプロトコル）
+- insert: Core INSERTのexecutemany（SQLAlchemy 2.0では複数行VALUESにまとめられる）
+- orm: 従来のsession.add_all（SQLiteを使うテストなどのフォールバック）
+"""
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Sequence
+
+from sqlalchemy import JSON, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+WRITE_METHODS = ("auto", "copy", "insert", "orm")
+
+# 書き込み時に指定しない列（DB側で採番・既定値を設定）
+_SERVER_SIDE_COLUMNS = ("id", "created_at", "updated_at")
+
+
+def _insert_columns(model) -> List[Any]:
+    """一括書き込みで値を渡す列"""
+    return [column for column in model.__table__.columns if column.name not in _SERVER_SIDE_COLUMNS]
+
+
+def _prepare_rows(model, rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """全行が同じ列を持つように整形（未指定の列はNone、timestampは現在時刻）"""
+    now = datetime.now(timezone.utc)
+    names = [column.name for column in _insert_columns(model)]
+    prepared = []
+    for row in rows:
+        values = {name: row.get(name) for name in names}
+        if "timestamp" in values and values["timestamp"] is None:
+            values["timestamp"] = now
+        prepared.append(values)
+    return prepared
+
+
+def resolve_write_method(session_or_engine, method: str = "auto") -> str:
+    """
+    実際に使う書き込み方式を決定
+    Args:
+        session_or_engine: AsyncSessionまたはAsyncEngine
+        method: 設定値（auto / copy / insert / orm）
+    Returns:
+        str: copy / insert / orm
+    """
+    if method not in WRITE_METHODS:
+        raise ValueError(f"未対応のログ書き込み方式です: {method}")
+    bind = session_or_engine.bind if isinstance(session_or_engine, AsyncSession) else session_or_engine
+    is_asyncpg = bind is not None and bind.dialect.driver == "asyncpg"
+    if method == "auto":
+        return "copy" if is_asyncpg else "orm"
+    if method == "copy" and not is_asyncpg:
+        # COPYはasyncpg専用のため、それ以外では複数行INSERTで代替する
+        return "insert"
+    return method
+
+
+async def copy_rows(session: AsyncSession, model, rows: Sequence[Dict[str, Any]]) -> int:
+    """
+    COPYプロトコルで一括挿入（asyncpg専用）
+    Args:
+        session: トランザクション中のセッション
+        model: ログモデル
+        rows: 挿入する行
+    Returns:
+        int: 挿入した行数
+    """
+    columns = _insert_columns(model)
+    json_columns = {column.name for column in columns if isinstance(column.type, JSON)}
+    names = [column.name for column in columns]
+    records = []
+    for row in _prepare_rows(model, rows):
+        records.append(tuple(
+            json.dumps(row[name], default=str) if name in json_columns and row[name] is not None else row[name]
+            for name in names
+        ))
+
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        model.__tablename__, records=records, columns=names
+    )
+    return len(records)
+
+
+async def insert_rows(session: AsyncSession, model, rows: Sequence[Dict[str, Any]]) -> int:
+    """
+    Core INSERTで一括挿入（複数行VALUES）
+    Args:
+        session: トランザクション中のセッション
+        model: ログモデル
+        rows: 挿入する行
+    Returns:
+        int: 挿入した行数
+    """
+    prepared = _prepare_rows(model, rows)
+    await session.execute(insert(model.__table__), prepared)
+    return len(prepared)
+
+
+async def orm_add_rows(session: AsyncSession, model, rows: Sequence[Dict[str, Any]]) -> int:
+    """
+    ORMで挿入（フォールバック）
+    Args:
+        session: トランザクション中のセッション
+        model: ログモデル
+        rows: 挿入する行
+    Returns:
+        int: 挿入した行数
+    """
+    session.add_all([model(**row) for row in rows])
+    return len(rows)
+
+
+WRITERS = {"copy": copy_rows, "insert": insert_rows, "orm": orm_add_rows}
+
+
+async def write_rows(session: AsyncSession, model, rows: Sequence[Dict[str, Any]], method: str = "auto") -> int:
+    """
+    書き込み方式を選んでログ行を一括挿入
+    Args:
+        session: トランザクション中のセッション
+        model: ログモデル
+        rows: 挿入する行
+        method: auto / copy / insert / orm
+    Returns:
+        int: 挿入した行数
+    """
+    return await WRITERS[resolve_write_method(session, method)](session, model, rows)
@@ -0,0 +1,132 @@
+"""
+ログのストリーミングエクスポート
+
+検索結果をサーバーサイドカーソル（stream_scalars + yield_per）で少しずつ読み出し、
+NDJSONまたはCSVに変換してチャンク単位で返す。gzipも逐次圧縮するため、
+何百万行のエクスポートでもメモリ使用量は一定（yield_per行 + チャンク1つ分）に収まる。
+"""
+import csv
+import enum
+import io
+import json
+import zlib
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, List
+
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+EXPORT_FORMATS = ("ndjson", "csv")
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+# サーバーサイドカーソルから一度に取り出す行数
+YIELD_PER = 1000
+
+# この大きさ（バイト）まで溜めてから送信する
+CHUNK_SIZE = 64 * 1024
+
+
+def _plain(value: Any) -> Any:
+    """JSON / CSVに書ける値に変換"""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def export_columns(model: Any) -> List[str]:
+    """エクスポートする列名（テーブルの列順）"""
+    return [column.name for column in model.__table__.columns]
+
+
+def row_to_dict(log: Any, columns: List[str]) -> Dict[str, Any]:
+    """ログ1件を列名と値の辞書に変換"""
+    return {name: _plain(getattr(log, name)) for name in columns}
+
+
+class _Encoder:
+    """行を指定形式のバイト列に変換する"""
+
+    def __init__(self, fmt: str, columns: List[str]):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"未対応のエクスポート形式です: {fmt}")
+        self.fmt = fmt
+        self.columns = columns
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer) if fmt == "csv" else None
+
+    def header(self) -> str:
+        if self._writer is None:
+            return ""
+        self._writer.writerow(self.columns)
+        return self._take()
+
+    def encode(self, row: Dict[str, Any]) -> str:
+        if self._writer is None:
+            return json.dumps(row, ensure_ascii=False, default=str) + "\n"
+        self._writer.writerow([
+            json.dumps(value, ensure_ascii=False, default=str) if isinstance(value, (dict, list)) else value
+            for value in row.values()
+        ])
+        return self._take()
+
+    def _take(self) -> str:
+        text = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return text
+
+
+async def stream_export(
+    session: AsyncSession,
+    query: Select,
+    model: Any,
+    fmt: str = "ndjson",
+    compress: bool = False,
+) -> AsyncIterator[bytes]:
+    """
+    検索結果をエクスポート形式のチャンクとして順に返す
+    Args:
+        session: DBセッション（ストリーミング中は接続を保持する）
+        query: 検索条件・並び順を適用したクエリ
+        model: ログのモデル
+        fmt: ndjson / csv
+        compress: gzipで圧縮する
+    Returns:
+        AsyncIterator[bytes]: レスポンス本文のチャンク
+    """
+    columns = export_columns(model)
+    encoder = _Encoder(fmt, columns)
+    # wbits=31でgzip形式（ヘッダー・CRC付き）
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def output(text: str) -> bytes:
+        data = text.encode("utf-8")
+        if compressor is None:
+            return data
+        # zlibの内部バッファに溜めず、チャンクごとにクライアントへ送り出す
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    pending: List[str] = [encoder.header()]
+    size = len(pending[0])
+    result = await session.stream_scalars(query.execution_options(yield_per=YIELD_PER))
+    try:
+        async for log in result:
+            line = encoder.encode(row_to_dict(log, columns))
+            pending.append(line)
+            size += len(line)
+            if size >= CHUNK_SIZE:
+                chunk = output("".join(pending))
+                pending, size = [], 0
+                if chunk:
+                    yield chunk
+    finally:
+        await result.close()
+
+    chunk = output("".join(pending))
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
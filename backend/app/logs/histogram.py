@@ -0,0 +1,158 @@
+"""
+マージ可能なレイテンシヒストグラム
+
+境界を固定した対数バケット（1ms〜約60秒、隣接境界の比1.2）で件数を数える。
+バケットの境界が全インスタンスで共通なため、分単位・時間単位の集計同士を
+要素ごとの足し算でマージでき、マージ後も分位点を相対誤差10%程度で推定できる。
+
+/metricsへの出力には、より粗い固定境界のBucketHistogramを使う。プロセス内で
+分位点を計算すると起動からの累積値になってしまうため、累積のバケット件数だけを出力し、
+分位点はPrometheus側でhistogram_quantile(0.95, rate(..._bucket[5m]))として時間窓ごとに求める。
+"""
+import bisect
+from typing import Iterable, List, Optional, Sequence
+
+_GROWTH = 1.2
+_MAX_MS = 60000
+
+
+def _build_bounds() -> List[float]:
+    bounds = [1.0]
+    while bounds[-1] < _MAX_MS:
+        bounds.append(round(bounds[-1] * _GROWTH, 3))
+    return bounds
+
+
+# 各バケットの上限（ミリ秒）。最後のバケットはこれを超える値すべて
+BUCKET_BOUNDS: List[float] = _build_bounds()
+BUCKET_COUNT = len(BUCKET_BOUNDS) + 1
+
+
+class LatencyHistogram:
+    """固定境界のレイテンシヒストグラム"""
+
+    __slots__ = ("counts",)
+
+    def __init__(self, counts: Optional[Iterable[int]] = None):
+        self.counts = list(counts) if counts is not None else [0] * BUCKET_COUNT
+        if len(self.counts) != BUCKET_COUNT:
+            raise ValueError("ヒストグラムのバケット数が一致しません")
+
+    @staticmethod
+    def bucket_index(value_ms: float) -> int:
+        """値が入るバケットの位置"""
+        return bisect.bisect_left(BUCKET_BOUNDS, value_ms)
+
+    def record(self, value_ms: float, count: int = 1) -> "LatencyHistogram":
+        """値を記録"""
+        self.counts[self.bucket_index(value_ms)] += count
+        return self
+
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        """別のヒストグラムを足し込む"""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        return self
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        分位点を推定（バケット内は線形補間）
+        Args:
+            q: 0〜1の分位
+        Returns:
+            Optional[float]: 推定値（ミリ秒）。件数0ならNone
+        """
+        total = self.total
+        if total == 0:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKET_BOUNDS[index - 1] if index > 0 else 0.0
+                upper = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else lower
+                return lower + (upper - lower) * max(0.0, rank - seen) / count
+            seen += count
+        return BUCKET_BOUNDS[-1]
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        """
+        複数の分位点を1回の走査で推定
+        Args:
+            qs: 昇順の分位のリスト
+        Returns:
+            List[Optional[float]]: 推定値（ミリ秒）。件数0ならすべてNone
+        """
+        total = self.total
+        if total == 0:
+            return [None] * len(qs)
+        results: List[Optional[float]] = []
+        ranks = iter([q * total for q in qs])
+        rank = next(ranks, None)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            while rank is not None and count and seen + count >= rank:
+                lower = BUCKET_BOUNDS[index - 1] if index > 0 else 0.0
+                upper = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else lower
+                results.append(lower + (upper - lower) * max(0.0, rank - seen) / count)
+                rank = next(ranks, None)
+            if rank is None:
+                return results
+            seen += count
+        return results + [BUCKET_BOUNDS[-1]] * (len(qs) - len(results))
+
+    def to_list(self) -> List[int]:
+        """保存用のリスト表現"""
+        return list(self.counts)
+
+    @classmethod
+    def from_list(cls, counts: Optional[Iterable[int]]) -> "LatencyHistogram":
+        """保存されたリストから復元（空ならゼロのヒストグラム）"""
+        return cls(counts) if counts else cls()
+
+
+# /metricsに出力するバケットの上限（ミリ秒）。これを超える値は+Infのバケットにのみ入る
+EXPORT_BOUNDS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class BucketHistogram:
+    """Prometheusのhistogram形式（累積の_bucket・_sum・_count）で出力するヒストグラム"""
+
+    __slots__ = ("counts", "sum_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(EXPORT_BOUNDS_MS) + 1)
+        self.sum_ms = 0.0
+
+    def record(self, value_ms: float) -> "BucketHistogram":
+        """値を記録"""
+        self.counts[bisect.bisect_left(EXPORT_BOUNDS_MS, value_ms)] += 1
+        self.sum_ms += value_ms
+        return self
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def cumulative(self) -> List[int]:
+        """各境界以下の件数（最後の要素は+Infで、全件数と等しい）"""
+        result = []
+        seen = 0
+        for count in self.counts:
+            seen += count
+            result.append(seen)
+        return result
+
+
+def merge_histograms(histograms: Iterable[Optional[Iterable[int]]]) -> LatencyHistogram:
+    """保存されたヒストグラムのリストをまとめてマージ"""
+    merged = [0] * BUCKET_COUNT
+    for counts in histograms:
+        if counts:
+            for index, count in enumerate(counts):
+                if count:
+                    merged[index] += count
+    return LatencyHistogram(merged)
@@ -1,29 +1,33 @@
 """
 ログの検索や管理を行うマネージャークラス
 """
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func
-from app.db.models.logs import ApplicationLog, AuditLog, PerformanceLog
+from sqlalchemy import Select, case, select, desc, func, tuple_
+from app.db.models.logs import ApplicationLog, AuditLog, PerformanceLog, PerformanceRollup
+from app.logs.export import MEDIA_TYPES, stream_export
+from app.logs.histogram import LatencyHistogram
+from app.logs.pagination import paginate
+from app.logs.rollups import bucket_start
 from fastapi import Depends
+from fastapi.responses import StreamingResponse
 from app.database import get_db
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 class LogManager:
     def __init__(self, db: AsyncSession):
         self.db = db
     
-    async def get_application_logs(
+    def _application_log_query(
         self,
         level: Optional[str] = None,
         source: Optional[str] = None,
         user_id: Optional[int] = None,
+        endpoint: Optional[str] = None,
         start_time: Optional[datetime] = None,
-        end_time: Optional[datetime] = None,
-        limit: int = 100,
-        offset: int = 0
-    ) -> List[ApplicationLog]:
-        """アプリケーションログを検索"""
+        end_time: Optional[datetime] = None
+    ) -> Select:
+        """アプリケーションログの検索条件を適用したクエリ"""
         query = select(ApplicationLog)
         
         # フィルタ条件の適用
@@ -33,30 +37,48 @@ class LogManager:
             query = query.filter(ApplicationLog.source == source)
         if user_id:
             query = query.filter(ApplicationLog.user_id == user_id)
+        if endpoint:
+            query = query.filter(ApplicationLog.endpoint == endpoint)
         if start_time:
             query = query.filter(ApplicationLog.timestamp >= start_time)
         if end_time:
             query = query.filter(ApplicationLog.timestamp <= end_time)
+        return query
+    
+    async def get_application_logs(
+        self,
+        level: Optional[str] = None,
+        source: Optional[str] = None,
+        user_id: Optional[int] = None,
+        endpoint: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        limit: int = 100,
+        offset: int = 0,
+        cursor: Optional[str] = None
+    ) -> List[ApplicationLog]:
+        """
+        アプリケーションログを検索
+        cursorを指定すると(timestamp, id)のキーセットで続きを取得する（offsetは無視）
+        """
+        query = self._application_log_query(level, source, user_id, endpoint, start_time, end_time)
         
         # ソートとページネーション
-        query = query.order_by(desc(ApplicationLog.timestamp))
-        query = query.offset(offset).limit(limit)
+        query = paginate(query, ApplicationLog, limit, offset, cursor)
         
         result = await self.db.execute(query)
         return result.scalars().all()
     
-    async def get_audit_logs(
+    def _audit_log_query(
         self,
         user_id: Optional[int] = None,
         action: Optional[str] = None,
         resource_type: Optional[str] = None,
         resource_id: Optional[int] = None,
         start_time: Optional[datetime] = None,
-        end_time: Optional[datetime] = None,
-        limit: int = 100,
-        offset: int = 0
-    ) -> List[AuditLog]:
-        """監査ログを検索"""
+        end_time: Optional[datetime] = None
+    ) -> Select:
+        """監査ログの検索条件を適用したクエリ"""
         query = select(AuditLog)
         
         # フィルタ条件の適用
@@ -72,15 +94,33 @@ class LogManager:
             query = query.filter(AuditLog.timestamp >= start_time)
         if end_time:
             query = query.filter(AuditLog.timestamp <= end_time)
+        return query
+    
+    async def get_audit_logs(
+        self,
+        user_id: Optional[int] = None,
+        action: Optional[str] = None,
+        resource_type: Optional[str] = None,
+        resource_id: Optional[int] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        limit: int = 100,
+        offset: int = 0,
+        cursor: Optional[str] = None
+    ) -> List[AuditLog]:
+        """
+        監査ログを検索
+        cursorを指定すると(timestamp, id)のキーセットで続きを取得する（offsetは無視）
+        """
+        query = self._audit_log_query(user_id, action, resource_type, resource_id, start_time, end_time)
         
         # ソートとページネーション
-        query = query.order_by(desc(AuditLog.timestamp))
-        query = query.offset(offset).limit(limit)
+        query = paginate(query, AuditLog, limit, offset, cursor)
         
         result = await self.db.execute(query)
         return result.scalars().all()
     
-    async def get_performance_logs(
+    def _performance_log_query(
         self,
         endpoint: Optional[str] = None,
         min_response_time: Optional[int] = None,
@@ -89,11 +129,9 @@ class LogManager:
         request_method: Optional[str] = None,
         user_id: Optional[int] = None,
         start_time: Optional[datetime] = None,
-        end_time: Optional[datetime] = None,
-        limit: int = 100,
-        offset: int = 0
-    ) -> List[PerformanceLog]:
-        """パフォーマンスログを検索"""
+        end_time: Optional[datetime] = None
+    ) -> Select:
+        """パフォーマンスログの検索条件を適用したクエリ"""
         query = select(PerformanceLog)
         
         # フィルタ条件の適用
@@ -113,28 +151,79 @@ class LogManager:
             query = query.filter(PerformanceLog.timestamp >= start_time)
         if end_time:
             query = query.filter(PerformanceLog.timestamp <= end_time)
+        return query
+    
+    async def get_performance_logs(
+        self,
+        endpoint: Optional[str] = None,
+        min_response_time: Optional[int] = None,
+        max_response_time: Optional[int] = None,
+        status_code: Optional[int] = None,
+        request_method: Optional[str] = None,
+        user_id: Optional[int] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        limit: int = 100,
+        offset: int = 0,
+        cursor: Optional[str] = None
+    ) -> List[PerformanceLog]:
+        """
+        パフォーマンスログを検索
+        cursorを指定すると(timestamp, id)のキーセットで続きを取得する（offsetは無視）
+        """
+        query = self._performance_log_query(
+            endpoint, min_response_time, max_response_time, status_code, request_method,
+            user_id, start_time, end_time
+        )
         
         # ソートとページネーション
-        query = query.order_by(desc(PerformanceLog.timestamp))
-        query = query.offset(offset).limit(limit)
+        query = paginate(query, PerformanceLog, limit, offset, cursor)
         
         result = await self.db.execute(query)
         return result.scalars().all()
     
+    def export_logs(
+        self, log_type: str, fmt: str = "ndjson", compress: bool = False, **filters: Any
+    ) -> AsyncIterator[bytes]:
+        """
+        ログをNDJSON/CSVでストリーミングエクスポート（(timestamp, id)の降順）
+        
+        Args:
+            log_type: application / audit / performance
+            fmt: ndjson / csv
+            compress: gzipで圧縮する
+            **filters: 各ログの検索条件（get_*_logsと同じ）
+            
+        Returns:
+            AsyncIterator[bytes]: レスポンス本文のチャンク
+        """
+        builders = {
+            "application": (ApplicationLog, self._application_log_query),
+            "audit": (AuditLog, self._audit_log_query),
+            "performance": (PerformanceLog, self._performance_log_query),
+        }
+        model, build_query = builders[log_type]
+        query = build_query(**filters).order_by(desc(model.timestamp), desc(model.id))
+        return stream_export(self.db, query, model, fmt, compress)
+    
     async def get_slow_endpoints(
         self, threshold_ms: int = 500, limit: int = 10
     ) -> List[Dict[str, Any]]:
-        """遅いエンドポイントの統計情報を取得"""
+        """遅いエンドポイントの統計情報を取得（時間単位のロールアップから集計）"""
+        request_count = func.sum(PerformanceRollup.request_count)
+        avg_time = (func.sum(PerformanceRollup.total_time_ms) * 1.0 / request_count).label("avg_time")
         query = select(
-            PerformanceLog.endpoint,
-            func.avg(PerformanceLog.response_time).label("avg_time"),
-            func.max(PerformanceLog.response_time).label("max_time"),
-            func.min(PerformanceLog.response_time).label("min_time"),
-            func.count(PerformanceLog.id).label("request_count")
+            PerformanceRollup.endpoint,
+            avg_time,
+            func.max(PerformanceRollup.max_time_ms).label("max_time"),
+            func.min(PerformanceRollup.min_time_ms).label("min_time"),
+            request_count.label("request_count")
+        ).filter(
+            PerformanceRollup.granularity == "hour"
         ).group_by(
-            PerformanceLog.endpoint
+            PerformanceRollup.endpoint
         ).having(
-            func.avg(PerformanceLog.response_time) > threshold_ms
+            avg_time > threshold_ms
         ).order_by(
             desc("avg_time")
         ).limit(limit)
@@ -237,6 +326,13 @@ class LogManager:
     async def analyze_performance(self, days: int = 7, min_requests: int = 10) -> Dict[str, Any]:
         """
         パフォーマンスログを分析
+        ステータスコード別の件数以外は、生ログではなく時間単位のロールアップ（app.logs.rollups）を集計する。
+        件数・合計・最小・最大はSQLのGROUP BYで集計し、ヒストグラムは結果に含める
+        エンドポイントの行だけを読み込んでマージする。p95はマージしたヒストグラムから
+        推定する（相対誤差10%程度）。
+        status_code_distributionは従来どおり個別のステータスコード（"200"、"404"など）ごとの件数で、
+        生ログを同じ期間（パーティションで絞り込まれる）について集計する。
+        status_class_distributionはロールアップのキーに合わせたステータスクラス（"2xx"、"4xx"など）ごとの件数。
         
         Args:
             days: 分析する日数
@@ -245,93 +341,76 @@ class LogManager:
         Returns:
             Dict[str, Any]: 分析結果
         """
-        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        cutoff_date = bucket_start(datetime.now(timezone.utc) - timedelta(days=days), "hour")
+        in_period = (
+            PerformanceRollup.granularity == "hour",
+            PerformanceRollup.bucket_start >= cutoff_date,
+        )
+        request_count = func.sum(PerformanceRollup.request_count)
+        total_time = func.sum(PerformanceRollup.total_time_ms)
+        error_count = func.sum(case(
+            (PerformanceRollup.status_class == "5xx", PerformanceRollup.request_count), else_=0
+        ))
         
-        # エンドポイント別のパフォーマンス統計
-        endpoint_stats_query = (
+        # エンドポイント別のパフォーマンス統計（空のエンドポイントと件数の少ないものを除外）
+        endpoint_query = (
             select(
-                PerformanceLog.endpoint,
-                PerformanceLog.request_method,
-                func.count(PerformanceLog.id).label("request_count"),
-                func.avg(PerformanceLog.response_time).label("avg_time"),
-                func.min(PerformanceLog.response_time).label("min_time"),
-                func.max(PerformanceLog.response_time).label("max_time"),
-                func.percentile_cont(0.95).within_group(PerformanceLog.response_time).label("p95_time")
+                PerformanceRollup.endpoint,
+                PerformanceRollup.request_method,
+                request_count.label("request_count"),
+                total_time.label("total_time_ms"),
+                func.min(PerformanceRollup.min_time_ms).label("min_time_ms"),
+                func.max(PerformanceRollup.max_time_ms).label("max_time_ms"),
+                error_count.label("error_count"),
             )
-            .filter(PerformanceLog.timestamp >= cutoff_date)
-            .group_by(PerformanceLog.endpoint, PerformanceLog.request_method)
-            .having(func.count(PerformanceLog.id) >= min_requests)
+            .filter(*in_period, PerformanceRollup.endpoint != "")
+            .group_by(PerformanceRollup.endpoint, PerformanceRollup.request_method)
+            .having(request_count >= min_requests)
+            .order_by(PerformanceRollup.endpoint, PerformanceRollup.request_method)
         )
-        
-        try:
-            endpoint_stats_result = await self.db.execute(endpoint_stats_query)
-            endpoint_stats = [
-                {
-                    "endpoint": endpoint,
-                    "method": method,
-                    "request_count": count,
-                    "avg_time_ms": round(avg_time),
-                    "min_time_ms": min_time,
-                    "max_time_ms": max_time,
-                    "p95_time_ms": round(p95_time) if p95_time else None
-                }
-                for endpoint, method, count, avg_time, min_time, max_time, p95_time in endpoint_stats_result
-                if endpoint  # 空のエンドポイントを除外
-            ]
-        except Exception:
-            # percentile_contが使えない場合はp95を除外
-            endpoint_stats_query = (
-                select(
-                    PerformanceLog.endpoint,
-                    PerformanceLog.request_method,
-                    func.count(PerformanceLog.id).label("request_count"),
-                    func.avg(PerformanceLog.response_time).label("avg_time"),
-                    func.min(PerformanceLog.response_time).label("min_time"),
-                    func.max(PerformanceLog.response_time).label("max_time")
-                )
-                .filter(PerformanceLog.timestamp >= cutoff_date)
-                .group_by(PerformanceLog.endpoint, PerformanceLog.request_method)
-                .having(func.count(PerformanceLog.id) >= min_requests)
-            )
-            endpoint_stats_result = await self.db.execute(endpoint_stats_query)
-            endpoint_stats = [
-                {
-                    "endpoint": endpoint,
-                    "method": method,
-                    "request_count": count,
-                    "avg_time_ms": round(avg_time),
-                    "min_time_ms": min_time,
-                    "max_time_ms": max_time,
-                }
-                for endpoint, method, count, avg_time, min_time, max_time in endpoint_stats_result
-                if endpoint
-            ]
+        endpoint_rows = (await self.db.execute(endpoint_query)).all()
+        histograms = await self._merged_histograms(
+            [(row.endpoint, row.request_method) for row in endpoint_rows], in_period
+        )
+        endpoint_stats = []
+        for row in endpoint_rows:
+            p95_time = histograms[(row.endpoint, row.request_method)].quantile(0.95)
+            endpoint_stats.append({
+                "endpoint": row.endpoint,
+                "method": row.request_method,
+                "request_count": row.request_count,
+                "error_count": row.error_count,
+                "avg_time_ms": round(row.total_time_ms / row.request_count),
+                "min_time_ms": row.min_time_ms,
+                "max_time_ms": row.max_time_ms,
+                "p95_time_ms": round(p95_time) if p95_time is not None else None
+            })
         
         # 全体の統計
-        summary_query = (
-            select(
-                func.count(PerformanceLog.id).label("total_requests"),
-                func.avg(PerformanceLog.response_time).label("avg_time"),
-                func.min(PerformanceLog.response_time).label("min_time"),
-                func.max(PerformanceLog.response_time).label("max_time")
-            )
-            .filter(PerformanceLog.timestamp >= cutoff_date)
-        )
-        summary_result = await self.db.execute(summary_query)
-        summary = summary_result.first()
+        total_query = select(
+            request_count, total_time,
+            func.min(PerformanceRollup.min_time_ms), func.max(PerformanceRollup.max_time_ms)
+        ).filter(*in_period)
+        total_requests, total_time_ms, min_time_ms, max_time_ms = (await self.db.execute(total_query)).one()
+        total_requests = total_requests or 0
         
-        # HTTPステータスコード別の集計
-        status_query = (
-            select(
-                PerformanceLog.status_code,
-                func.count(PerformanceLog.id).label("count")
-            )
+        # HTTPステータスコード別の集計（生ログ）
+        status_code_query = (
+            select(PerformanceLog.status_code, func.count(PerformanceLog.id).label("count"))
             .filter(PerformanceLog.timestamp >= cutoff_date)
             .group_by(PerformanceLog.status_code)
             .order_by(desc("count"))
         )
-        status_result = await self.db.execute(status_query)
-        status_counts = {str(status): count for status, count in status_result}
+        status_counts = {str(status): count for status, count in await self.db.execute(status_code_query)}
+        
+        # HTTPステータスクラス別の集計（2xx、4xxなど。ロールアップ）
+        status_class_query = (
+            select(PerformanceRollup.status_class, request_count)
+            .filter(*in_period)
+            .group_by(PerformanceRollup.status_class)
+            .order_by(desc(request_count))
+        )
+        status_class_counts = {status: count for status, count in await self.db.execute(status_class_query)}
         
         # 遅いエンドポイント
         slow_endpoints = sorted(
@@ -342,15 +421,42 @@ class LogManager:
         
         return {
             "period_days": days,
-            "total_requests": summary[0] if summary else 0,
-            "avg_response_time_ms": round(summary[1]) if summary and summary[1] else 0,
-            "min_response_time_ms": summary[2] if summary else 0,
-            "max_response_time_ms": summary[3] if summary else 0,
+            "total_requests": total_requests,
+            "avg_response_time_ms": round(total_time_ms / total_requests) if total_requests else 0,
+            "min_response_time_ms": min_time_ms or 0,
+            "max_response_time_ms": max_time_ms or 0,
             "status_code_distribution": status_counts,
+            "status_class_distribution": status_class_counts,
             "slow_endpoints": slow_endpoints,
             "all_endpoints": endpoint_stats
         }
     
+    async def _merged_histograms(
+        self, keys: List[Tuple[str, str]], in_period: Tuple[Any, ...]
+    ) -> Dict[Tuple[str, str], LatencyHistogram]:
+        """
+        (endpoint, request_method)ごとにロールアップのヒストグラムをマージ
+        Args:
+            keys: 対象の(endpoint, request_method)のリスト
+            in_period: ロールアップの絞り込み条件
+        Returns:
+            Dict[Tuple[str, str], LatencyHistogram]: キーごとのヒストグラム（行がなければ空）
+        """
+        merged = {key: LatencyHistogram() for key in keys}
+        if not keys:
+            return merged
+        query = select(
+            PerformanceRollup.endpoint, PerformanceRollup.request_method, PerformanceRollup.histogram
+        ).filter(
+            *in_period,
+            PerformanceRollup.histogram.is_not(None),
+            tuple_(PerformanceRollup.endpoint, PerformanceRollup.request_method).in_(keys),
+        )
+        for endpoint, method, histogram in await self.db.execute(query):
+            if histogram:
+                merged[(endpoint, method)].merge(LatencyHistogram.from_list(histogram))
+        return merged
+    
     async def record_client_log(
         self, 
         level: str,
@@ -377,3 +483,39 @@ class LogManager:
         )
         self.db.add(log)
         await self.db.commit()
+
+
+async def _stream_with_own_session(bind, log_type: str, fmt: str, compress: bool, filters: dict):
+    """
+    エクスポート専用のセッションを開いてストリーミングし、終了時に閉じる
+    リクエストの依存関係のセッションは、FastAPIのバージョンによってはレスポンスの送信前に
+    閉じられるため、ストリーミング中に使うセッションはジェネレーター自身が所有する。
+    """
+    async with AsyncSession(bind=bind, expire_on_commit=False) as db:
+        async for chunk in LogManager(db).export_logs(log_type, fmt, compress, **filters):
+            yield chunk
+
+
+def export_response(db: AsyncSession, log_type: str, fmt: str, compress: bool, filters: dict) -> StreamingResponse:
+    """
+    エクスポートのストリーミングレスポンスを作成
+    接続先（レプリカ / プライマリ）はget_read_dbが選んだセッションに合わせる。
+    Args:
+        db: 接続先の選択に使うセッション（ストリーミングには使わない）
+        log_type: ログの種類 (application, audit, performance)
+        fmt: 出力形式 (ndjson, csv)
+        compress: gzipで圧縮するか
+        filters: export_logsに渡す検索条件
+    Returns:
+        StreamingResponse: 添付ファイルとしてのレスポンス
+    """
+    filename = f"{log_type}_logs_{datetime.utcnow():%Y%m%d%H%M%S}.{fmt}"
+    media_type = MEDIA_TYPES[fmt]
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        _stream_with_own_session(db.bind, log_type, fmt, compress, filters),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,240 @@
+"""
+プロセス内のリクエストメトリクスとPrometheus形式での出力
+
+LoggingMiddlewareがリクエストごとにルートテンプレート・メソッド単位の
+レイテンシヒストグラム（app.logs.histogram.BucketHistogram）とステータスコード別の件数を加算する。
+ワーカーごとのイベントループ上で同期的に加算するだけなのでロックは不要で、
+/metricsの出力も同じイベントループ上で（async defのエンドポイントから）DBを参照せず
+メモリ上の値から組み立てる。
+レイテンシは累積のバケット件数として出力し、分位点はPrometheus側で
+histogram_quantile(0.95, sum by (le, route) (rate(http_request_duration_seconds_bucket[5m])))
+のように時間窓を指定して求める。
+複数ワーカーの値はPrometheus側でワーカー（インスタンス）ごとに収集して集約する。
+"""
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.cache import get_local_cache_stats, local_cache
+from app.logs.async_log_handler import async_log_handler
+from app.logs.histogram import EXPORT_BOUNDS_MS, BucketHistogram
+from app.logs.route_templates import UNMATCHED_ROUTE
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: Any) -> str:
+    """ラベル値のエスケープ"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: Any) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# バケットの上限（le）のラベル値（秒）
+_LE_VALUES = [repr(bound / 1000) for bound in EXPORT_BOUNDS_MS] + ["+Inf"]
+
+
+def _render_histogram(name: str, labels: str, histogram: BucketHistogram) -> List[str]:
+    """
+    1系列分のhistogramを出力（_bucket・_sum・_count）
+    Args:
+        name: メトリクス名
+        labels: 波括弧を除いたラベル部分（空文字列も可）
+        histogram: 出力するヒストグラム
+    Returns:
+        List[str]: 出力行
+    """
+    prefix = f"{labels}," if labels else ""
+    lines = [
+        f'{name}_bucket{{{prefix}le="{le}"}} {count}'
+        for le, count in zip(_LE_VALUES, histogram.cumulative())
+    ]
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum_ms / 1000!r}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.total}")
+    return lines
+
+
+class RouteStats:
+    """1つのルート・メソッドの集計"""
+
+    __slots__ = ("labels", "histogram", "statuses")
+
+    def __init__(self, route: str, method: str):
+        # 出力のたびにエスケープしないよう、ラベル部分を作っておく
+        self.labels = f'route="{_escape(route)}",method="{_escape(method)}"'
+        self.histogram = BucketHistogram()
+        self.statuses: Dict[int, int] = {}
+
+
+class MetricsRegistry:
+    """ルートテンプレート・メソッド単位のリクエストメトリクス"""
+
+    def __init__(self):
+        self._routes: Dict[Tuple[str, str], RouteStats] = {}
+        self.started_at = time.time()
+
+    def observe(self, route: Optional[str], method: str, status_code: int, duration_ms: float) -> None:
+        """
+        リクエスト1件を記録
+        Args:
+            route: ルートテンプレート（例: /api/v1/tasks/{task_id}）。一致しなければNone
+            method: HTTPメソッド
+            status_code: ステータスコード
+            duration_ms: 処理時間（ミリ秒）
+        """
+        key = (route or UNMATCHED_ROUTE, method)
+        stats = self._routes.get(key)
+        if stats is None:
+            stats = self._routes[key] = RouteStats(*key)
+        stats.histogram.record(duration_ms)
+        stats.statuses[status_code] = stats.statuses.get(status_code, 0) + 1
+
+    def reset(self) -> None:
+        """全メトリクスを破棄"""
+        self._routes.clear()
+
+    def render(self) -> List[str]:
+        """リクエストメトリクスをPrometheusのテキスト形式で出力"""
+        lines = [
+            "# HELP http_requests_total Total HTTP requests by route template, method and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        routes = [stats for _, stats in sorted(self._routes.items())]
+        for stats in routes:
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'http_requests_total{{{stats.labels},status="{status}"}} {count}')
+
+        lines += [
+            "# HELP http_request_duration_seconds HTTP request latency by route template and method.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for stats in routes:
+            lines += _render_histogram("http_request_duration_seconds", stats.labels, stats.histogram)
+        return lines
+
+
+def render_pool_stats(engines: Dict[str, Any]) -> List[str]:
+    """
+    コネクションプールの状態を出力
+    Args:
+        engines: {プール名: エンジン}（None、またはQueuePool以外のプールは出力しない）
+    Returns:
+        List[str]: 出力行
+    """
+    gauges = {
+        "db_pool_size": ("size", "Configured pool size."),
+        "db_pool_checked_out": ("checkedout", "Connections currently in use."),
+        "db_pool_checked_in": ("checkedin", "Idle connections in the pool."),
+        "db_pool_overflow": ("overflow", "Connections opened beyond the pool size."),
+    }
+    pools = {
+        name: engine.pool for name, engine in engines.items()
+        if engine is not None and hasattr(engine.pool, "checkedout")
+    }
+    lines = []
+    for metric, (method, help_text) in gauges.items():
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+        for name, pool in sorted(pools.items()):
+            lines.append(f"{metric}{_labels(pool=name)} {getattr(pool, method)()}")
+
+    # 計測付きのプール（app.db.pool）は取り出し回数と待ち時間も出力する
+    instrumented = sorted((name, pool.stats) for name, pool in pools.items() if hasattr(pool, "stats"))
+    if not instrumented:
+        return lines
+    lines += [
+        "# HELP db_pool_checkouts_total Connections checked out from the pool.",
+        "# TYPE db_pool_checkouts_total counter",
+    ]
+    lines += [f"db_pool_checkouts_total{_labels(pool=name)} {stats.checkouts}" for name, stats in instrumented]
+    lines += [
+        "# HELP db_pool_checkout_timeouts_total Checkouts that timed out waiting for a connection.",
+        "# TYPE db_pool_checkout_timeouts_total counter",
+    ]
+    lines += [f"db_pool_checkout_timeouts_total{_labels(pool=name)} {stats.timeouts}" for name, stats in instrumented]
+    lines += [
+        "# HELP db_pool_checkout_wait_seconds Time spent waiting for a pooled connection.",
+        "# TYPE db_pool_checkout_wait_seconds histogram",
+    ]
+    for name, stats in instrumented:
+        lines += _render_histogram("db_pool_checkout_wait_seconds", _labels(pool=name)[1:-1], stats.wait_histogram)
+    return lines
+
+
+def render_cache_stats(cache_stats: Dict[str, Dict[str, int]], entries: int) -> List[str]:
+    """
+    プロセス内キャッシュ（L1）の統計を出力
+    Args:
+        cache_stats: get_local_cache_statsの結果
+        entries: 現在のエントリ数
+    Returns:
+        List[str]: 出力行
+    """
+    lines = [
+        "# HELP cache_local_entries Entries in the in-process cache.",
+        "# TYPE cache_local_entries gauge",
+        f"cache_local_entries {entries}",
+    ]
+    for field in ("hits", "misses", "evictions"):
+        metric = f"cache_local_{field}_total"
+        lines += [f"# HELP {metric} In-process cache {field} by key prefix.", f"# TYPE {metric} counter"]
+        for prefix, stats in sorted(cache_stats.items()):
+            lines.append(f"{metric}{_labels(prefix=prefix)} {stats.get(field, 0)}")
+    return lines
+
+
+def render_log_stats(log_stats: Dict[str, Any]) -> List[str]:
+    """
+    AsyncLogHandlerのキューの状態を出力
+    Args:
+        log_stats: AsyncLogHandler.get_statsの結果
+    Returns:
+        List[str]: 出力行
+    """
+    lines = ["# HELP log_queue_size Logs waiting to be written.", "# TYPE log_queue_size gauge"]
+    for queue, size in sorted(log_stats["queued"].items()):
+        lines.append(f"log_queue_size{_labels(queue=queue)} {size}")
+    lines += ["# HELP log_dropped_total Logs dropped on queue overflow.", "# TYPE log_dropped_total counter"]
+    for queue, count in sorted(log_stats["dropped"].items()):
+        lines.append(f"log_dropped_total{_labels(queue=queue)} {count}")
+    lines += ["# HELP log_rejected_total Logs discarded because the database rejected the row.",
+              "# TYPE log_rejected_total counter"]
+    for queue, count in sorted(log_stats.get("rejected", {}).items()):
+        lines.append(f"log_rejected_total{_labels(queue=queue)} {count}")
+    lines += [
+        "# HELP log_spilled_total Logs spilled to disk while the database was unavailable.",
+        "# TYPE log_spilled_total counter",
+        f"log_spilled_total {log_stats['spilled']}",
+        "# HELP log_replayed_total Spilled logs replayed into the database.",
+        "# TYPE log_replayed_total counter",
+        f"log_replayed_total {log_stats['replayed']}",
+    ]
+    return lines
+
+
+def render_metrics(engines: Optional[Dict[str, Any]] = None) -> str:
+    """
+    /metricsの本文を生成
+    Args:
+        engines: プールの状態を出力するエンジン（{プール名: エンジン}）
+    Returns:
+        str: Prometheusのテキスト形式
+    """
+    lines = [
+        "# HELP process_start_time_seconds Start time of the worker since unix epoch in seconds.",
+        "# TYPE process_start_time_seconds gauge",
+        f"process_start_time_seconds {_format(metrics.started_at)}",
+    ]
+    lines += metrics.render()
+    lines += render_pool_stats(engines or {})
+    lines += render_cache_stats(get_local_cache_stats(), len(local_cache))
+    lines += render_log_stats(async_log_handler.get_stats())
+    return "\n".join(lines) + "\n"
+
+
+# ワーカー内で共有するインスタンス
+metrics = MetricsRegistry()
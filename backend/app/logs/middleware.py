@@ -3,77 +3,116 @@ FastAPIアプリケーションのリクエスト/レスポンスログを記録
 """
 import uuid
 import time
+import logging
 import traceback
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
-from app.logs.app_logger import ApplicationLogger, request_id_var
-from app.logs.performance_logger import PerformanceLogger
-from app.database import get_db
-
-class LoggingMiddleware(BaseHTTPMiddleware):
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.logs.app_logger import request_id_var
+from app.logs.async_log_handler import async_log_handler
+from app.logs.metrics import UNMATCHED_ROUTE, metrics
+
+logger = logging.getLogger("app")
+
+def route_template(scope: Scope):
+    """
+    リクエストが一致したルートのテンプレート（例: /api/v1/tasks/{task_id}）
+    ルーティング後にFastAPIがscopeへ設定するrouteから取得する。一致しなければNone
+    """
+    route = scope.get("route")
+    return getattr(route, "path", None)
+
+class LoggingMiddleware:
+    """
+    リクエストログ記録ミドルウェア（純粋なASGIミドルウェア）
+
+    BaseHTTPMiddlewareを使わないため、リクエストごとのタスク生成がなく
+    ストリーミングレスポンスもバッファされずに通過する。
+    ログはAsyncLogHandlerのキューに積むだけで、リクエスト処理中に
+    DBセッションの取得や書き込みは行わない。
+    レイテンシとステータスコードはプロセス内のメトリクス（app.logs.metrics）にも加算する。
+    endpointには実パスではなく一致したルートのテンプレートを記録する
+    （/api/v1/tasks/1 と /api/v1/tasks/2 は /api/v1/tasks/{task_id} として集計される）。
+    どのルートにも一致しないリクエストは<unmatched>とし、実パスは追加情報に残す。
+    """
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
-    
-    async def dispatch(self, request: Request, call_next):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # リクエストIDを生成
         request_id = str(uuid.uuid4())
         request_id_var.set(request_id)
-        
+
         # リクエスト情報を取得
-        path = request.url.path
-        method = request.method
-        
+        path = scope["path"]
+        method = scope["method"]
+        headers = Headers(scope=scope)
+        client = scope.get("client")
+        ip_address = client[0] if client else None
+
         start_time = time.time()
-        
-        # DBセッションを取得
-        db = next(get_db())
-        
-        # パフォーマンスロガーを初期化
-        perf_logger = PerformanceLogger(db).start_timer()
-        
+
+        # リクエスト情報をリクエストオブジェクト（request.state）に保存
+        state = scope.setdefault("state", {})
+        state["request_id"] = request_id
+        state["start_time"] = start_time
+        state["path"] = path
+        state["method"] = method
+
+        # レスポンス開始時にステータスを、本文の送信ごとにサイズを記録
+        # （ストリーミングレスポンスはContent-Lengthを持たないため、送信したバイト数を数える）
+        # レスポンスを開始する前に例外が発生した場合は500として記録する
+        response_info = {"status_code": 500, "response_size": 0}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response_info["status_code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response_info["response_size"] += len(message.get("body", b""))
+            await send(message)
+
+        async def record_performance() -> None:
+            """メトリクスとパフォーマンスログを記録（正常時・例外時で同じ項目）"""
+            endpoint = route_template(scope)
+            elapsed_ms = (time.time() - start_time) * 1000
+            metrics.observe(endpoint, method, response_info["status_code"], elapsed_ms)
+            await async_log_handler.add_performance_log({
+                "endpoint": endpoint or UNMATCHED_ROUTE,
+                "response_time": int(elapsed_ms),
+                "status_code": response_info["status_code"],
+                "request_method": method,
+                "response_size": response_info["response_size"],
+                "ip_address": ip_address,
+                "user_agent": headers.get("user-agent"),
+                "additional_metrics": None if endpoint else {"path": path},
+            })
+
         try:
             # リクエスト処理を実行
-            response = await call_next(request)
-            
-            # リクエスト情報をリクエストオブジェクトに保存
-            request.state.request_id = request_id
-            request.state.start_time = start_time
-            request.state.path = path
-            request.state.method = method
-            
-            # パフォーマンスログを記録
-            response_size = int(response.headers.get("content-length", 0))
-            await perf_logger.log_request(
-                endpoint=path,
-                status_code=response.status_code,
-                request_method=method,
-                response_size=response_size,
-                ip_address=request.client.host if request.client else None,
-                user_agent=request.headers.get("user-agent")
-            )
-            
-            return response
-        
+            await self.app(scope, receive, send_wrapper)
+
         except Exception as e:
             # 例外発生時のアプリケーションログ記録
-            app_logger = ApplicationLogger(db)
-            await app_logger.log(
-                level="ERROR",
-                source="MIDDLEWARE",
-                message=f"Request processing error: {str(e)}",
-                endpoint=path,
-                ip_address=request.client.host if request.client else None,
-                user_agent=request.headers.get("user-agent"),
-                additional_data={"exception": str(e), "traceback": traceback.format_exc()}
-            )
-            
-            # パフォーマンスログも記録
-            await perf_logger.log_request(
-                endpoint=path,
-                status_code=500,
-                request_method=method,
-                ip_address=request.client.host if request.client else None
-            )
-            
+            endpoint = route_template(scope)
+            message = f"Request processing error: {str(e)}"
+            logger.error(f"MIDDLEWARE: {message}")
+            await async_log_handler.add_application_log({
+                "level": "ERROR",
+                "source": "MIDDLEWARE",
+                "message": message,
+                "endpoint": endpoint or UNMATCHED_ROUTE,
+                "ip_address": ip_address,
+                "user_agent": headers.get("user-agent"),
+                "request_id": request_id,
+                "additional_data": {"exception": str(e), "traceback": traceback.format_exc(), "path": path},
+            })
+
+            # パフォーマンスログも記録（レスポンスを開始済みなら送信したステータスを使う）
+            await record_performance()
+
             raise
+
+        await record_performance()
@@ -0,0 +1,86 @@
+"""
+ログ検索のキーセット（カーソル）ページネーション
+
+ログは(timestamp, id)の降順で返す。カーソルは最後に返した行の(timestamp, id)を
+URLセーフなBase64にしたもので、次のページは
+    WHERE (timestamp, id) < (:timestamp, :id) ORDER BY timestamp DESC, id DESC LIMIT n
+で取得する。OFFSETと違い、何ページ目でも(検索条件, timestamp, id)の
+複合インデックスを先頭から必要な件数だけ読めばよい。
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+from sqlalchemy import Select, desc, tuple_
+
+from app.exceptions import BadRequestException
+
+
+def encode_cursor(timestamp: datetime, log_id: int) -> str:
+    """
+    カーソルを作成
+    Args:
+        timestamp: 最後に返した行のtimestamp
+        log_id: 最後に返した行のid
+    Returns:
+        str: 不透明なカーソル文字列
+    """
+    payload = json.dumps([timestamp.isoformat(), log_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    カーソルを復元
+    Args:
+        cursor: encode_cursorで作成した文字列
+    Returns:
+        Tuple[datetime, int]: (timestamp, id)
+    Raises:
+        BadRequestException: 不正なカーソル
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, log_id = json.loads(payload)
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except (ValueError, TypeError):
+        raise BadRequestException("不正なカーソルです")
+
+
+def next_cursor(logs: Any, limit: int) -> Optional[str]:
+    """
+    次のページのカーソル（取得件数がlimit未満なら最後のページなのでNone）
+    Args:
+        logs: 取得したログ（timestampとidを持つ）
+        limit: 取得件数の上限
+    Returns:
+        Optional[str]: カーソル
+    """
+    if not logs or len(logs) < limit:
+        return None
+    last = logs[-1]
+    return encode_cursor(last.timestamp, last.id)
+
+
+def paginate(query: Select, model: Any, limit: int, offset: int = 0, cursor: Optional[str] = None) -> Select:
+    """
+    (timestamp, id)の降順で並べてページを切り出す
+    cursorを指定した場合はキーセット、指定しない場合は従来どおりOFFSETで切り出す。
+    Args:
+        query: 検索条件を適用したクエリ
+        model: ログのモデル
+        limit: 取得件数
+        offset: スキップする件数（cursor指定時は無視）
+        cursor: 前のページの最後を指すカーソル
+    Returns:
+        Select: ページを切り出したクエリ
+    """
+    if cursor:
+        timestamp, log_id = decode_cursor(cursor)
+        query = query.filter(tuple_(model.timestamp, model.id) < tuple_(timestamp, log_id))
+        offset = 0
+    query = query.order_by(desc(model.timestamp), desc(model.id))
+    if offset:
+        query = query.offset(offset)
+    return query.limit(limit)
@@ -0,0 +1,358 @@
+"""
+ログテーブルのパーティション管理
+
+application_logs / audit_logs / performance_logs はtimestampによる
+レンジパーティション（PostgreSQL）になっている（マイグレーション参照）。
+このモジュールは定期的に次の処理を行う。
+- 今後log_partition_precreate期間分のパーティションを事前に作成する
+- 保持期間（log_retention_days）を過ぎたパーティションを切り離してからDROPする
+  （DELETEと違い行数に関係なく一瞬で終わり、VACUUMも不要）
+- デフォルトパーティションに入った行（パーティション作成前のログなど）は、
+  該当範囲のパーティションを作成するときにそちらへ移し、保持期間を過ぎた行は削除する
+- 保持期間を過ぎたパフォーマンスロールアップを削除する（app.logs.rollups）
+テーブル・操作ごとに別のトランザクションで実行するため、1つの操作の失敗で
+他の操作が巻き戻ることはなく、ログの書き込みをブロックする時間も操作1つ分に限られる。
+パーティションの境界はUTCの0時で表す（サーバーのTimeZone設定に関係なく日付の区切りを揃える）。
+"""
+import asyncio
+import logging
+import re
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncIterator, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.config import settings
+from app.logs.rollups import prune_rollups
+
+logger = logging.getLogger("app")
+
+PARTITIONED_LOG_TABLES = ("application_logs", "audit_logs", "performance_logs")
+PARTITION_INTERVALS = ("daily", "weekly")
+
+# 複数ワーカーが同時にメンテナンスしないためのアドバイザリロックのキー（セッション単位で保持）
+_ADVISORY_LOCK_KEY = 0x6C6F6770  # "logp"
+_PARTITION_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+# 期限切れのパーティションを（CONCURRENTLYなしで）切り離すときのロック待ちの上限
+# ACCESS EXCLUSIVEロックを待つ間は後続のログの書き込みも待たされるため、取れなければ次回に回す
+_DETACH_LOCK_TIMEOUT = "5s"
+
+_maintenance_task: Optional[asyncio.Task] = None
+
+
+def partition_start(day: date, interval: str = "daily") -> date:
+    """
+    指定日を含むパーティションの開始日
+    Args:
+        day: 日付
+        interval: daily / weekly（weeklyは月曜始まり）
+    Returns:
+        date: パーティションの開始日
+    """
+    if interval not in PARTITION_INTERVALS:
+        raise ValueError(f"未対応のパーティション間隔です: {interval}")
+    if interval == "weekly":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def partition_step(interval: str = "daily") -> timedelta:
+    """パーティション1つ分の期間"""
+    return timedelta(weeks=1) if interval == "weekly" else timedelta(days=1)
+
+
+def partition_name(table: str, start: date) -> str:
+    """パーティション名（例: performance_logs_p20250503）"""
+    return f"{table}_p{start:%Y%m%d}"
+
+
+def planned_partitions(today: date, interval: str = "daily", precreate: int = 7) -> List[Tuple[date, date]]:
+    """
+    作成しておくべきパーティションの範囲
+    Args:
+        today: 基準日
+        interval: daily / weekly
+        precreate: 現在のパーティションに加えて先に作成しておく数
+    Returns:
+        List[Tuple[date, date]]: (開始日, 終了日)のリスト
+    """
+    step = partition_step(interval)
+    start = partition_start(today, interval)
+    return [(start + step * i, start + step * (i + 1)) for i in range(precreate + 1)]
+
+
+def partition_bound(start: date, end: date) -> str:
+    """
+    パーティションの範囲（UTCの0時を境界にする）
+    timestamp with time zoneの列に日付だけを渡すとセッションのTimeZoneで解釈されるため、
+    オフセットを明示する。
+    """
+    return f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')"
+
+
+def _utc_midnight(day: date) -> datetime:
+    """日付のUTCの0時"""
+    return datetime.combine(day, datetime.min.time(), timezone.utc)
+
+
+def _bound_date(value: str) -> date:
+    """pg_get_expr（セッションのTimeZoneで表示される）の境界値をUTCの日付に変換"""
+    bound = datetime.fromisoformat(value)
+    if bound.tzinfo is not None:
+        bound = bound.astimezone(timezone.utc)
+    return bound.date()
+
+
+def expired_partitions(
+    partitions: List[Tuple[str, Optional[date], Optional[date]]], today: date, retention_days: int
+) -> List[str]:
+    """
+    保持期間を過ぎたパーティション名を抽出
+    パーティションの終了日が保持期間の開始以前のものだけを対象にする。
+    Args:
+        partitions: (パーティション名, 開始日, 終了日)のリスト（デフォルトパーティションは日付がNone）
+        today: 基準日
+        retention_days: 保持日数
+    Returns:
+        List[str]: DROPしてよいパーティション名
+    """
+    cutoff = today - timedelta(days=retention_days)
+    return sorted(name for name, _, end in partitions if end is not None and end <= cutoff)
+
+
+def _overlaps(start: date, end: date, partitions: List[Tuple[str, Optional[date], Optional[date]]]) -> bool:
+    """既存のパーティションと範囲が重なるか（間隔の設定を変えた場合の保護）"""
+    return any(
+        other_start is not None and other_start < end and start < other_end
+        for _, other_start, other_end in partitions
+    )
+
+
+async def _list_partitions(conn: AsyncConnection, table: str) -> List[Tuple[str, Optional[date], Optional[date]]]:
+    """親テーブルに属するパーティションと範囲を取得"""
+    result = await conn.execute(
+        text(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) FROM pg_inherits "
+            "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+            "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+            "WHERE parent.relname = :table"
+        ),
+        {"table": table},
+    )
+    partitions = []
+    for name, bound in result:
+        match = _PARTITION_BOUND.search(bound or "")
+        if match:
+            start, end = (_bound_date(value) for value in match.groups())
+            partitions.append((name, start, end))
+        else:
+            partitions.append((name, None, None))
+    return partitions
+
+
+async def _create_partition(
+    conn: AsyncConnection, table: str, name: str, start: date, end: date, default: Optional[str]
+) -> int:
+    """
+    パーティションを作成（トランザクション中に呼び出す）
+    デフォルトパーティションに範囲内の行があるとPARTITION OFでの作成は失敗するため、
+    その場合は独立したテーブルを作成して行を移してからATTACHする。
+    Returns:
+        int: デフォルトパーティションから移した行数
+    """
+    bound = partition_bound(start, end)
+    in_range = {"start": _utc_midnight(start), "end": _utc_midnight(end)}
+    has_rows = default is not None and (await conn.execute(
+        text(f'SELECT EXISTS (SELECT 1 FROM "{default}" WHERE timestamp >= :start AND timestamp < :end)'),
+        in_range,
+    )).scalar()
+    if not has_rows:
+        await conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" {bound}'))
+        return 0
+
+    await conn.execute(text(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    moved = await conn.execute(
+        text(
+            f'WITH moved AS (DELETE FROM "{default}" WHERE timestamp >= :start AND timestamp < :end RETURNING *) '
+            f'INSERT INTO "{name}" SELECT * FROM moved'
+        ),
+        in_range,
+    )
+    await conn.execute(text(f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" {bound}'))
+    return moved.rowcount
+
+
+@asynccontextmanager
+async def _autocommit(conn: AsyncConnection) -> AsyncIterator[None]:
+    """トランザクションブロックの外で実行する必要がある文のため、一時的にAUTOCOMMITにする"""
+    await conn.execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        yield
+    finally:
+        await conn.execution_options(isolation_level=conn.sync_connection.default_isolation_level)
+
+
+async def _drop_partition(conn: AsyncConnection, table: str, name: str, default: Optional[str]) -> None:
+    """
+    期限切れのパーティションを切り離してからDROPする
+    アタッチしたままDROPすると親テーブルのACCESS EXCLUSIVEロックを取るため、
+    その間ログの書き込みや管理画面の読み取りが止まる。先に切り離しておけば、DROPは
+    切り離したテーブルだけをロックする。
+    デフォルトパーティションがなければDETACH ... CONCURRENTLY（親はSHARE UPDATE EXCLUSIVEのみ）を
+    トランザクションの外で実行する。中断されて切り離し待ちになっていればFINALIZEで完了させる。
+    PostgreSQLはデフォルトパーティションを持つ親ではCONCURRENTLYを使えないため、その場合は
+    lock_timeoutを付けた短いトランザクションで切り離す（親のロックはカタログの更新の間だけ）。
+    """
+    if default is None:
+        async with _autocommit(conn):
+            pending = (await conn.execute(
+                text("SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = CAST(:name AS regclass)"),
+                {"name": f'"{name}"'},
+            )).scalar()
+            mode = "FINALIZE" if pending else "CONCURRENTLY"
+            await conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}" {mode}'))
+    else:
+        async with conn.begin():
+            await conn.execute(text(f"SET LOCAL lock_timeout = '{_DETACH_LOCK_TIMEOUT}'"))
+            await conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+    async with conn.begin():
+        await conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+
+
+async def _maintain_table(
+    conn: AsyncConnection,
+    table: str,
+    today: date,
+    interval: str,
+    precreate: int,
+    retention_days: int,
+    created: List[str],
+    dropped: List[str],
+) -> None:
+    """1つのテーブルのパーティションを作成・削除（操作ごとにコミット）"""
+    cutoff = _utc_midnight(today - timedelta(days=retention_days))
+    async with conn.begin():
+        existing = await _list_partitions(conn, table)
+    default = next((name for name, start, _ in existing if start is None), None)
+
+    for start, end in planned_partitions(today, interval, precreate):
+        if _overlaps(start, end, existing):
+            continue
+        name = partition_name(table, start)
+        async with conn.begin():
+            moved = await _create_partition(conn, table, name, start, end, default)
+        created.append(name)
+        if moved:
+            logger.info(f"デフォルトパーティションから{name}へ{moved}件を移しました")
+
+    for name in expired_partitions(existing, today, retention_days):
+        await _drop_partition(conn, table, name, default)
+        dropped.append(name)
+
+    # デフォルトパーティションの行はDROPで消えないため、期限切れの行を削除する
+    if default is not None:
+        async with conn.begin():
+            await conn.execute(text(f'DELETE FROM "{default}" WHERE timestamp < :cutoff'), {"cutoff": cutoff})
+
+
+async def maintain_partitions(
+    conn: AsyncConnection,
+    today: Optional[date] = None,
+    interval: Optional[str] = None,
+    precreate: Optional[int] = None,
+    retention_days: Optional[int] = None,
+) -> Tuple[List[str], List[str]]:
+    """
+    パーティションの事前作成と期限切れパーティション・デフォルトパーティションの行の削除
+    パーティション1つの作成・削除ごとにトランザクションをコミットする。
+    Args:
+        conn: トランザクションを開始していない接続（PostgreSQL）
+        today: 基準日（省略時はUTCの今日）
+        interval: daily / weekly（省略時は設定値）
+        precreate: 事前作成するパーティション数（省略時は設定値）
+        retention_days: 保持日数（省略時は設定値）
+    Returns:
+        Tuple[List[str], List[str]]: (作成したパーティション, 削除したパーティション)。
+            他のワーカーが実行中の場合は何もせず空のリストを返す
+    """
+    today = today or datetime.now(timezone.utc).date()
+    interval = interval or settings.log_partition_interval
+    precreate = settings.log_partition_precreate if precreate is None else precreate
+    retention_days = settings.log_retention_days if retention_days is None else retention_days
+
+    # トランザクションをまたいで保持するセッション単位のロックで、他ワーカーとの競合を防ぐ
+    locked = (await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _ADVISORY_LOCK_KEY})).scalar()
+    await conn.commit()
+    if not locked:
+        return [], []
+
+    created, dropped = [], []
+    try:
+        for table in PARTITIONED_LOG_TABLES:
+            try:
+                await _maintain_table(conn, table, today, interval, precreate, retention_days, created, dropped)
+            except Exception:
+                # 1つのテーブルの失敗で他のテーブルのメンテナンスを止めない
+                logger.exception(f"{table}のパーティションメンテナンスに失敗しました")
+    finally:
+        await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+        await conn.commit()
+
+    return created, dropped
+
+
+async def run_partition_maintenance(engine: AsyncEngine) -> Tuple[List[str], List[str]]:
+    """
+    パーティションメンテナンスを1回実行（PostgreSQL以外では何もしない）
+    Args:
+        engine: 対象のエンジン
+    Returns:
+        Tuple[List[str], List[str]]: (作成したパーティション, 削除したパーティション)
+    """
+    if engine.dialect.name != "postgresql":
+        return [], []
+    async with engine.connect() as conn:
+        created, dropped = await maintain_partitions(conn)
+    if created or dropped:
+        logger.info(f"ログのパーティションを更新しました: 作成{len(created)}件, 削除{len(dropped)}件")
+    return created, dropped
+
+
+async def _maintenance_loop(engine: AsyncEngine) -> None:
+    """一定間隔でパーティションメンテナンスを実行"""
+    while True:
+        try:
+            await run_partition_maintenance(engine)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("ログのパーティションメンテナンスに失敗しました")
+        try:
+            await prune_rollups(engine)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("パフォーマンスロールアップの削除に失敗しました")
+        await asyncio.sleep(settings.log_partition_maintenance_interval_seconds)
+
+
+async def start_partition_maintenance(engine: AsyncEngine) -> None:
+    """パーティションメンテナンスの定期実行を開始"""
+    global _maintenance_task
+    if _maintenance_task is None or _maintenance_task.done():
+        _maintenance_task = asyncio.create_task(_maintenance_loop(engine))
+
+
+async def stop_partition_maintenance() -> None:
+    """パーティションメンテナンスの定期実行を停止"""
+    global _maintenance_task
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        try:
+            await _maintenance_task
+        except asyncio.CancelledError:
+            pass
+        _maintenance_task = None
@@ -0,0 +1,231 @@
+"""
+パフォーマンスログの事前集計（ロールアップ）
+
+AsyncLogHandlerがパフォーマンスログを書き込むたびに、同じトランザクションで
+分単位・時間単位のバケットへ(endpoint, request_method, status_class)ごとに
+件数・合計・最小・最大・レイテンシヒストグラムを加算する。
+分析API（LogManager.analyze_performance / get_slow_endpoints）は生ログではなく
+時間単位のロールアップを読むため、30日分の表示でも走査する行数は
+エンドポイント数×時間数程度に収まる。
+分単位のロールアップは直近の詳細表示用で、log_rollup_minute_retention_hoursを
+過ぎたものはパーティションメンテナンスのジョブが削除する。
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.config import settings
+from app.db.models.log import PerformanceRollup
+from app.logs.histogram import LatencyHistogram
+
+logger = logging.getLogger("app")
+
+GRANULARITIES = ("minute", "hour")
+
+# (granularity, bucket_start, endpoint, request_method, status_class)
+RollupKey = Tuple[str, datetime, str, str, str]
+
+
+class RollupDelta:
+    """1つのキーに加算する集計値"""
+
+    __slots__ = ("count", "total", "min", "max", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max: Optional[int] = None
+        self.histogram = LatencyHistogram()
+
+    def add(self, response_time: int) -> None:
+        """レスポンスタイムを1件加算"""
+        self.count += 1
+        self.total += response_time
+        self.min = response_time if self.min is None else min(self.min, response_time)
+        self.max = response_time if self.max is None else max(self.max, response_time)
+        self.histogram.record(response_time)
+
+
+def status_class(status_code: Optional[int]) -> str:
+    """ステータスコードの分類（例: 404 -> 4xx、不明なら空文字）"""
+    if not status_code:
+        return ""
+    return f"{int(status_code) // 100}xx"
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """
+    バケットの開始時刻（UTC）
+    Args:
+        timestamp: ログの時刻（タイムゾーンなしはUTCとみなす）
+        granularity: minute / hour
+    Returns:
+        datetime: 切り捨てた時刻
+    """
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    timestamp = timestamp.astimezone(timezone.utc)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def build_rollups(perf_logs: Iterable[Dict[str, Any]], now: Optional[datetime] = None) -> Dict[RollupKey, RollupDelta]:
+    """
+    パフォーマンスログをバケットごとに集計
+    Args:
+        perf_logs: パフォーマンスログのデータ（timestampがなければnowで集計）
+        now: timestampがないログに使う時刻（省略時は現在時刻）
+    Returns:
+        Dict[RollupKey, RollupDelta]: キーごとの加算値
+    """
+    now = now or datetime.now(timezone.utc)
+    deltas: Dict[RollupKey, RollupDelta] = {}
+    for log in perf_logs:
+        response_time = log.get("response_time")
+        if response_time is None:
+            continue
+        timestamp = log.get("timestamp") or now
+        endpoint = log.get("endpoint") or ""
+        method = log.get("request_method") or ""
+        status = status_class(log.get("status_code"))
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(timestamp, granularity), endpoint, method, status)
+            delta = deltas.get(key)
+            if delta is None:
+                delta = deltas[key] = RollupDelta()
+            delta.add(int(response_time))
+    return deltas
+
+
+def _normalize_key(key: RollupKey) -> RollupKey:
+    """DBから読んだキーと比較できる形にする（SQLiteはタイムゾーンを保持しないため）"""
+    granularity, start, endpoint, method, status = key
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    return granularity, start.astimezone(timezone.utc), endpoint, method, status
+
+
+def _insert_ignoring_conflicts(dialect: str):
+    """既存のキーを無視するINSERT文（PostgreSQL / SQLite）"""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(PerformanceRollup).on_conflict_do_nothing(index_elements=[
+        "granularity", "bucket_start", "endpoint", "request_method", "status_class",
+    ])
+
+
+async def apply_rollups(session: AsyncSession, deltas: Dict[RollupKey, RollupDelta]) -> int:
+    """
+    集計値をロールアップテーブルへ加算（呼び出し側のトランザクション内で実行）
+
+    キーの行がなければ0件の行を作成し、行ロックを取ってから加算する。
+    ヒストグラムの加算はDBの関数に依存しないようPythonで行う。
+    ワーカー間でデッドロックしないよう、キーは常に同じ順序で処理する。
+    Args:
+        session: トランザクション中のセッション
+        deltas: build_rollupsの結果
+    Returns:
+        int: 更新した行数
+    """
+    if not deltas:
+        return 0
+    keys = sorted(deltas)
+
+    insert_stmt = _insert_ignoring_conflicts(session.bind.dialect.name)
+    empty_rows = [
+        {
+            "granularity": granularity,
+            "bucket_start": start,
+            "endpoint": endpoint,
+            "request_method": method,
+            "status_class": status,
+            "request_count": 0,
+            "total_time_ms": 0,
+        }
+        for granularity, start, endpoint, method, status in keys
+    ]
+
+    columns = (
+        PerformanceRollup.granularity,
+        PerformanceRollup.bucket_start,
+        PerformanceRollup.endpoint,
+        PerformanceRollup.request_method,
+        PerformanceRollup.status_class,
+    )
+    lock_query = (
+        select(PerformanceRollup.id, *columns, PerformanceRollup.request_count, PerformanceRollup.total_time_ms,
+               PerformanceRollup.min_time_ms, PerformanceRollup.max_time_ms, PerformanceRollup.histogram)
+        .where(tuple_(*columns).in_(keys))
+        .order_by(PerformanceRollup.id)
+        .with_for_update()
+    )
+
+    if insert_stmt is not None:
+        await session.execute(insert_stmt, empty_rows)
+        rows = (await session.execute(lock_query)).all()
+    else:
+        # ON CONFLICTのないDBでは、存在しないキーだけを追加する
+        rows = (await session.execute(lock_query)).all()
+        existing = {_normalize_key(tuple(row[1:6])) for row in rows}
+        missing = [row for key, row in zip(keys, empty_rows) if _normalize_key(key) not in existing]
+        if missing:
+            await session.execute(PerformanceRollup.__table__.insert(), missing)
+            rows = (await session.execute(lock_query)).all()
+
+    by_key = {_normalize_key(key): delta for key, delta in deltas.items()}
+    updates = []
+    for row in rows:
+        delta = by_key.get(_normalize_key(tuple(row[1:6])))
+        if delta is None:
+            continue
+        histogram = LatencyHistogram.from_list(row.histogram).merge(delta.histogram)
+        updates.append({
+            "id": row.id,
+            "request_count": row.request_count + delta.count,
+            "total_time_ms": row.total_time_ms + delta.total,
+            "min_time_ms": delta.min if row.min_time_ms is None else min(row.min_time_ms, delta.min),
+            "max_time_ms": delta.max if row.max_time_ms is None else max(row.max_time_ms, delta.max),
+            "histogram": histogram.to_list(),
+        })
+    if updates:
+        await session.execute(update(PerformanceRollup), updates)
+    return len(updates)
+
+
+async def prune_rollups(engine: AsyncEngine, now: Optional[datetime] = None) -> int:
+    """
+    保持期間を過ぎたロールアップを削除
+    分単位はlog_rollup_minute_retention_hours、時間単位はlog_rollup_hour_retention_daysで判定する。
+    Args:
+        engine: 対象のエンジン
+        now: 基準時刻（省略時は現在時刻）
+    Returns:
+        int: 削除した行数
+    """
+    now = now or datetime.now(timezone.utc)
+    cutoffs = {
+        "minute": now - timedelta(hours=settings.log_rollup_minute_retention_hours),
+        "hour": now - timedelta(days=settings.log_rollup_hour_retention_days),
+    }
+    deleted = 0
+    async with engine.begin() as conn:
+        for granularity, cutoff in cutoffs.items():
+            result = await conn.execute(
+                delete(PerformanceRollup).where(
+                    PerformanceRollup.granularity == granularity,
+                    PerformanceRollup.bucket_start < cutoff,
+                )
+            )
+            deleted += result.rowcount or 0
+    if deleted:
+        logger.info(f"期限切れのパフォーマンスロールアップを削除しました: {deleted}件")
+    return deleted
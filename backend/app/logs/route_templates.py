@@ -0,0 +1,76 @@
+"""
+リクエストパスとルートテンプレートの対応付け
+
+LoggingMiddlewareはルーティング後のscopeから一致したルートのテンプレート
+（例: /api/v1/tasks/{task_id}）を直接取得する。このモジュールは、テンプレート導入前に
+実パスで記録されたログやロールアップを書き換える（マイグレーション）ために、
+パスからテンプレートを逆引きする。
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+from starlette.routing import Mount, Route, WebSocketRoute
+
+RouteTemplates = List[Tuple[Pattern, str]]
+
+# ルートに一致しなかったリクエストのラベル（パスをそのまま使うとラベルが増え続けるため）
+# マイグレーションからも使うため、設定やアプリを読み込まないこのモジュールで定義する
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def compile_route_templates(routes: Iterable, prefix: str = "") -> RouteTemplates:
+    """
+    ルート一覧からパスの照合用パターンを作成
+    Args:
+        routes: FastAPI / Starletteのルート
+        prefix: include_routerで付けたプレフィックス（例: /api/v1）
+    Returns:
+        RouteTemplates: (パスのパターン, テンプレート)のリスト（定義順）
+    """
+    templates: RouteTemplates = []
+    for route in routes:
+        if isinstance(route, Mount):
+            templates += compile_route_templates(route.routes or [], prefix + route.path)
+        elif isinstance(route, (Route, WebSocketRoute)):
+            pattern = route.path_regex.pattern
+            if prefix:
+                # path_regexは"^/..."で始まるので、その直後にプレフィックスを挿入する
+                pattern = "^" + re.escape(prefix) + pattern[1:]
+            templates.append((re.compile(pattern), prefix + route.path))
+    return templates
+
+
+def match_route_template(path: str, templates: RouteTemplates) -> Optional[str]:
+    """
+    パスに一致するルートのテンプレート
+    Args:
+        path: リクエストパス
+        templates: compile_route_templatesの結果
+    Returns:
+        Optional[str]: テンプレート。一致しなければNone
+    """
+    for pattern, template in templates:
+        if pattern.match(path):
+            return template
+    return None
+
+
+def endpoint_rewrites(endpoints: Iterable[Optional[str]], templates: RouteTemplates) -> Dict[str, str]:
+    """
+    記録済みのエンドポイントのうち、テンプレートに書き換えるものの対応表
+    既にテンプレートのもの、どのルートにも一致しないものは含めない。
+    Args:
+        endpoints: 記録済みのエンドポイント
+        templates: compile_route_templatesの結果
+    Returns:
+        Dict[str, str]: {実パス: テンプレート}
+    """
+    known = {template for _, template in templates}
+    rewrites = {}
+    for endpoint in endpoints:
+        if not endpoint or endpoint in known or endpoint == UNMATCHED_ROUTE:
+            continue
+        template = match_route_template(endpoint, templates)
+        if template is not None and template != endpoint:
+            rewrites[endpoint] = template
+    return rewrites
@@ -0,0 +1,204 @@
+"""
+ログの退避用ディスクバッファ
+
+データベースに書き込めない間、AsyncLogHandlerのワーカーはログを
+追記専用のセグメントファイル（メモリマップ）へ退避し、復旧後や次回起動時に
+古い順に再生する。
+このモジュールの操作はすべて同期的なファイルI/O（mmapへの書き込み・msync・読み出し）で、
+ワーカーも同じイベントループ上で動くため、AsyncLogHandlerはasyncio.to_threadで
+スレッドに渡して呼び出す（ディスクが遅くてもリクエスト処理は止まらない）。
+ワーカー1つから順に呼び出す前提で、同時呼び出しに対するロックは持たない。
+
+セグメントのレコード形式（リトルエンディアン）:
+    長さ(4バイト) + CRC32(4バイト) + JSON本文
+長さ0はセグメントの終端を表す。CRCが一致しないレコード（書き込み途中で
+プロセスが終了した場合など）以降は読み飛ばす。
+"""
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+_HEADER = struct.Struct("<II")
+_SEGMENT_SUFFIX = ".seg"
+
+
+class SpillSegment:
+    """メモリマップした1つのセグメントファイル"""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            # 事前に領域を確保しておく（未使用部分は0埋めで終端扱い）
+            with open(path, "wb") as f:
+                f.truncate(size)
+        self._file = open(path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self.offset = self._find_end()
+
+    @property
+    def size(self) -> int:
+        return len(self._map)
+
+    def _find_end(self) -> int:
+        """有効なレコードの末尾位置を探す"""
+        offset = 0
+        for _, end in self._iter_records():
+            offset = end
+        return offset
+
+    def _iter_records(self):
+        offset = 0
+        while offset + _HEADER.size <= self.size:
+            length, checksum = _HEADER.unpack_from(self._map, offset)
+            start = offset + _HEADER.size
+            if length == 0 or start + length > self.size:
+                return
+            payload = self._map[start:start + length]
+            if zlib.crc32(payload) != checksum:
+                return
+            yield payload, start + length
+            offset = start + length
+
+    def has_room(self, length: int) -> bool:
+        """レコード1件分の空きがあるか"""
+        return self.offset + _HEADER.size + length <= self.size
+
+    def append(self, payload: bytes) -> None:
+        """レコードを追記"""
+        _HEADER.pack_into(self._map, self.offset, len(payload), zlib.crc32(payload))
+        start = self.offset + _HEADER.size
+        self._map[start:start + len(payload)] = payload
+        self.offset = start + len(payload)
+
+    def read(self) -> List[bytes]:
+        """全レコードを読み出す"""
+        return [payload for payload, _ in self._iter_records()]
+
+    def sync(self) -> None:
+        """ディスクへ書き出す（msync）"""
+        self._map.flush()
+
+    def close(self) -> None:
+        if not self._map.closed:
+            self._map.flush()
+            self._map.close()
+        self._file.close()
+
+
+class SpillBuffer:
+    """
+    追記専用のセグメントファイル群
+
+    Args:
+        directory: セグメントファイルを置くディレクトリ
+        segment_size: 1セグメントのサイズ（バイト）
+        fsync: always（追記ごと）/ interval（fsync_interval_ms間隔）/ never（OS任せ）
+        fsync_interval_ms: intervalのときの同期間隔（ミリ秒）
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = 16 * 1024 * 1024,
+        fsync: str = "interval",
+        fsync_interval_ms: int = 1000,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"未対応のfsync方式です: {fsync}")
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval_ms / 1000
+        os.makedirs(directory, exist_ok=True)
+        self._active: Optional[SpillSegment] = None
+        self._last_sync = time.monotonic()
+        self.spilled = 0
+        self.replayed = 0
+
+    def _segment_paths(self) -> List[str]:
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(_SEGMENT_SUFFIX))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _next_segment_path(self) -> str:
+        paths = self._segment_paths()
+        sequence = int(os.path.basename(paths[-1])[:-len(_SEGMENT_SUFFIX)]) + 1 if paths else 1
+        return os.path.join(self.directory, f"{sequence:020d}{_SEGMENT_SUFFIX}")
+
+    def has_pending(self) -> bool:
+        """再生待ちのレコードがあるか"""
+        return bool(self._segment_paths())
+
+    def append(self, records: Sequence[Tuple[str, Dict[str, Any]]]) -> None:
+        """
+        レコードを追記
+        Args:
+            records: (ログ種別, ログデータ)のリスト
+        """
+        now = datetime.now().astimezone().isoformat()
+        for kind, data in records:
+            # 再生時に書き込み時刻ではなく発生時刻が残るよう、時刻を確定させておく
+            data = {**data, "timestamp": data.get("timestamp") or now}
+            payload = json.dumps({"type": kind, "data": data}, default=str).encode()
+            if self._active is None or not self._active.has_room(len(payload)):
+                self._seal()
+                size = max(self.segment_size, _HEADER.size * 2 + len(payload))
+                self._active = SpillSegment(self._next_segment_path(), size)
+            self._active.append(payload)
+            self.spilled += 1
+
+        if self.fsync == "always" or (
+            self.fsync == "interval" and time.monotonic() - self._last_sync >= self.fsync_interval
+        ):
+            self._active.sync()
+            self._last_sync = time.monotonic()
+
+    def _seal(self) -> None:
+        """追記中のセグメントを閉じる"""
+        if self._active is not None:
+            self._active.close()
+            self._active = None
+
+    def oldest(self) -> Optional[Tuple[str, List[Tuple[str, Dict[str, Any]]]]]:
+        """
+        最も古いセグメントを読み出す（追記中のセグメントは閉じてから読む）
+        Returns:
+            Optional[Tuple[str, List]]: (セグメントのパス, (ログ種別, ログデータ)のリスト)
+        """
+        paths = self._segment_paths()
+        if not paths:
+            return None
+        if self._active is not None and self._active.path == paths[0]:
+            self._seal()
+        segment = SpillSegment(paths[0], self.segment_size)
+        try:
+            records = []
+            for payload in segment.read():
+                record = json.loads(payload)
+                data = record["data"]
+                if isinstance(data.get("timestamp"), str):
+                    data["timestamp"] = datetime.fromisoformat(data["timestamp"])
+                records.append((record["type"], data))
+        finally:
+            segment.close()
+        return paths[0], records
+
+    def remove(self, path: str, replayed: int = 0) -> None:
+        """
+        再生済みのセグメントを削除
+        Args:
+            path: セグメントのパス
+            replayed: 再生したレコード数（統計用）
+        """
+        os.remove(path)
+        self.replayed += replayed
+
+    def close(self) -> None:
+        """追記中のセグメントを同期して閉じる"""
+        self._seal()
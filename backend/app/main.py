@@ -5,15 +5,24 @@ import json
 import logging
 import os
 from pathlib import Path
-from fastapi import FastAPI, Request, Depends
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.api.v1.router import router as v1_router
-from app.database import get_db
+from app.database import dispose_engines, engine, read_engine
 from app.exceptions import setup_exception_handlers
 from app.logs.middleware import LoggingMiddleware
 from app.logs.async_log_handler import async_log_handler
+from app.logs.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics
+from app.logs.partitions import start_partition_maintenance, stop_partition_maintenance
+from app.core.cache import (
+    check_redis_health,
+    close_redis,
+    start_invalidation_listener,
+    stop_invalidation_listener,
+)
 from app.config import settings
 
 # ロガー設定
@@ -38,21 +47,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
     allow_headers=["Authorization", "Content-Type", "X-API-Key", "Accept-Language"],
-    expose_headers=["Content-Disposition"],
+    expose_headers=["Content-Disposition", "X-Next-Cursor"],
     max_age=600,  # プリフライトリクエストのキャッシュ時間（秒）
 )
 
 # レート制限ミドルウェア追加（設定で有効な場合）
 if settings.rate_limit_enabled:
-    from app.core.rate_limiter import RateLimiter
+    from app.core.rate_limiter import RateLimiter, parse_route_limits
     from app.core.cache import redis_client
     app.add_middleware(
         RateLimiter,
         redis_client=redis_client,
         limit=settings.rate_limit_requests,
-        timeframe=settings.rate_limit_timeframe_seconds
+        timeframe=settings.rate_limit_timeframe_seconds,
+        strategy=settings.rate_limit_strategy,
+        user_limit=settings.rate_limit_user_requests,
+        route_limits=parse_route_limits(settings.rate_limit_route_limits),
+        local_max_entries=settings.rate_limit_local_max_entries,
+        local_sync_seconds=settings.rate_limit_local_sync_seconds,
     )
 
+# レプリカを使う場合、変更を行ったユーザーの読み取りを一定時間プライマリに送る
+if settings.database_read_url:
+    from app.db.routing import ReadYourWritesMiddleware, recent_writes
+    app.add_middleware(ReadYourWritesMiddleware, recent_writes=recent_writes)
+
 # ロギングミドルウェア追加
 app.add_middleware(LoggingMiddleware)
 
@@ -77,24 +96,45 @@ def ping():
     """
     return {"message": "pong"}
 
+if settings.metrics_enabled:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """
+        Prometheus形式のメトリクス（ワーカー単位）
+        ルート別のレイテンシヒストグラム・ステータス別件数、DBプール（取り出し待ち時間を含む）、
+        L1キャッシュ、ログキューの状態を返す。
+        DBやRedisには問い合わせない。集計値はイベントループ上で更新されるため、
+        スレッドプールで読まないようasync defで定義する。
+        """
+        engines = {"app": engine, "log": async_log_handler.engine}
+        if read_engine is not engine:
+            engines["read"] = read_engine
+        body = render_metrics(engines)
+        return Response(content=body, media_type=METRICS_CONTENT_TYPE)
+
 # アプリケーション起動/終了イベント
 @app.on_event("startup")
 async def startup_event():
     """アプリケーション起動時の処理"""
     # ログハンドラーの起動
     await async_log_handler.start()
+    # ログテーブルのパーティション作成・期限切れ削除（ログ用のプールを使用）
+    await start_partition_maintenance(async_log_handler.engine)
+    # Redis接続プールのヘルスチェック
+    await check_redis_health()
+    # プロセス内キャッシュの無効化通知購読を開始
+    await start_invalidation_listener()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """アプリケーション終了時の処理"""
+    # キャッシュ無効化通知の購読を停止
+    await stop_invalidation_listener()
+    # パーティションメンテナンスの停止
+    await stop_partition_maintenance()
     # ログハンドラーの停止
     await async_log_handler.stop()
-
-# リクエストごとのDBセッション設定
-@app.middleware("http")
-async def db_session_middleware(request: Request, call_next):
-    """リクエストごとにDBセッションを設定"""
-    db = next(get_db())
-    request.state.db = db
-    response = await call_next(request)
-    return response
+    # Redis接続プールを閉じる
+    await close_redis()
+    # DBの接続プールを閉じる
+    await dispose_engines()
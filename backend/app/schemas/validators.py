@@ -142,6 +142,25 @@ def validate_postal_code(postal_code: Optional[str]) -> Optional[str]:
     cleaned_code = postal_code.replace('-', '')
     return f"{cleaned_code[:3]}-{cleaned_code[3:]}"
 
+# お願いごとの説明のバリデーション
+def validate_task_description(description: str) -> str:
+    """
+    お願いごとの説明が内容のある文章かどうかを検証
+    
+    Args:
+        description: 検証する説明
+        
+    Returns:
+        検証済みの説明
+        
+    Raises:
+        ValueError: 空白のみ、または短すぎる場合
+    """
+    if len(description.strip()) < 5:
+        raise ValueError("お願いごとの説明は空白を除いて5文字以上にしてください")
+    
+    return description
+
 # JSON構造の検証
 def validate_recipe_content(recipe_content: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
     """
@@ -10,6 +10,7 @@ from app.core.auth import (verify_password, get_password_hash, create_access_tok
                           create_refresh_token, decode_jwt_token, ACCESS_TOKEN_EXPIRE_MINUTES)
 from app.crud.users import get_user_by_username, get_user_by_email, create_user, update_user_password
 from app.db.models.user import User
+from app.db.unit_of_work import unit_of_work
 import secrets
 import logging
 
@@ -61,7 +62,8 @@ async def register_user(db: AsyncSession, username: str, email: str, password: s
         
     # ユーザー作成
     hashed_password = get_password_hash(password)
-    user = await create_user(db, username=username, email=email, password_hash=hashed_password)
+    async with unit_of_work(db):
+        user = await create_user(db, username=username, email=email, password_hash=hashed_password)
     return user
 
 async def create_auth_tokens(user_id: int) -> Dict[str, str]:
@@ -159,7 +161,8 @@ async def confirm_password_reset(db: AsyncSession, token: str, new_password: str
     
     # パスワードの更新
     hashed_password = get_password_hash(new_password)
-    await update_user_password(db, user_id, hashed_password)
+    async with unit_of_work(db):
+        await update_user_password(db, user_id, hashed_password)
     
     # 使用済みトークンを削除
     del password_reset_tokens[token]
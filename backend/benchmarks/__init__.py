@@ -0,0 +1 @@
+# ベンチマークパッケージ初期化
@@ -0,0 +1,132 @@
+"""
+キャッシュシリアライザのマイクロベンチマーク
+
+従来のJSON経路（json.dumps(default=str) + json.loads + スキーマ検証）と
+各シリアライザのエンコード/デコード時間・ペイロードサイズを、実際にキャッシュする
+レスポンススキーマ（TaskResponse / RecipeRequestResponse）で比較する。
+
+実行方法（backendディレクトリで）:
+    python -m benchmarks.cache_serializer_benchmark
+"""
+import json
+import timeit
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, List
+
+from pydantic import BaseModel, TypeAdapter
+
+from app.core.cache_serializers import (
+    CompressedSerializer,
+    JSONSerializer,
+    MsgpackSerializer,
+    PydanticSerializer,
+    lz4_frame,
+    msgpack,
+)
+from app.schemas.recipe_request import RecipeRequestResponse
+from app.schemas.task import TaskResponse
+
+ITERATIONS = 2000
+
+NOW = datetime(2025, 5, 3, 7, 7, 34, tzinfo=timezone.utc)
+
+# スキーマのバリデータ（validate_future_date）を通るよう、予定日は実行日より後にする
+SCHEDULED_DATE = date.today() + timedelta(days=30)
+
+
+def build_tasks(count: int = 50) -> List[TaskResponse]:
+    """お願いごと一覧エンドポイント相当のペイロードを作成"""
+    return [
+        TaskResponse.model_validate({
+            "id": i,
+            "user_id": i % 7,
+            "title": f"買い物のお願い {i}",
+            "description": "牛乳と卵とパンを買ってきてください。" * 3,
+            "priority": 3,
+            "scheduled_date": SCHEDULED_DATE,
+            "status": "pending",
+            "location": "近所のスーパー",
+            "estimated_time": 30,
+            "created_at": NOW,
+            "updated_at": NOW,
+        })
+        for i in range(count)
+    ]
+
+
+def build_recipe_requests(count: int = 50) -> List[RecipeRequestResponse]:
+    """料理リクエスト一覧エンドポイント相当のペイロードを作成（JSONのレシピ内容を含む）"""
+    return [
+        RecipeRequestResponse.model_validate({
+            "id": i,
+            "user_id": i % 7,
+            "title": f"肉じゃが {i}",
+            "description": "薄味でお願いします。",
+            "recipe_url": "https://cookpad.com/recipe/1234567",
+            "recipe_content": {
+                "title": "肉じゃが",
+                "ingredients": [
+                    {"name": "じゃがいも", "amount": "3個"},
+                    {"name": "牛肉", "amount": "200g"},
+                    {"name": "玉ねぎ", "amount": "1個"},
+                ],
+                "steps": ["材料を切る", "炒める", "煮込む"],
+            },
+            "scheduled_date": SCHEDULED_DATE,
+            "notes": "えびアレルギーあり",
+            "priority": 2,
+            "status": "pending",
+            "created_at": NOW,
+            "updated_at": NOW,
+        })
+        for i in range(count)
+    ]
+
+
+def bench(name: str, encode: Callable[[], Any], decode: Callable[[Any], Any]) -> None:
+    """エンコード/デコードを計測して1行で表示"""
+    data = encode()
+    size = len(data)
+    encode_us = timeit.timeit(encode, number=ITERATIONS) / ITERATIONS * 1e6
+    decode_us = timeit.timeit(lambda: decode(data), number=ITERATIONS) / ITERATIONS * 1e6
+    print(f"{name:<24} {encode_us:>10.1f} {decode_us:>10.1f} {size:>10}")
+
+
+def run(title: str, schema: Any, payload: List[BaseModel]) -> None:
+    """1つのスキーマについて各シリアライザを計測"""
+    adapter = TypeAdapter(schema)
+
+    print(f"\n{title} ({len(payload)}件)")
+    print(f"{'serializer':<24} {'encode(us)':>10} {'decode(us)':>10} {'bytes':>10}")
+
+    # 従来経路: dictに変換してJSON化し、取得後にスキーマ検証して型を戻す
+    legacy = JSONSerializer()
+    dicts = [item.model_dump() for item in payload]
+    bench(
+        "json (legacy)",
+        lambda: legacy.dumps(dicts),
+        lambda data: adapter.validate_python(json.loads(data)),
+    )
+
+    pydantic_serializer = PydanticSerializer(schema)
+    bench("pydantic", lambda: pydantic_serializer.dumps(payload), pydantic_serializer.loads)
+
+    zlib_serializer = CompressedSerializer(pydantic_serializer, "zlib", threshold=1024)
+    bench("pydantic+zlib", lambda: zlib_serializer.dumps(payload), zlib_serializer.loads)
+
+    if lz4_frame is not None:
+        lz4_serializer = CompressedSerializer(pydantic_serializer, "lz4", threshold=1024)
+        bench("pydantic+lz4", lambda: lz4_serializer.dumps(payload), lz4_serializer.loads)
+
+    if msgpack is not None:
+        msgpack_serializer = MsgpackSerializer()
+        bench("msgpack", lambda: msgpack_serializer.dumps(dicts), msgpack_serializer.loads)
+
+
+def main() -> None:
+    run("TaskResponse", List[TaskResponse], build_tasks())
+    run("RecipeRequestResponse", List[RecipeRequestResponse], build_recipe_requests())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+ミドルウェアのベンチマーク
+
+BaseHTTPMiddleware版（従来）と純粋なASGI版のRateLimiter/LoggingMiddlewareを
+同じ構成で積み、/pingと一覧エンドポイントのreq/sとp99レイテンシを比較する。
+Redisとログ保存はスタブに置き換え（ASGI版はキューへの追加のみ）、
+ミドルウェア自体のオーバーヘッドのみを測る。
+
+実行方法（backendディレクトリで）:
+    python -m benchmarks.middleware_benchmark
+"""
+import asyncio
+import statistics
+import time
+from typing import List
+from unittest.mock import patch
+
+import httpx
+from fastapi import FastAPI
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+
+from app.core.rate_limiter import RateLimiter
+from app.logs.middleware import LoggingMiddleware
+from app.logs.performance_logger import PerformanceLogger
+
+REQUESTS = 2000
+WARMUP = 100
+
+
+class FakeRedis:
+    """Luaスクリプトを常に許可で返すRedisのスタブ"""
+
+    def register_script(self, script: str):
+        async def run(keys=None, args=None):
+            return [1, 99, 60000]
+        return run
+
+
+class LegacyRateLimiter(BaseHTTPMiddleware):
+    """従来のBaseHTTPMiddleware版（判定処理はASGI版と共通）"""
+
+    def __init__(self, app, **kwargs):
+        super().__init__(app)
+        self.limiter = RateLimiter(app, **kwargs)
+
+    async def dispatch(self, request: Request, call_next):
+        limiter = self.limiter
+        if any(request.url.path.startswith(p) for p in limiter.whitelist_paths):
+            return await call_next(request)
+        identity = limiter._identify(request.headers, request.client.host)
+        route, rule = limiter._resolve_rule(request.url.path, identity)
+        result = await limiter._check_limit(f"rate_limit:{limiter.strategy}:{route}:{identity}", rule)
+        if not result.allowed:
+            return limiter._rate_limited_response(rule, result)
+        response = await call_next(request)
+        response.headers["X-RateLimit-Limit"] = str(rule.limit)
+        response.headers["X-RateLimit-Remaining"] = str(result.remaining)
+        response.headers["X-RateLimit-Reset"] = str(int(time.time() + result.reset_after_ms / 1000))
+        return response
+
+
+class LegacyLoggingMiddleware(BaseHTTPMiddleware):
+    """従来のBaseHTTPMiddleware版のログ記録"""
+
+    async def dispatch(self, request: Request, call_next):
+        perf_logger = PerformanceLogger(None).start_timer()
+        response = await call_next(request)
+        await perf_logger.log_request(
+            endpoint=request.url.path,
+            status_code=response.status_code,
+            request_method=request.method,
+            response_size=int(response.headers.get("content-length", 0)),
+            ip_address=request.client.host,
+            user_agent=request.headers.get("user-agent"),
+        )
+        return response
+
+
+def build_app(legacy: bool) -> FastAPI:
+    """計測用のアプリを組み立てる（main.pyと同じ順序で積む）"""
+    app = FastAPI()
+    items = [{"id": i, "title": f"タスク {i}", "status": "pending"} for i in range(50)]
+
+    @app.get("/ping")
+    async def ping():
+        return {"ping": "pong!"}
+
+    @app.get("/api/v1/tasks")
+    async def list_tasks():
+        return items
+
+    limiter_options = dict(redis_client=FakeRedis(), limit=100, timeframe=60, whitelist_ips=["-"])
+    if legacy:
+        app.add_middleware(LegacyRateLimiter, **limiter_options)
+        app.add_middleware(LegacyLoggingMiddleware)
+    else:
+        app.add_middleware(RateLimiter, **limiter_options)
+        app.add_middleware(LoggingMiddleware)
+    return app
+
+
+async def run(app: FastAPI, path: str) -> List[float]:
+    """順次リクエストを送り、1件ごとの所要時間（秒）を返す"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(WARMUP):
+            await client.get(path)
+        latencies = []
+        for _ in range(REQUESTS):
+            started = time.perf_counter()
+            await client.get(path)
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def noop_log_request(self, *args, **kwargs):
+    """パフォーマンスログ保存のスタブ"""
+    return None
+
+
+async def main() -> None:
+    print(f"{'middleware':<10} {'path':<16} {'req/s':>10} {'p50(ms)':>10} {'p99(ms)':>10}")
+    with patch.object(PerformanceLogger, "log_request", noop_log_request):
+        for path in ("/ping", "/api/v1/tasks"):
+            for label, legacy in (("legacy", True), ("asgi", False)):
+                latencies = await run(build_app(legacy), path)
+                quantiles = statistics.quantiles(latencies, n=100)
+                print(
+                    f"{label:<10} {path:<16} {len(latencies) / sum(latencies):>10.0f} "
+                    f"{statistics.median(latencies) * 1000:>10.3f} {quantiles[98] * 1000:>10.3f}"
+                )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,7 @@
 """
 キャッシュ機能のテスト
 """
+import asyncio
 import pytest
 import json
 from unittest.mock import patch, AsyncMock, MagicMock
@@ -9,10 +10,22 @@ from app.core.cache import (
     get_cache,
     delete_cache,
     delete_pattern,
+    get_many,
+    set_many,
+    bump_generation,
     cached,
     invalidate_cache,
-    redis_client
+    redis_client,
+    local_cache,
+    _clear_local,
+    _generations,
+    LocalCache,
+    get_local_cache_stats,
+    _apply_invalidation,
+    _MISSING,
+    default_key_builder,
 )
+from sqlalchemy.ext.asyncio import AsyncSession
 
 @pytest.fixture
 def mock_redis():
@@ -22,8 +35,25 @@ def mock_redis():
         mock.set = AsyncMock()
         mock.delete = AsyncMock()
         mock.keys = AsyncMock()
+        mock.publish = AsyncMock()
+        mock.mget = AsyncMock(return_value=[None, None])
+        mock.incr = AsyncMock(return_value=1)
+        mock.scan_iter = MagicMock(side_effect=lambda **kwargs: _async_iter([]))
         yield mock
 
+async def _async_iter(items):
+    """scan_iterのモック用非同期イテレータ"""
+    for item in items:
+        yield item
+
+@pytest.fixture(autouse=True)
+def clear_local_cache():
+    """テストごとにL1キャッシュを初期化"""
+    _clear_local()
+    local_cache._stats.clear()
+    yield
+    _clear_local()
+
 @pytest.mark.asyncio
 async def test_set_get_cache(mock_redis):
     """キャッシュの設定と取得のテスト"""
@@ -71,33 +101,44 @@ async def test_delete_cache(mock_redis):
 
 @pytest.mark.asyncio
 async def test_delete_pattern(mock_redis):
-    """パターンによるキャッシュ削除のテスト"""
+    """パターンによるキャッシュ削除のテスト（SCANベース）"""
     test_pattern = "test:*"
     test_keys = ["test:1", "test:2", "test:3"]
     
     # モックの設定
-    mock_redis.keys.return_value = test_keys
+    mock_redis.scan_iter.side_effect = lambda **kwargs: _async_iter(test_keys)
     
     # パターンによるキャッシュ削除
-    await delete_pattern(test_pattern)
+    deleted = await delete_pattern(test_pattern)
     
-    # 検証
-    mock_redis.keys.assert_called_once_with(test_pattern)
+    # 検証（KEYSは使わない）
+    assert deleted == 3
+    mock_redis.keys.assert_not_called()
+    assert mock_redis.scan_iter.call_args.kwargs["match"] == test_pattern
     mock_redis.delete.assert_called_once_with(*test_keys)
 
+@pytest.mark.asyncio
+async def test_delete_pattern_batches(mock_redis):
+    """SCANで取得したキーをバッチ単位で削除するテスト"""
+    test_keys = [f"test:{i}" for i in range(5)]
+    mock_redis.scan_iter.side_effect = lambda **kwargs: _async_iter(test_keys)
+    
+    with patch("app.core.cache.settings.cache_scan_batch_size", 2):
+        deleted = await delete_pattern("test:*")
+    
+    assert deleted == 5
+    assert mock_redis.delete.call_count == 3
+
 @pytest.mark.asyncio
 async def test_delete_pattern_no_keys(mock_redis):
     """キーが存在しないパターンによるキャッシュ削除のテスト"""
     test_pattern = "nonexistent:*"
     
-    # モックの設定
-    mock_redis.keys.return_value = []
-    
     # パターンによるキャッシュ削除
-    await delete_pattern(test_pattern)
+    deleted = await delete_pattern(test_pattern)
     
     # 検証
-    mock_redis.keys.assert_called_once_with(test_pattern)
+    assert deleted == 0
     mock_redis.delete.assert_not_called()
 
 @pytest.mark.asyncio
@@ -143,6 +184,334 @@ async def test_invalidate_cache_decorator(mock_redis):
     # 関数呼び出し
     result = await update_function(123)
     
-    # 検証
+    # 検証（キー走査ではなく世代番号のINCRのみ）
     assert result == {"id": 123, "updated": True}
-    mock_redis.keys.assert_called_once_with("test:*")
+    mock_redis.incr.assert_called_once_with("cache:gen:test")
+    mock_redis.keys.assert_not_called()
+    mock_redis.scan_iter.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_generation_bump_changes_cache_key(mock_redis):
+    """世代番号を進めると以前のキャッシュキーが参照されなくなるテスト"""
+    @cached(prefix="user", expire=300)
+    async def get_user(user_id):
+        return {"id": user_id}
+    
+    mock_redis.get.return_value = None
+    await get_user(1)
+    first_key = mock_redis.get.call_args.args[0]
+    
+    mock_redis.incr.return_value = 1
+    await bump_generation("user")
+    await get_user(1)
+    second_key = mock_redis.get.call_args.args[0]
+    
+    assert first_key.startswith("user:get_user:v0.0")
+    assert second_key.startswith("user:get_user:v1.0")
+
+@pytest.mark.asyncio
+async def test_generation_memo_is_separate_from_local_cache(mock_redis):
+    """世代番号のメモはL1とは別に持ち、無効化通知で破棄されるテスト"""
+    mock_redis.incr.return_value = 3
+    await bump_generation("user")
+    
+    assert len(local_cache) == 0
+    assert _generations["cache:gen:user"][1] == 3
+    
+    _apply_invalidation(json.dumps({"key": "cache:gen:user"}))
+    assert "cache:gen:user" not in _generations
+
+def test_local_cache_lru_eviction():
+    """L1キャッシュの最大エントリ数を超えた場合の追い出しテスト"""
+    cache = LocalCache(max_entries=2)
+    cache.set("user:a", 1, 60)
+    cache.set("user:b", 2, 60)
+    cache.get("user:a")  # aを最近使用に
+    cache.set("user:c", 3, 60)
+    
+    # 最も古く使われたbが追い出される
+    assert cache.get("user:a") == 1
+    assert cache.get("user:c") == 3
+    assert cache.get("user:b") is _MISSING
+    assert cache.get_stats()["user"]["evictions"] == 1
+
+def test_local_cache_ttl_expiry():
+    """L1キャッシュの有効期限切れのテスト"""
+    cache = LocalCache(max_entries=10)
+    with patch("app.core.cache.time.monotonic", return_value=100.0):
+        cache.set("user:a", 1, 10)
+    with patch("app.core.cache.time.monotonic", return_value=111.0):
+        assert cache.get("user:a") is _MISSING
+    
+    stats = cache.get_stats()["user"]
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+    assert len(cache) == 0
+
+@pytest.mark.asyncio
+async def test_cached_decorator_local_tier(mock_redis):
+    """L1併用時は2回目以降Redisにアクセスしないことのテスト"""
+    calls = []
+
+    @cached(prefix="user", expire=300, local_ttl=30)
+    async def get_user(user_id):
+        calls.append(user_id)
+        return {"id": user_id}
+    
+    mock_redis.get.return_value = None
+    
+    assert await get_user(1) == {"id": 1}
+    assert await get_user(1) == {"id": 1}
+    
+    # 関数とRedisはそれぞれ1回だけ呼ばれる
+    assert calls == [1]
+    mock_redis.get.assert_called_once()
+    mock_redis.set.assert_called_once()
+    stats = get_local_cache_stats()["user"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_delete_cache_publishes_invalidation(mock_redis):
+    """削除時にL1から消え、他ワーカーへ通知されることのテスト"""
+    local_cache.set("user:get:1", {"id": 1}, 60)
+    
+    await delete_cache("user:get:1")
+    
+    assert len(local_cache) == 0
+    mock_redis.publish.assert_called_once()
+    channel, message = mock_redis.publish.call_args.args
+    assert json.loads(message) == {"key": "user:get:1"}
+
+def test_apply_invalidation_pattern():
+    """他ワーカーからのパターン無効化通知のテスト"""
+    local_cache.set("user:get:1", 1, 60)
+    local_cache.set("user:get:2", 2, 60)
+    local_cache.set("task:get:1", 3, 60)
+    
+    _apply_invalidation(json.dumps({"pattern": "user:*"}))
+    
+    assert len(local_cache) == 1
+    assert local_cache.get("task:get:1") == 3
+
+@pytest.mark.asyncio
+async def test_cached_single_flight(mock_redis):
+    """同時のキャッシュミスが1回の計算にまとめられるテスト"""
+    calls = []
+
+    @cached(prefix="test", expire=300)
+    async def slow_function(item_id):
+        calls.append(item_id)
+        await asyncio.sleep(0.01)
+        return {"id": item_id}
+    
+    mock_redis.get.return_value = None
+    
+    results = await asyncio.gather(*[slow_function(1) for _ in range(10)])
+    
+    # 関数は1回だけ実行され、全員が同じ結果を受け取る
+    assert calls == [1]
+    assert all(r == {"id": 1} for r in results)
+    mock_redis.set.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_cached_single_flight_propagates_error(mock_redis):
+    """計算が失敗した場合は待機者全員に例外が伝わるテスト"""
+    @cached(prefix="test", expire=300)
+    async def failing_function():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+    
+    mock_redis.get.return_value = None
+    
+    results = await asyncio.gather(*[failing_function() for _ in range(3)], return_exceptions=True)
+    
+    assert all(isinstance(r, ValueError) for r in results)
+    mock_redis.set.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_cached_single_flight_survives_leader_cancel(mock_redis):
+    """計算を始めた呼び出し元がキャンセルされても、他の待機者は結果を受け取れるテスト"""
+    calls = []
+    
+    @cached(prefix="test", expire=300)
+    async def slow_function(item_id):
+        calls.append(item_id)
+        await asyncio.sleep(0.02)
+        return {"id": item_id}
+    
+    mock_redis.get.return_value = None
+    
+    leader = asyncio.create_task(slow_function(1))
+    await asyncio.sleep(0.005)
+    follower = asyncio.create_task(slow_function(1))
+    await asyncio.sleep(0.005)
+    leader.cancel()
+    
+    assert await follower == {"id": 1}
+    assert leader.cancelled()
+    assert calls == [1]
+    mock_redis.set.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_cached_waits_for_distributed_lock(mock_redis):
+    """他ワーカーがロックを保持している場合はその結果を待つテスト"""
+    calls = []
+
+    @cached(prefix="test", expire=300, lock_timeout=5)
+    async def compute(item_id):
+        calls.append(item_id)
+        return {"id": item_id}
+    
+    # ロック取得失敗、2回目のキャッシュ確認で他ワーカーの結果が入る
+    mock_redis.set.return_value = None
+    mock_redis.get.side_effect = [None, None, json.dumps({"id": 1})]
+    
+    with patch("app.core.cache.settings.cache_lock_poll_interval_ms", 1):
+        result = await compute(1)
+    
+    assert result == {"id": 1}
+    assert calls == []
+    lock_call = mock_redis.set.call_args
+    assert lock_call.args[0].startswith("cache:lock:test:compute:")
+    assert lock_call.kwargs == {"nx": True, "ex": 5}
+
+@pytest.mark.asyncio
+async def test_cached_stale_while_revalidate(mock_redis):
+    """期限切れの値を返しつつ裏で1回だけ再計算するテスト"""
+    calls = []
+
+    @cached(prefix="test", expire=60, stale_ttl=300)
+    async def compute(item_id):
+        calls.append(item_id)
+        return {"id": item_id, "fresh": True}
+    
+    stale_entry = {"value": {"id": 1, "fresh": False}, "fresh_until": 0}
+    mock_redis.get.return_value = json.dumps(stale_entry)
+    
+    results = await asyncio.gather(compute(1), compute(1), compute(1))
+    
+    # 全員が古い値を即座に受け取る
+    assert all(r == {"id": 1, "fresh": False} for r in results)
+    
+    # バックグラウンドの再計算は1回だけ
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert calls == [1]
+    key, payload = mock_redis.set.call_args.args
+    assert json.loads(payload)["value"] == {"id": 1, "fresh": True}
+    assert mock_redis.set.call_args.kwargs == {"ex": 360}
+
+@pytest.fixture
+def fake_redis_store(mock_redis):
+    """辞書で値を保持するRedisモック（ヒット率の検証用）"""
+    store = {}
+
+    async def fake_get(key):
+        return store.get(key)
+
+    async def fake_set(key, value, ex=None, **kwargs):
+        store[key] = value
+
+    mock_redis.get.side_effect = fake_get
+    mock_redis.set.side_effect = fake_set
+    return store
+
+class FakeCRUD:
+    """crud_user.getと同じ形のテスト用CRUDクラス"""
+    def __init__(self):
+        self.queries = 0
+
+    @cached(prefix="user", expire=300)
+    async def get(self, db, id):
+        self.queries += 1
+        return {"id": id}
+
+@pytest.mark.asyncio
+async def test_cached_key_ignores_session_and_self(fake_redis_store):
+    """リクエストごとにセッションが変わってもキャッシュがヒットするテスト"""
+    crud = FakeCRUD()
+    
+    # 毎回別のセッション（リクエスト）から呼び出す
+    for _ in range(10):
+        session = MagicMock(spec=AsyncSession)
+        assert await crud.get(session, id=1) == {"id": 1}
+    
+    # DBへの問い合わせは最初の1回のみ（ヒット率 9/10）
+    assert crud.queries == 1
+    assert list(fake_redis_store) == ["user:get:v0.0:id=1"]
+
+@pytest.mark.asyncio
+async def test_cached_key_positional_and_keyword_match(fake_redis_store):
+    """位置引数とキーワード引数、デフォルト値の有無で同じキーになるテスト"""
+    calls = []
+
+    @cached(prefix="task", expire=300)
+    async def list_tasks(db, user_id, skip=0, limit=100):
+        calls.append(user_id)
+        return [user_id]
+    
+    await list_tasks(object(), 5)
+    await list_tasks(object(), 5, 0)
+    await list_tasks(object(), user_id=5, limit=100)
+    
+    assert calls == [5]
+
+@pytest.mark.asyncio
+async def test_cached_key_custom_ignore(fake_redis_store):
+    """ignoreで指定した引数がキーから除外されるテスト"""
+    @cached(prefix="recipe", expire=300, ignore=("current_user",))
+    async def list_recipes(db, current_user, status):
+        return [status]
+    
+    await list_recipes(None, object(), "pending")
+    
+    assert list(fake_redis_store) == ["recipe:list_recipes:v0.0:status=pending"]
+
+def test_default_key_builder_bounded_and_deterministic():
+    """長い引数がハッシュ化され、辞書の順序に依存しないテスト"""
+    long_filter = {"tags": ["x" * 50] * 20, "status": "pending"}
+    reordered = {"status": "pending", "tags": ["x" * 50] * 20}
+    
+    key = default_key_builder({"filters": long_filter})
+    
+    assert key == default_key_builder({"filters": reordered})
+    assert len(key) < 64
+    assert key.startswith("filters=h")
+
+def test_default_key_builder_rejects_unstable_objects():
+    """メモリアドレスを含むreprの引数を拒否するテスト"""
+    with pytest.raises(TypeError):
+        default_key_builder({"obj": object()})
+
+@pytest.mark.asyncio
+async def test_get_many(mock_redis):
+    """複数キーを1回のMGETで取得するテスト"""
+    mock_redis.mget.return_value = [json.dumps({"id": 1}), None, json.dumps({"id": 3})]
+    
+    result = await get_many(["task:1", "task:2", "task:3"])
+    
+    mock_redis.mget.assert_called_once_with(["task:1", "task:2", "task:3"])
+    mock_redis.get.assert_not_called()
+    assert result == {"task:1": {"id": 1}, "task:3": {"id": 3}}
+
+@pytest.mark.asyncio
+async def test_set_many(mock_redis):
+    """複数キーをパイプラインで1往復にまとめて設定するテスト"""
+    pipe = MagicMock()
+    pipe.execute = AsyncMock()
+    mock_redis.pipeline = MagicMock(return_value=pipe)
+    
+    await set_many({"task:1": {"id": 1}, "task:2": {"id": 2}}, expire=60)
+    
+    mock_redis.pipeline.assert_called_once_with(transaction=False)
+    assert pipe.set.call_count == 2
+    pipe.set.assert_any_call("task:1", json.dumps({"id": 1}), ex=60)
+    pipe.execute.assert_called_once()
+    mock_redis.set.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_get_many_empty(mock_redis):
+    """空のキーリストではRedisにアクセスしないテスト"""
+    assert await get_many([]) == {}
+    mock_redis.mget.assert_not_called()
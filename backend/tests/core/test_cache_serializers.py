@@ -0,0 +1,129 @@
+"""
+キャッシュシリアライザのテスト
+"""
+import json
+import uuid
+import pytest
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import List, Optional
+from unittest.mock import patch, AsyncMock
+from pydantic import BaseModel
+from app.core.cache import _clear_local, cached
+from app.core.cache_serializers import (
+    JSONSerializer,
+    MsgpackSerializer,
+    PydanticSerializer,
+    CompressedSerializer,
+    build_serializer,
+)
+
+class SampleResponse(BaseModel):
+    """テスト用レスポンススキーマ"""
+    id: int
+    title: str
+    scheduled_date: Optional[date] = None
+    created_at: datetime
+
+class SampleRow:
+    """テスト用ORMオブジェクト（属性アクセスのみ）"""
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+SAMPLE_VALUE = {
+    "id": 1,
+    "created_at": datetime(2025, 5, 3, 7, 7, 34, tzinfo=timezone.utc),
+    "scheduled_date": date(2025, 6, 1),
+    "price": Decimal("12.50"),
+    "uid": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+    "tags": ["和食", "中華"],
+}
+
+def test_json_serializer_is_backward_compatible():
+    """JSONシリアライザは従来と同じ形式で保存するテスト"""
+    serializer = JSONSerializer()
+    value = {"name": "test", "value": 123}
+    
+    assert serializer.dumps(value) == json.dumps(value)
+    assert serializer.loads(serializer.dumps(value).encode()) == value
+
+def test_msgpack_serializer_preserves_types():
+    """msgpackシリアライザが型を保持して往復するテスト"""
+    serializer = MsgpackSerializer()
+    
+    restored = serializer.loads(serializer.dumps(SAMPLE_VALUE))
+    
+    assert restored == SAMPLE_VALUE
+    assert isinstance(restored["created_at"], datetime)
+    assert isinstance(restored["scheduled_date"], date)
+    assert len(serializer.dumps(SAMPLE_VALUE)) < len(JSONSerializer().dumps(SAMPLE_VALUE))
+
+def test_pydantic_serializer_round_trip_from_orm():
+    """スキーマ指定時にORMオブジェクトが型付きで復元されるテスト"""
+    serializer = PydanticSerializer(List[SampleResponse])
+    rows = [
+        SampleRow(id=i, title=f"task{i}", scheduled_date=None,
+                  created_at=datetime(2025, 5, 3, tzinfo=timezone.utc))
+        for i in range(3)
+    ]
+    
+    restored = serializer.loads(serializer.dumps(rows))
+    
+    assert [r.id for r in restored] == [0, 1, 2]
+    assert all(isinstance(r, SampleResponse) for r in restored)
+    assert isinstance(restored[0].created_at, datetime)
+
+@pytest.mark.parametrize("algorithm", ["zlib", "lz4"])
+def test_compressed_serializer_threshold(algorithm):
+    """閾値以上の値だけが圧縮されるテスト"""
+    serializer = CompressedSerializer(JSONSerializer(), algorithm, threshold=100)
+    small = {"id": 1}
+    large = {"items": ["x" * 10] * 100}
+    
+    small_data = serializer.dumps(small)
+    large_data = serializer.dumps(large)
+    
+    assert small_data[:1] == b"\x00"
+    assert large_data[:1] != b"\x00"
+    assert len(large_data) < len(json.dumps(large))
+    assert serializer.loads(small_data) == small
+    assert serializer.loads(large_data) == large
+
+def test_build_serializer_rejects_unknown():
+    """未対応のシリアライザ名を拒否するテスト"""
+    with pytest.raises(ValueError):
+        build_serializer("pickle")
+
+@pytest.mark.asyncio
+async def test_cached_with_schema_returns_typed_objects():
+    """schema指定の@cachedがミス時もヒット時も型付きで返すテスト"""
+    store = {}
+
+    async def fake_get(key):
+        return store.get(key)
+
+    async def fake_set(key, value, ex=None):
+        store[key] = value
+
+    @cached(prefix="sample", expire=300, schema=SampleResponse)
+    async def get_sample(item_id):
+        return SampleRow(id=item_id, title="title", scheduled_date=date(2025, 6, 1),
+                         created_at=datetime(2025, 5, 3, tzinfo=timezone.utc))
+    
+    with patch("app.core.cache.redis_client") as mock_redis:
+        mock_redis.get = AsyncMock(side_effect=fake_get)
+        mock_redis.set = AsyncMock(side_effect=fake_set)
+        mock_redis.mget = AsyncMock(return_value=[None, None])
+        _clear_local()
+        
+        miss = await get_sample(1)
+        hit = await get_sample(1)
+    
+    assert isinstance(miss, SampleResponse)
+    assert hit == miss
+    assert hit.scheduled_date == date(2025, 6, 1)
+
+def test_cached_rejects_schema_with_serializer():
+    """schemaとserializerを同時に指定すると、serializerを無視せずにエラーにするテスト"""
+    with pytest.raises(ValueError):
+        cached(prefix="sample", schema=SampleResponse, serializer=CompressedSerializer(JSONSerializer()))
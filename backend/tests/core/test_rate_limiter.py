@@ -1,144 +1,298 @@
 """
 レート制限ミドルウェアのテスト
 """
+import json
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
-from starlette.requests import Request
-from starlette.responses import Response
+from starlette.datastructures import Headers
 from starlette.status import HTTP_429_TOO_MANY_REQUESTS
-from app.core.rate_limiter import RateLimiter
+from app.core.auth import create_access_token
+from app.core.rate_limiter import (
+    LocalBlocklist,
+    RateLimiter,
+    RateLimitRule,
+    parse_route_limits,
+    FIXED_WINDOW_SCRIPT,
+    TOKEN_BUCKET_SCRIPT,
+)
 
-@pytest.fixture
-def mock_redis_client():
-    """Redisクライアントのモック"""
-    mock_client = AsyncMock()
-    mock_client.pipeline.return_value = mock_client
-    mock_client.incr.return_value = AsyncMock()
-    mock_client.expire.return_value = AsyncMock()
-    mock_client.execute.return_value = [1]  # デフォルトでカウンター=1を返す
-    return mock_client
+class DownstreamApp:
+    """後段のASGIアプリのスタブ（呼び出しを記録して200を返す）"""
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+def make_scope(path="/api/test", client_ip="192.168.1.1", headers=None):
+    """HTTPリクエストのASGIスコープを作成"""
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": (client_ip, 50000),
+    }
+
+async def run_middleware(middleware, scope):
+    """ミドルウェアを実行し、(レスポンス開始メッセージ, 本文)を返す"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    start = messages[0]
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return start, body
 
 @pytest.fixture
-def mock_app():
-    """FastAPIアプリケーションのモック"""
-    return MagicMock()
+def mock_script():
+    """登録済みLuaスクリプトのモック（許可, 残り回数, リセットまでのミリ秒）"""
+    return AsyncMock(return_value=[1, 90, 60000])
 
 @pytest.fixture
-def mock_request():
-    """リクエストのモック"""
-    mock_req = MagicMock(spec=Request)
-    mock_req.url.path = "/api/test"
-    mock_req.client = MagicMock()
-    mock_req.client.host = "192.168.1.1"
-    return mock_req
+def mock_redis_client(mock_script):
+    """Redisクライアントのモック"""
+    mock_client = MagicMock()
+    mock_client.register_script.return_value = mock_script
+    return mock_client
 
 @pytest.fixture
-def mock_response():
-    """レスポンスのモック"""
-    mock_resp = MagicMock(spec=Response)
-    mock_resp.headers = {}
-    return mock_resp
+def mock_app():
+    """後段のASGIアプリ"""
+    return DownstreamApp()
 
 @pytest.mark.asyncio
-async def test_rate_limiter_under_limit(mock_app, mock_redis_client, mock_request):
+async def test_rate_limiter_under_limit(mock_app, mock_redis_client, mock_script):
     """制限内のリクエストのテスト"""
-    # カウンターが制限未満の場合
-    mock_redis_client.execute.return_value = [10]  # カウンター=10
-    
     middleware = RateLimiter(mock_app, mock_redis_client, limit=100, timeframe=60)
-    
-    # コールネクストの準備
-    mock_app.return_value = AsyncMock()
-    mock_app.return_value.headers = {}
-    
+
     # ミドルウェアの実行
-    await middleware.dispatch(mock_request, mock_app)
-    
-    # 検証
-    mock_app.assert_called_once()
-    mock_redis_client.pipeline.assert_called_once()
-    mock_redis_client.incr.assert_called_once()
-    mock_redis_client.expire.assert_called_once()
+    start, body = await run_middleware(middleware, make_scope())
+
+    # 検証（判定はスクリプト1回＝1往復）
+    assert mock_app.calls == 1
+    assert start["status"] == 200
+    assert body == b"ok"
+    mock_redis_client.register_script.assert_called_once_with(FIXED_WINDOW_SCRIPT)
+    mock_script.assert_called_once_with(
+        keys=["rate_limit:fixed_window:*:ip:192.168.1.1"], args=[100, 60000]
+    )
+    mock_redis_client.pipeline.assert_not_called()
 
 @pytest.mark.asyncio
-async def test_rate_limiter_over_limit(mock_app, mock_redis_client, mock_request):
+async def test_rate_limiter_over_limit(mock_app, mock_redis_client, mock_script):
     """制限超過のリクエストのテスト"""
-    # カウンターが制限を超えた場合
-    mock_redis_client.execute.return_value = [101]  # カウンター=101
-    
+    mock_script.return_value = [0, 0, 1500]
+
     middleware = RateLimiter(mock_app, mock_redis_client, limit=100, timeframe=60)
-    
+
     # ミドルウェアの実行
-    response = await middleware.dispatch(mock_request, mock_app)
-    
+    start, body = await run_middleware(middleware, make_scope())
+
     # 検証
-    mock_app.assert_not_called()  # next handlerは呼ばれない
-    assert response.status_code == HTTP_429_TOO_MANY_REQUESTS
-    assert "Too many requests" in response.body.decode()
+    assert mock_app.calls == 0  # 後段のアプリは呼ばれない
+    assert start["status"] == HTTP_429_TOO_MANY_REQUESTS
+    assert json.loads(body)["error"] == "Too many requests"
+    headers = Headers(raw=start["headers"])
+    assert headers["Retry-After"] == "2"
+    assert headers["X-RateLimit-Remaining"] == "0"
 
 @pytest.mark.asyncio
-async def test_rate_limiter_whitelist_path(mock_app, mock_redis_client, mock_request):
+async def test_rate_limiter_whitelist_path(mock_app, mock_redis_client, mock_script):
     """ホワイトリストパスのテスト"""
-    # ホワイトリストのパスを設定
-    mock_request.url.path = "/ping"
-    
     middleware = RateLimiter(
-        mock_app, 
-        mock_redis_client, 
-        limit=100, 
+        mock_app,
+        mock_redis_client,
+        limit=100,
         timeframe=60,
         whitelist_paths=["/ping"]
     )
-    
+
     # ミドルウェアの実行
-    await middleware.dispatch(mock_request, mock_app)
-    
+    start, _ = await run_middleware(middleware, make_scope(path="/ping"))
+
     # 検証
-    mock_app.assert_called_once()
-    # カウンター更新は行われない
-    mock_redis_client.pipeline.assert_not_called()
-    mock_redis_client.incr.assert_not_called()
+    assert mock_app.calls == 1
+    # カウンター更新は行われず、ヘッダーも付かない
+    mock_script.assert_not_called()
+    assert "X-RateLimit-Limit" not in Headers(raw=start["headers"])
 
 @pytest.mark.asyncio
-async def test_rate_limiter_whitelist_ip(mock_app, mock_redis_client, mock_request):
+async def test_rate_limiter_whitelist_ip(mock_app, mock_redis_client, mock_script):
     """ホワイトリストIPのテスト"""
-    # ホワイトリストのIPを設定
-    mock_request.client.host = "127.0.0.1"
-    
     middleware = RateLimiter(
-        mock_app, 
-        mock_redis_client, 
-        limit=100, 
+        mock_app,
+        mock_redis_client,
+        limit=100,
         timeframe=60,
         whitelist_ips=["127.0.0.1"]
     )
-    
+
     # ミドルウェアの実行
-    await middleware.dispatch(mock_request, mock_app)
-    
+    await run_middleware(middleware, make_scope(client_ip="127.0.0.1"))
+
     # 検証
-    mock_app.assert_called_once()
+    assert mock_app.calls == 1
     # カウンター更新は行われない
-    mock_redis_client.pipeline.assert_not_called()
-    mock_redis_client.incr.assert_not_called()
+    mock_script.assert_not_called()
 
 @pytest.mark.asyncio
-async def test_rate_limiter_headers(mock_app, mock_redis_client, mock_request):
+async def test_rate_limiter_headers(mock_app, mock_redis_client):
     """リミットヘッダーのテスト"""
-    # カウンターが制限未満の場合
-    mock_redis_client.execute.return_value = [10]  # カウンター=10
-    
-    # レスポンスモックの準備
-    mock_response = MagicMock()
-    mock_response.headers = {}
-    mock_app.return_value = mock_response
-    
     middleware = RateLimiter(mock_app, mock_redis_client, limit=100, timeframe=60)
-    
+
     # ミドルウェアの実行
-    result = await middleware.dispatch(mock_request, mock_app)
-    
-    # 検証
-    assert result.headers["X-RateLimit-Limit"] == "100"
-    assert result.headers["X-RateLimit-Remaining"] == "90"  # 100-10
-    assert "X-RateLimit-Reset" in result.headers
+    with patch("app.core.rate_limiter.time.time", return_value=1000.0):
+        start, _ = await run_middleware(middleware, make_scope())
+
+    # 検証（後段のヘッダーは保持される）
+    headers = Headers(raw=start["headers"])
+    assert headers["X-RateLimit-Limit"] == "100"
+    assert headers["X-RateLimit-Remaining"] == "90"
+    assert headers["X-RateLimit-Reset"] == "1060"
+    assert headers["content-type"] == "text/plain"
+
+@pytest.mark.asyncio
+async def test_rate_limiter_passes_non_http(mock_redis_client, mock_script):
+    """HTTP以外（lifespan）はそのまま通すテスト"""
+    downstream = AsyncMock()
+    middleware = RateLimiter(downstream, mock_redis_client)
+    scope = {"type": "lifespan"}
+
+    await middleware(scope, AsyncMock(), AsyncMock())
+
+    downstream.assert_called_once()
+    mock_script.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_rate_limiter_per_user(mock_app, mock_redis_client, mock_script):
+    """認証済みリクエストはユーザー単位の上限で数えるテスト"""
+    token = create_access_token(data={"sub": "42"})
+    scope = make_scope(headers={"Authorization": f"Bearer {token}"})
+
+    middleware = RateLimiter(mock_app, mock_redis_client, limit=100, timeframe=60, user_limit=300)
+
+    start, _ = await run_middleware(middleware, scope)
+
+    mock_script.assert_called_once_with(
+        keys=["rate_limit:fixed_window:*:user:42"], args=[300, 60000]
+    )
+    assert Headers(raw=start["headers"])["X-RateLimit-Limit"] == "300"
+
+@pytest.mark.asyncio
+async def test_rate_limiter_invalid_token_falls_back_to_ip(mock_app, mock_redis_client, mock_script):
+    """不正なトークンはIP単位で数えるテスト"""
+    scope = make_scope(headers={"Authorization": "Bearer invalid"})
+
+    middleware = RateLimiter(mock_app, mock_redis_client, limit=100, timeframe=60)
+
+    await run_middleware(middleware, scope)
+
+    assert mock_script.call_args.kwargs["keys"] == ["rate_limit:fixed_window:*:ip:192.168.1.1"]
+
+@pytest.mark.asyncio
+async def test_rate_limiter_route_limit(mock_app, mock_redis_client, mock_script):
+    """ルート別の上限が優先されるテスト"""
+    middleware = RateLimiter(
+        mock_app,
+        mock_redis_client,
+        limit=100,
+        timeframe=60,
+        strategy="token_bucket",
+        route_limits=parse_route_limits('{"/api/v1/auth": "20/60", "/api/v1/auth/login": "5/300"}'),
+    )
+
+    await run_middleware(middleware, make_scope(path="/api/v1/auth/login"))
+
+    mock_redis_client.register_script.assert_called_once_with(TOKEN_BUCKET_SCRIPT)
+    mock_script.assert_called_once_with(
+        keys=["rate_limit:token_bucket:/api/v1/auth/login:ip:192.168.1.1"], args=[5, 300000]
+    )
+
+@pytest.mark.asyncio
+async def test_rate_limiter_sliding_window_unique_member(mock_app, mock_redis_client, mock_script):
+    """スライディングウィンドウはリクエストごとに一意なメンバーを渡すテスト"""
+    middleware = RateLimiter(mock_app, mock_redis_client, limit=100, timeframe=60, strategy="sliding_window")
+
+    await run_middleware(middleware, make_scope())
+    await run_middleware(middleware, make_scope())
+
+    first, second = [c.kwargs["args"] for c in mock_script.call_args_list]
+    assert first[:2] == [100, 60000]
+    assert first[2] != second[2]
+
+def test_rate_limiter_rejects_unknown_strategy(mock_app, mock_redis_client):
+    """未対応の方式を拒否するテスト"""
+    with pytest.raises(ValueError):
+        RateLimiter(mock_app, mock_redis_client, strategy="leaky")
+
+def test_parse_route_limits():
+    """ルート別上限設定の解析テスト"""
+    assert parse_route_limits('{"/api/v1/auth/login": "5/60"}') == {
+        "/api/v1/auth/login": RateLimitRule(5, 60)
+    }
+    assert parse_route_limits("{}") == {}
+
+@pytest.mark.asyncio
+async def test_rate_limiter_local_blocklist(mock_app, mock_redis_client, mock_script):
+    """超過したクライアントは同期間隔までRedisに問い合わせず拒否するテスト"""
+    mock_script.return_value = [0, 0, 30000]
+    middleware = RateLimiter(mock_app, mock_redis_client, limit=100, timeframe=60, local_sync_seconds=1.0)
+
+    with patch("app.core.rate_limiter.time.monotonic", return_value=100.0):
+        first, _ = await run_middleware(middleware, make_scope())
+    with patch("app.core.rate_limiter.time.monotonic", return_value=100.5):
+        second, _ = await run_middleware(middleware, make_scope())
+
+    # 2回目はローカルで拒否され、Retry-Afterは残り時間から計算される
+    assert first["status"] == second["status"] == HTTP_429_TOO_MANY_REQUESTS
+    assert mock_script.call_count == 1
+    assert Headers(raw=second["headers"])["Retry-After"] == "30"
+    assert middleware.blocklist.rejections == 1
+
+    # 同期間隔を過ぎるとRedisで再確認する
+    mock_script.return_value = [1, 99, 60000]
+    with patch("app.core.rate_limiter.time.monotonic", return_value=101.5):
+        third, _ = await run_middleware(middleware, make_scope())
+    assert third["status"] == 200
+    assert mock_script.call_count == 2
+    assert len(middleware.blocklist) == 0
+
+@pytest.mark.asyncio
+async def test_rate_limiter_local_blocklist_per_identity(mock_app, mock_redis_client, mock_script):
+    """ローカル遮断は超過した識別子のみに適用されるテスト"""
+    mock_script.return_value = [0, 0, 30000]
+    middleware = RateLimiter(mock_app, mock_redis_client, limit=100, timeframe=60)
+    await run_middleware(middleware, make_scope(client_ip="10.0.0.1"))
+
+    mock_script.return_value = [1, 99, 60000]
+    start, _ = await run_middleware(middleware, make_scope(client_ip="10.0.0.2"))
+
+    assert start["status"] == 200
+    assert mock_script.call_count == 2
+
+def test_local_blocklist_evicts_oldest():
+    """最大数を超えると最も古い識別子から追い出すテスト"""
+    blocklist = LocalBlocklist(max_entries=2, sync_seconds=1.0)
+    blocklist.block("a", 5000)
+    blocklist.block("b", 5000)
+    blocklist.block("c", 5000)
+
+    assert len(blocklist) == 2
+    assert blocklist.check("a") is None
+    assert blocklist.check("c") is not None
+
+def test_local_blocklist_disabled():
+    """同期間隔0ではローカル遮断しないテスト"""
+    blocklist = LocalBlocklist(sync_seconds=0)
+    blocklist.block("a", 5000)
+
+    assert blocklist.check("a") is None
@@ -0,0 +1,139 @@
+"""
+CRUDBaseの変更系操作（create / update / delete と一括操作）のテスト
+"""
+import pytest
+import pytest_asyncio
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.crud.base import CRUDBase
+from app.db.models.tag import Tag
+from app.db.unit_of_work import unit_of_work
+
+crud_tag = CRUDBase(Tag)
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    """tagsテーブルだけを作成したSQLiteのセッション（発行したSQLをstatementsに記録）"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'crud.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Tag.__table__.create)
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)()
+    session.statements = statements
+    yield session
+    await session.close()
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_create_many_returns_rows_in_order(db):
+    """INSERT ... RETURNINGで作成し、入力と同じ順に返すテスト"""
+    tags = await crud_tag.create_many(db, objs_in=[{"name": "b", "color": "red"}, {"name": "a", "color": "blue"}])
+
+    assert [(tag.name, tag.color) for tag in tags] == [("b", "red"), ("a", "blue")]
+    assert all(tag.id is not None and tag.created_at is not None for tag in tags)
+    # 作成した行はRETURNINGで受け取り、refreshのSELECTは発行しない
+    assert all("RETURNING" in s for s in db.statements if s.startswith("INSERT"))
+    assert not [s for s in db.statements if s.startswith("SELECT")]
+
+@pytest.mark.asyncio
+async def test_create_many_empty(db):
+    """空の入力ではSQLを発行しないテスト"""
+    assert await crud_tag.create_many(db, objs_in=[]) == []
+    assert db.statements == []
+
+@pytest.mark.asyncio
+async def test_update_many_by_filter(db):
+    """条件に一致する行だけを更新し、読み込み済みのオブジェクトにも反映するテスト"""
+    red, blue = await crud_tag.create_many(db, objs_in=[{"name": "r", "color": "red"}, {"name": "b", "color": "blue"}])
+
+    updated = await crud_tag.update_many(db, filters=[Tag.color == "red"], obj_in={"color": "green"})
+
+    assert [tag.id for tag in updated] == [red.id]
+    assert red.color == "green"
+    assert (await crud_tag.get(db, blue.id)).color == "blue"
+
+@pytest.mark.asyncio
+async def test_bulk_operations_require_filters(db):
+    """条件なしの一括更新・削除を拒否するテスト"""
+    with pytest.raises(ValueError):
+        await crud_tag.update_many(db, filters=[], obj_in={"color": "x"})
+    with pytest.raises(ValueError):
+        await crud_tag.delete_many(db, filters=[])
+
+@pytest.mark.asyncio
+async def test_delete_many_returns_ids(db):
+    """削除した行のIDを返すテスト"""
+    tags = await crud_tag.create_many(db, objs_in=[{"name": "x", "color": "gray"}, {"name": "y", "color": "gray"}, {"name": "z"}])
+
+    ids = await crud_tag.delete_many(db, filters=[Tag.color == "gray"])
+
+    assert sorted(ids) == [tags[0].id, tags[1].id]
+    assert await crud_tag.get(db, tags[0].id) is None
+    assert await crud_tag.get(db, tags[2].id) is not None
+
+@pytest.mark.asyncio
+async def test_upsert_inserts_and_updates(db):
+    """一意制約が重複する行は更新し、それ以外は作成するテスト"""
+    existing, = await crud_tag.create_many(db, objs_in=[{"name": "a", "color": "blue"}])
+
+    tags = await crud_tag.upsert(
+        db, objs_in=[{"name": "a", "color": "black"}, {"name": "c", "color": "white"}], index_elements=["name"]
+    )
+
+    assert [(tag.name, tag.color) for tag in tags] == [("a", "black"), ("c", "white")]
+    assert tags[0].id == existing.id
+    assert existing.color == "black"
+
+@pytest.mark.asyncio
+async def test_upsert_without_update_fields_does_nothing_on_conflict(db):
+    """更新する列がなければ既存の行を変更しないテスト"""
+    await crud_tag.create_many(db, objs_in=[{"name": "a", "color": "blue"}])
+
+    tags = await crud_tag.upsert(db, objs_in=[{"name": "a"}, {"name": "b"}], index_elements=["name"])
+
+    # 入力と同じ並びで、既存だった行はNone
+    assert tags[0] is None
+    assert tags[1].name == "b"
+    assert (await crud_tag.get(db, 1)).color == "blue"
+
+@pytest.mark.asyncio
+async def test_upsert_duplicate_keys_last_one_wins(db):
+    """入力内で一意制約の値が重複する場合は後のものを使い、結果は入力に揃えるテスト"""
+    tags = await crud_tag.upsert(
+        db,
+        objs_in=[{"name": "a", "color": "red"}, {"name": "b", "color": "blue"}, {"name": "a", "color": "green"}],
+        index_elements=["name"],
+    )
+
+    assert [(tag.name, tag.color) for tag in tags] == [("a", "green"), ("b", "blue"), ("a", "green")]
+    assert tags[0] is tags[2]
+    assert len(await crud_tag.get_multi(db)) == 2
+
+@pytest.mark.asyncio
+async def test_create_update_flush_without_refresh(db):
+    """create / updateはflushだけを行い、refreshのSELECTを発行しないテスト"""
+    tag = await crud_tag.create(db, obj_in={"name": "a", "color": "blue"})
+    await crud_tag.update(db, db_obj=tag, obj_in={"color": "green"})
+
+    assert tag.id is not None and tag.updated_at is not None
+    assert not [s for s in db.statements if s.startswith("SELECT")]
+
+    await db.rollback()
+    assert await crud_tag.get(db, tag.id) is None
+
+@pytest.mark.asyncio
+async def test_bulk_operations_do_not_commit(db):
+    """一括操作もflushまでで、コミットは呼び出し側（unit_of_work）に任せるテスト"""
+    async with unit_of_work(db):
+        await crud_tag.create_many(db, objs_in=[{"name": "a", "color": "blue"}])
+
+    await crud_tag.update_many(db, filters=[Tag.name == "a"], obj_in={"color": "green"})
+    await crud_tag.create_many(db, objs_in=[{"name": "b"}])
+    await crud_tag.upsert(db, objs_in=[{"name": "c"}], index_elements=["name"])
+    await db.rollback()
+
+    assert (await crud_tag.get(db, 1)).color == "blue"
+    assert len(await crud_tag.get_multi(db)) == 1
@@ -0,0 +1,155 @@
+"""
+読み取りのレプリカへの振り分け（get_read_db / read-your-writes）のテスト
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+import redis.asyncio as redis
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+from app.core.auth import bearer_subject, create_access_token
+from app.database import get_read_db
+from app.db.routing import RecentWrites, ReadYourWritesMiddleware
+
+def _request(token=None, method="GET"):
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return Request({"type": "http", "method": method, "path": "/", "headers": headers})
+
+@pytest.fixture
+def databases(tmp_path):
+    """プライマリとレプリカの代わりにする2つのSQLiteデータベース"""
+    primary = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}")
+    replica = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    return primary, replica
+
+async def _which(db: AsyncSession, primary) -> str:
+    connection = await db.connection()
+    return "primary" if connection.engine.url == primary.url else "replica"
+
+async def _route(request, primary, replica, recent_writes):
+    """get_read_dbが返すセッションの接続先"""
+    primary_session = AsyncSession(bind=primary)
+    with patch("app.database.engine", primary), \
+         patch("app.database.read_engine", replica), \
+         patch("app.database.AsyncReadSessionLocal", sessionmaker(bind=replica, class_=AsyncSession)), \
+         patch("app.database.recent_writes", recent_writes):
+        dependency = get_read_db(request, primary_session)
+        db = await dependency.__anext__()
+        try:
+            # プライマリの場合はget_dbのセッションをそのまま使う
+            assert (db is primary_session) == (await _which(db, primary) == "primary")
+            return await _which(db, primary)
+        finally:
+            await dependency.aclose()
+            await primary_session.close()
+
+def test_bearer_subject():
+    """有効なBearerトークンからのみユーザーを取得するテスト"""
+    token = create_access_token({"sub": "42"})
+    assert bearer_subject(f"Bearer {token}") == "42"
+    assert bearer_subject(f"bearer {token}") == "42"
+    assert bearer_subject("Bearer invalid") is None
+    assert bearer_subject(f"Basic {token}") is None
+    assert bearer_subject(None) is None
+
+@pytest.mark.asyncio
+async def test_read_db_uses_replica_without_recent_write(databases):
+    """変更の記録がなければレプリカを使うテスト"""
+    primary, replica = databases
+    recent_writes = RecentWrites(None, ttl_seconds=5)
+    token = create_access_token({"sub": "1"})
+
+    assert await _route(_request(token), primary, replica, recent_writes) == "replica"
+    assert await _route(_request(), primary, replica, recent_writes) == "replica"
+
+@pytest.mark.asyncio
+async def test_read_db_uses_primary_after_own_write(databases):
+    """変更を行ったユーザーの読み取りだけプライマリに送るテスト"""
+    primary, replica = databases
+    recent_writes = RecentWrites(None, ttl_seconds=5)
+    await recent_writes.mark("1")
+
+    assert await _route(_request(create_access_token({"sub": "1"})), primary, replica, recent_writes) == "primary"
+    assert await _route(_request(create_access_token({"sub": "2"})), primary, replica, recent_writes) == "replica"
+
+@pytest.mark.asyncio
+async def test_read_db_without_replica_uses_primary(databases):
+    """レプリカを設定していなければ常にプライマリを使うテスト"""
+    primary, _ = databases
+    recent_writes = MagicMock(is_recent=AsyncMock(return_value=False))
+
+    assert await _route(_request(), primary, primary, recent_writes) == "primary"
+    recent_writes.is_recent.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_recent_writes_expire():
+    """記録が期限切れになればレプリカに戻るテスト"""
+    recent_writes = RecentWrites(None, ttl_seconds=5)
+    with patch("app.db.routing.time.monotonic", return_value=100.0):
+        await recent_writes.mark("1")
+        assert await recent_writes.is_recent("1") is True
+    with patch("app.db.routing.time.monotonic", return_value=106.0):
+        assert await recent_writes.is_recent("1") is False
+
+@pytest.mark.asyncio
+async def test_recent_writes_shared_through_redis():
+    """他のワーカーの記録をRedisで確認するテスト"""
+    redis_client = MagicMock(set=AsyncMock(), exists=AsyncMock(return_value=1))
+    writer = RecentWrites(redis_client, ttl_seconds=2.5)
+    reader = RecentWrites(redis_client, ttl_seconds=2.5)
+
+    await writer.mark("7")
+    redis_client.set.assert_awaited_once_with("db:recent_write:7", 1, px=2500)
+    assert await reader.is_recent("7") is True
+    redis_client.exists.assert_awaited_once_with("db:recent_write:7")
+
+@pytest.mark.asyncio
+async def test_recent_writes_redis_error_falls_back_to_primary():
+    """Redisに問い合わせられない場合はプライマリを使うテスト"""
+    redis_client = MagicMock(exists=AsyncMock(side_effect=redis.ConnectionError("down")))
+    recent_writes = RecentWrites(redis_client, ttl_seconds=5)
+
+    assert await recent_writes.is_recent("1") is True
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("method,marked", [("POST", True), ("DELETE", True), ("GET", False)])
+async def test_middleware_marks_mutations(method, marked):
+    """変更系のリクエストのみ、レスポンスを返す前に記録するテスト"""
+    recent_writes = MagicMock(mark=AsyncMock())
+    sent = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        # レスポンスの送信時点で記録が済んでいる
+        sent.append((message["type"], recent_writes.mark.await_count))
+
+    token = create_access_token({"sub": "3"})
+    middleware = ReadYourWritesMiddleware(app, recent_writes=recent_writes)
+    await middleware(_request(token, method).scope, AsyncMock(), send)
+
+    if marked:
+        recent_writes.mark.assert_awaited_once_with("3")
+        assert sent[0] == ("http.response.start", 1)
+    else:
+        recent_writes.mark.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_middleware_marks_on_error_and_skips_anonymous():
+    """例外で終わった変更も記録し、未認証のリクエストは記録しないテスト"""
+    recent_writes = MagicMock(mark=AsyncMock())
+
+    async def failing_app(scope, receive, send):
+        raise RuntimeError("boom")
+
+    middleware = ReadYourWritesMiddleware(failing_app, recent_writes=recent_writes)
+    with pytest.raises(RuntimeError):
+        await middleware(_request(create_access_token({"sub": "5"}), "PUT").scope, AsyncMock(), AsyncMock())
+    recent_writes.mark.assert_awaited_once_with("5")
+
+    recent_writes.mark.reset_mock()
+    with pytest.raises(RuntimeError):
+        await middleware(_request(None, "PUT").scope, AsyncMock(), AsyncMock())
+    recent_writes.mark.assert_not_called()
@@ -0,0 +1,88 @@
+"""
+リクエスト単位のDBセッション（get_db）と例外ハンドラーのテスト
+"""
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, patch
+from fastapi import Depends, FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import get_db
+from app.db.pool import InstrumentedAsyncQueuePool
+from app.exceptions import setup_exception_handlers
+
+async def _session_owner(db: AsyncSession = Depends(get_db)) -> AsyncSession:
+    """認証などget_dbを使う別の依存関係の代わり"""
+    return db
+
+def _build_app() -> FastAPI:
+    app = FastAPI()
+    setup_exception_handlers(app)
+
+    @app.get("/ping")
+    def ping():
+        return {"message": "pong"}
+
+    @app.get("/cached")
+    async def cached(db: AsyncSession = Depends(get_db)):
+        # キャッシュヒットなどでクエリを実行しない
+        return {"ok": True}
+
+    @app.get("/query")
+    async def query(db: AsyncSession = Depends(get_db), other: AsyncSession = Depends(_session_owner)):
+        value = (await db.execute(text("SELECT 1"))).scalar()
+        return {"value": value, "shared": db is other}
+
+    @app.get("/broken/{item_id}")
+    async def broken(item_id: int, db: AsyncSession = Depends(get_db)):
+        raise OperationalError("SELECT 1", {}, Exception("connection lost"))
+
+    return app
+
+@pytest_asyncio.fixture
+async def client(tmp_path):
+    """計測付きプールのエンジンをget_dbに使うクライアント"""
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'request.db'}",
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=1,
+        max_overflow=0,
+    )
+    with patch("app.database.AsyncSessionLocal", sessionmaker(bind=engine, class_=AsyncSession)):
+        async with AsyncClient(transport=ASGITransport(app=_build_app()), base_url="http://test") as client:
+            client.pool_stats = engine.pool.stats
+            yield client
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_requests_without_queries_do_not_checkout(client):
+    """DBを使わないリクエストはプールから接続を取り出さないテスト"""
+    assert (await client.get("/ping")).status_code == 200
+    assert (await client.get("/cached")).status_code == 200
+
+    assert client.pool_stats.checkouts == 0
+
+@pytest.mark.asyncio
+async def test_dependencies_share_one_session(client):
+    """同じリクエストの依存関係が1つのセッション・1回の取り出しを共有するテスト"""
+    response = await client.get("/query")
+
+    assert response.json() == {"value": 1, "shared": True}
+    assert client.pool_stats.checkouts == 1
+
+@pytest.mark.asyncio
+async def test_database_error_is_logged_without_request_session(client):
+    """DBエラーはリクエストのセッションを使わずにログのキューへ渡すテスト"""
+    with patch("app.logs.async_log_handler.async_log_handler.add_application_log", new=AsyncMock()) as add_log:
+        response = await client.get("/broken/42")
+
+    assert response.status_code == 500
+    log = add_log.await_args.args[0]
+    assert log["source"] == "DATABASE"
+    # 実パスではなくルートのテンプレートで記録する
+    assert log["endpoint"] == "/broken/{item_id}"
+    assert log["additional_data"]["path"] == "/broken/42"
+    assert client.pool_stats.checkouts == 0
@@ -0,0 +1,91 @@
+"""
+トランザクション単位の作業（unit_of_work）のテスト
+"""
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.db.models.tag import Tag
+from app.db.unit_of_work import unit_of_work
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    """tagsテーブルだけを作成したSQLiteのセッション（コミット回数をcommitsに記録）"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'uow.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Tag.__table__.create)
+    session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)()
+    session.commits = 0
+
+    def count_commit(_):
+        session.commits += 1
+
+    event.listen(session.sync_session, "after_commit", count_commit)
+    yield session
+    await session.close()
+    await engine.dispose()
+
+async def _count(db: AsyncSession) -> int:
+    return (await db.execute(select(func.count()).select_from(Tag))).scalar()
+
+@pytest.mark.asyncio
+async def test_commits_once_for_multiple_changes(db):
+    """ブロック内の複数の変更を1回のコミットで反映するテスト"""
+    async with unit_of_work(db):
+        tag = Tag(name="a", color="blue")
+        db.add(tag)
+        await db.flush()
+        tag.color = "green"
+        db.add(Tag(name="b"))
+        await db.flush()
+
+    assert db.commits == 1
+    await db.rollback()
+    assert await _count(db) == 2
+
+@pytest.mark.asyncio
+async def test_rolls_back_on_error(db):
+    """途中で例外が発生した場合はどの変更も反映しないテスト"""
+    with pytest.raises(RuntimeError):
+        async with unit_of_work(db):
+            db.add(Tag(name="a"))
+            await db.flush()
+            raise RuntimeError("途中で失敗")
+
+    assert db.commits == 0
+    assert await _count(db) == 0
+
+@pytest.mark.asyncio
+async def test_nested_commits_at_outermost(db):
+    """ネストした場合は最も外側でのみコミットするテスト"""
+    async with unit_of_work(db):
+        async with unit_of_work(db):
+            db.add(Tag(name="a"))
+            await db.flush()
+        assert db.commits == 0
+        db.add(Tag(name="b"))
+        await db.flush()
+
+    assert db.commits == 1
+    assert await _count(db) == 2
+
+    # 終了後は次のunit_of_workで再びコミットする
+    async with unit_of_work(db):
+        db.add(Tag(name="c"))
+    assert db.commits == 2
+
+@pytest.mark.asyncio
+async def test_server_defaults_available_without_refresh(db):
+    """flush時にDB側の値（id, created_at, updated_at）を受け取り、refreshなしで参照できるテスト"""
+    async with unit_of_work(db):
+        tag = Tag(name="a")
+        db.add(tag)
+        await db.flush()
+        assert tag.id is not None
+        assert tag.created_at is not None and tag.updated_at is not None
+
+        tag.color = "red"
+        await db.flush()
+        # onupdateで更新されたupdated_atもRETURNINGで受け取っている（遅延読み込みは発生しない）
+        assert "updated_at" in tag.__dict__
@@ -0,0 +1,388 @@
+"""
+非同期ログハンドラーのテスト
+"""
+import asyncio
+import threading
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy import func, select
+from sqlalchemy.exc import DBAPIError, IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.db.base import Base
+from app.db.models.logs import ApplicationLog, AuditLog, PerformanceLog, PerformanceRollup
+from app.logs.async_log_handler import AsyncLogHandler, is_transient_error
+from app.logs.spill_buffer import SpillBuffer
+
+def make_handler(**kwargs):
+    """テスト用の小さなハンドラーを作成"""
+    options = {"max_size": 3, "batch_size": 100, "flush_interval_ms": 50, "overflow_policy": "drop_oldest",
+               "spill_dir": ""}
+    options.update(kwargs)
+    return AsyncLogHandler(**options)
+
+@pytest.fixture
+def no_engine():
+    """ワーカーが実際のDBエンジンを作らないようにする"""
+    engine = MagicMock()
+    engine.dispose = AsyncMock()
+    with patch("app.logs.async_log_handler.build_engine", return_value=engine) as build_engine:
+        yield build_engine
+
+def test_rejects_unknown_policy():
+    """未対応のオーバーフロー方式を拒否するテスト"""
+    with pytest.raises(ValueError):
+        make_handler(overflow_policy="drop_newest")
+
+@pytest.mark.asyncio
+async def test_drop_oldest():
+    """満杯時は最も古いログを捨てるテスト"""
+    handler = make_handler()
+    for i in range(5):
+        await handler.add_performance_log({"endpoint": f"/{i}"})
+
+    queued = [handler.perf_log_queue.get_nowait()["endpoint"] for _ in range(3)]
+    assert queued == ["/2", "/3", "/4"]
+    assert handler.dropped["performance"] == 2
+
+@pytest.mark.asyncio
+async def test_drop_by_level():
+    """drop_by_levelでは低レベルのログは新しい方を、高レベルは古い方を捨てるテスト"""
+    handler = make_handler(overflow_policy="drop_by_level", keep_level="WARNING")
+    for i in range(3):
+        await handler.add_application_log({"level": "INFO", "message": str(i)})
+
+    # INFOは追加されずに捨てられる
+    await handler.add_application_log({"level": "INFO", "message": "dropped"})
+    # ERRORは最も古いログを押し出して追加される
+    await handler.add_application_log({"level": "ERROR", "message": "kept"})
+
+    messages = [handler.app_log_queue.get_nowait()["message"] for _ in range(3)]
+    assert messages == ["1", "2", "kept"]
+    assert handler.dropped["application"] == 2
+
+@pytest.mark.asyncio
+async def test_drop_by_level_drops_performance_logs():
+    """drop_by_levelではパフォーマンスログは新しい方を捨てるテスト"""
+    handler = make_handler(overflow_policy="drop_by_level")
+    for i in range(4):
+        await handler.add_performance_log({"endpoint": f"/{i}"})
+
+    assert handler.perf_log_queue.get_nowait()["endpoint"] == "/0"
+    assert handler.dropped["performance"] == 1
+
+@pytest.mark.asyncio
+async def test_long_strings_are_truncated_to_column_length():
+    """クライアント由来の長い文字列を列の長さに切り詰めてからキューに積むテスト"""
+    handler = make_handler()
+    await handler.add_performance_log({"endpoint": "/a", "user_agent": "x" * 1000, "response_time": 1})
+    await handler.add_application_log({"level": "ERROR", "message": "m" * 1000, "endpoint": "/" * 300})
+
+    perf = handler.perf_log_queue.get_nowait()
+    assert perf["user_agent"] == "x" * 255
+    assert perf["endpoint"] == "/a"
+    app_log = handler.app_log_queue.get_nowait()
+    assert app_log["endpoint"] == "/" * 200
+    # Text列は切り詰めない
+    assert len(app_log["message"]) == 1000
+
+@pytest.mark.asyncio
+async def test_block_waits_for_space():
+    """blockでは空きができるまで呼び出し側を待たせるテスト"""
+    handler = make_handler(overflow_policy="block", max_size=1)
+    await handler.add_audit_log({"action": "CREATE"})
+
+    pending = asyncio.create_task(handler.add_audit_log({"action": "UPDATE"}))
+    await asyncio.sleep(0.01)
+    assert not pending.done()
+
+    handler.audit_log_queue.get_nowait()
+    await asyncio.wait_for(pending, timeout=1)
+    assert handler.audit_log_queue.get_nowait()["action"] == "UPDATE"
+    assert handler.dropped["audit"] == 0
+
+@pytest.mark.asyncio
+async def test_worker_flushes_on_batch_size(no_engine):
+    """バッチサイズに達したら期限を待たずに書き込むテスト"""
+    handler = make_handler(max_size=100, batch_size=2, flush_interval_ms=60000)
+    handler._write_batches = AsyncMock()
+    await handler.start()
+
+    await handler.add_performance_log({"endpoint": "/a"})
+    await handler.add_performance_log({"endpoint": "/b"})
+    await asyncio.sleep(0.05)
+
+    handler._write_batches.assert_awaited_once()
+    [(model, logs)] = handler._write_batches.call_args.args[0]
+    assert model is PerformanceLog
+    assert [log["endpoint"] for log in logs] == ["/a", "/b"]
+    await handler.stop()
+
+@pytest.mark.asyncio
+async def test_worker_flushes_on_deadline(no_engine):
+    """バッチサイズ未満でも期限が来たら書き込むテスト"""
+    handler = make_handler(max_size=100, batch_size=100, flush_interval_ms=20)
+    handler._write_batches = AsyncMock()
+    await handler.start()
+
+    await handler.add_application_log({"level": "INFO", "message": "hello"})
+    await asyncio.sleep(0.005)
+    handler._write_batches.assert_not_called()
+
+    await asyncio.sleep(0.1)
+    handler._write_batches.assert_awaited_once()
+    await handler.stop()
+
+@pytest.mark.asyncio
+async def test_worker_idles_without_logs(no_engine):
+    """ログがなければワーカーは書き込み処理を行わないテスト"""
+    handler = make_handler(flush_interval_ms=5)
+    handler._flush = AsyncMock()
+    await handler.start()
+
+    await asyncio.sleep(0.05)
+    handler._flush.assert_not_called()
+
+    await handler.stop()
+    # 停止時の最終書き込みのみ
+    handler._flush.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_stop_drains_remaining_logs(no_engine):
+    """停止時に残っているログを書き込むテスト"""
+    handler = make_handler(max_size=100, flush_interval_ms=60000)
+    handler._write_batches = AsyncMock()
+    await handler.start()
+
+    await handler.add_audit_log({"action": "DELETE"})
+    await handler.stop()
+
+    handler._write_batches.assert_awaited_once()
+    assert handler.pending() == 0
+
+@pytest.mark.asyncio
+async def test_worker_survives_write_error(no_engine):
+    """書き込みエラーでワーカーが停止しないテスト"""
+    handler = make_handler(max_size=100, batch_size=1)
+    handler._write_batches = AsyncMock(side_effect=[RuntimeError("db down"), None])
+    await handler.start()
+
+    await handler.add_performance_log({"endpoint": "/a"})
+    await asyncio.sleep(0.02)
+    await handler.add_performance_log({"endpoint": "/b"})
+    await asyncio.sleep(0.02)
+
+    assert handler._write_batches.await_count == 2
+    assert not handler.worker_task.done()
+    await handler.stop()
+
+@pytest.mark.asyncio
+async def test_flush_writes_all_types_in_one_transaction(no_engine):
+    """3種類のログを1回の書き込みにまとめるテスト"""
+    handler = make_handler(max_size=100, flush_interval_ms=60000)
+    handler._write_batches = AsyncMock()
+    await handler.start()
+
+    await handler.add_application_log({"level": "INFO", "message": "a"})
+    await handler.add_audit_log({"action": "CREATE"})
+    await handler.add_performance_log({"endpoint": "/a"})
+    await handler.stop()
+
+    handler._write_batches.assert_awaited_once()
+    models = [model for model, _ in handler._write_batches.call_args.args[0]]
+    assert models == [ApplicationLog, AuditLog, PerformanceLog]
+
+@pytest.mark.asyncio
+async def test_owned_engine_is_sized_and_disposed(no_engine):
+    """専用プールは設定サイズで作成し、停止時に破棄するテスト"""
+    handler = make_handler()
+    await handler.start()
+    engine = handler.engine
+    await handler.stop()
+
+    assert no_engine.call_args.kwargs["max_overflow"] == 0
+    assert "pool_size" in no_engine.call_args.kwargs
+    engine.dispose.assert_awaited_once()
+    assert handler.engine is None
+
+@pytest.mark.asyncio
+async def test_shared_engine_is_not_disposed(no_engine):
+    """渡されたエンジンは共有し、停止時に破棄しないテスト"""
+    engine = MagicMock()
+    engine.dispose = AsyncMock()
+    handler = make_handler(engine=engine)
+    await handler.start()
+    await handler.stop()
+
+    no_engine.assert_not_called()
+    engine.dispose.assert_not_called()
+    assert handler.engine is engine
+
+@pytest.mark.asyncio
+async def test_handler_writes_to_shared_engine():
+    """共有エンジン（SQLite）へ実際に書き込まれるテスト"""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            Base.metadata.create_all,
+            tables=[
+                ApplicationLog.__table__, AuditLog.__table__, PerformanceLog.__table__,
+                PerformanceRollup.__table__,
+            ],
+        )
+    handler = make_handler(max_size=100, batch_size=2, engine=engine, write_method="insert")
+    await handler.start()
+
+    for i in range(3):
+        await handler.add_performance_log({"endpoint": f"/{i}", "response_time": i, "status_code": 200})
+    await handler.add_application_log({"level": "ERROR", "source": "API", "message": "boom"})
+    await handler.stop()
+
+    async with engine.connect() as conn:
+        assert await conn.scalar(select(func.count()).select_from(PerformanceLog.__table__)) == 3
+        assert await conn.scalar(select(func.count()).select_from(ApplicationLog.__table__)) == 1
+        # ロールアップも同じ書き込みで加算される
+        assert await conn.scalar(
+            select(func.sum(PerformanceRollup.request_count)).where(PerformanceRollup.granularity == "hour")
+        ) == 3
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_spills_to_disk_and_replays_in_order(no_engine, tmp_path):
+    """DB障害中はディスクに退避し、復旧後に古い順に再生するテスト"""
+    handler = make_handler(max_size=100, batch_size=1, spill_dir=str(tmp_path))
+    handler.spill_retry_interval = 0.02
+    written = []
+    failing = True
+
+    async def write_batches(batches):
+        if failing:
+            raise ConnectionError("db down")
+        written.extend(log["endpoint"] for _, logs in batches for log in logs)
+
+    handler._write_batches = write_batches
+    await handler.start()
+
+    await handler.add_performance_log({"endpoint": "/1"})
+    await asyncio.sleep(0.01)
+    await handler.add_performance_log({"endpoint": "/2"})
+    await asyncio.sleep(0.01)
+    assert handler.spill.spilled == 2
+    assert written == []
+
+    # 復旧後は退避分を先に再生してから新しいログを書き込む
+    failing = False
+    await asyncio.sleep(0.05)
+    await handler.add_performance_log({"endpoint": "/3"})
+    await asyncio.sleep(0.02)
+
+    assert written == ["/1", "/2", "/3"]
+    assert handler.get_stats()["replayed"] == 2
+    assert not list(tmp_path.glob("*.seg"))
+    await handler.stop()
+
+@pytest.mark.asyncio
+async def test_spilled_logs_survive_restart(no_engine, tmp_path):
+    """停止時に書き込めなかったログを次回起動時に再生するテスト"""
+    handler = make_handler(max_size=100, flush_interval_ms=60000, spill_dir=str(tmp_path))
+    handler._write_batches = AsyncMock(side_effect=ConnectionError("db down"))
+    await handler.start()
+    await handler.add_audit_log({"action": "DELETE", "resource_type": "USER"})
+    await handler.stop()
+    assert list(tmp_path.glob("*.seg"))
+
+    restarted = make_handler(max_size=100, spill_dir=str(tmp_path))
+    restarted._write_batches = AsyncMock()
+    await restarted.start()
+    await asyncio.sleep(0.01)
+
+    [(model, logs)] = restarted._write_batches.call_args.args[0]
+    assert model is AuditLog
+    assert logs[0]["action"] == "DELETE"
+    assert logs[0]["timestamp"] is not None
+    assert not list(tmp_path.glob("*.seg"))
+    await restarted.stop()
+
+async def _log_engine():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            Base.metadata.create_all,
+            tables=[PerformanceLog.__table__, PerformanceRollup.__table__],
+        )
+    return engine
+
+def test_classifies_transient_errors():
+    """接続系のエラーは一時的、行の内容が原因のエラーは恒久的と判定するテスト"""
+    assert is_transient_error(ConnectionError("db down"))
+    assert is_transient_error(OperationalError("INSERT", {}, Exception("connection lost")))
+    assert is_transient_error(DBAPIError("INSERT", {}, MagicMock(sqlstate="08006")))
+    assert not is_transient_error(DBAPIError("INSERT", {}, MagicMock(sqlstate="22001")))
+    assert not is_transient_error(IntegrityError("INSERT", {}, Exception("not null")))
+    assert not is_transient_error(ValueError("bad row"))
+
+@pytest.mark.asyncio
+async def test_bad_row_is_rejected_without_dropping_batch():
+    """書き込めない行だけを破棄し、同じバッチの他の行は書き込むテスト"""
+    engine = await _log_engine()
+    handler = make_handler(max_size=100, engine=engine, write_method="insert")
+    await handler.start()
+
+    await handler.add_performance_log({"endpoint": "/ok", "response_time": 1, "status_code": 200})
+    await handler.add_performance_log({"endpoint": "/bad", "response_time": {"not": "bindable"}, "status_code": 200})
+    await handler.add_performance_log({"endpoint": "/ok2", "response_time": 2, "status_code": 200})
+    await handler.stop()
+
+    async with engine.connect() as conn:
+        endpoints = (await conn.execute(select(PerformanceLog.endpoint).order_by(PerformanceLog.id))).scalars().all()
+        assert endpoints == ["/ok", "/ok2"]
+        assert await conn.scalar(
+            select(func.sum(PerformanceRollup.request_count)).where(PerformanceRollup.granularity == "hour")
+        ) == 2
+    assert handler.get_stats()["rejected"]["performance"] == 1
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_replay_does_not_block_on_bad_row(tmp_path):
+    """退避したセグメントに書き込めない行があっても再生を進めるテスト"""
+    engine = await _log_engine()
+    handler = make_handler(max_size=100, engine=engine, write_method="insert", spill_dir=str(tmp_path))
+    spill = SpillBuffer(str(tmp_path), segment_size=4096)
+    spill.append([
+        ("performance", {"endpoint": "/bad", "response_time": {"not": "bindable"}}),
+        ("performance", {"endpoint": "/ok", "response_time": 1, "status_code": 200}),
+    ])
+    spill.close()
+    await handler.start()
+    await handler.stop()
+
+    async with engine.connect() as conn:
+        endpoints = (await conn.execute(select(PerformanceLog.endpoint))).scalars().all()
+        assert endpoints == ["/ok"]
+    assert handler.get_stats()["rejected"]["performance"] == 1
+    assert not list(tmp_path.glob("*.seg"))
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_spill_io_runs_off_event_loop(no_engine, tmp_path):
+    """ディスクへの退避と再生の読み出しをイベントループ以外のスレッドで行うテスト"""
+    handler = make_handler(max_size=100, flush_interval_ms=60000, spill_dir=str(tmp_path))
+    handler._write_batches = AsyncMock(side_effect=ConnectionError("db down"))
+    await handler.start()
+    threads = []
+    for name in ("append", "oldest"):
+        original = getattr(handler.spill, name)
+
+        def record_thread(*args, _original=original, **kwargs):
+            threads.append(threading.get_ident())
+            return _original(*args, **kwargs)
+
+        setattr(handler.spill, name, record_thread)
+
+    await handler.add_audit_log({"action": "DELETE", "resource_type": "USER"})
+    await handler._flush()
+    handler._next_replay_at = 0
+    await handler._flush()
+    await handler.stop()
+
+    assert len(threads) >= 2
+    assert threading.get_ident() not in threads
@@ -0,0 +1,124 @@
+"""
+ログのストリーミングエクスポートのテスト
+"""
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+import pytest
+import pytest_asyncio
+from fastapi import APIRouter, Depends, FastAPI, Query
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app.db.base import Base
+from app.db.models.logs import ApplicationLog
+from app.logs.log_manager import LogManager, export_response
+
+BASE_TIME = datetime(2025, 7, 1, 12, 0, tzinfo=timezone.utc)
+
+@pytest_asyncio.fixture
+async def session():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[ApplicationLog.__table__])
+    async with AsyncSession(engine) as session:
+        session.add_all([
+            ApplicationLog(
+                level="ERROR" if i % 5 == 0 else "INFO",
+                source="API",
+                message=f"メッセージ, {i}",
+                endpoint="/api/v1/tasks/{task_id}",
+                additional_data={"n": i},
+                timestamp=BASE_TIME + timedelta(seconds=i),
+            )
+            for i in range(50)
+        ])
+        await session.commit()
+        yield session
+    await engine.dispose()
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+@pytest.mark.asyncio
+async def test_export_ndjson(session):
+    """NDJSONで1行1件、新しい順に出力されるテスト"""
+    chunks = await collect(LogManager(session).export_logs("application", "ndjson"))
+
+    rows = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+    assert len(rows) == 50
+    assert rows[0]["message"] == "メッセージ, 49"
+    assert rows[0]["level"] == "INFO"
+    assert rows[0]["additional_data"] == {"n": 49}
+
+@pytest.mark.asyncio
+async def test_export_csv_with_filters(session):
+    """CSVはヘッダー付きで、検索条件が適用されるテスト"""
+    chunks = await collect(LogManager(session).export_logs("application", "csv", level="ERROR"))
+
+    rows = list(csv.DictReader(io.StringIO(b"".join(chunks).decode())))
+    assert len(rows) == 10
+    assert {row["level"] for row in rows} == {"ERROR"}
+    assert rows[0]["message"] == "メッセージ, 45"
+    assert json.loads(rows[0]["additional_data"]) == {"n": 45}
+
+@pytest.mark.asyncio
+async def test_export_gzip_streams_in_chunks(session):
+    """gzipを逐次圧縮し、小さなチャンクに分けて送信するテスト"""
+    plain = b"".join(await collect(LogManager(session).export_logs("application", "ndjson")))
+
+    with patch("app.logs.export.CHUNK_SIZE", 512), patch("app.logs.export.YIELD_PER", 7):
+        chunks = await collect(LogManager(session).export_logs("application", "ndjson", compress=True))
+
+    assert len(chunks) > 2
+    assert gzip.decompress(b"".join(chunks)) == plain
+
+@pytest.mark.asyncio
+async def test_export_response_streams_with_own_session(tmp_path):
+    """HTTPのエクスポートがリクエストの依存関係とは別のセッションでストリーミングされるテスト"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'export.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[ApplicationLog.__table__])
+    async with AsyncSession(engine) as db:
+        db.add_all([
+            ApplicationLog(level="INFO", source="API", message=f"m{i}", timestamp=BASE_TIME + timedelta(seconds=i))
+            for i in range(3)
+        ])
+        await db.commit()
+
+    used_in_dependency = []
+
+    async def read_db():
+        db = AsyncSession(engine)
+        try:
+            yield db
+        finally:
+            # ストリーミングに使われていれば、この時点で接続を保持している
+            used_in_dependency.append(db.in_transaction())
+            await db.close()
+
+    # エンドポイントと同じく、依存関係のセッションからレスポンスを作成する
+    router = APIRouter()
+
+    @router.get("/logs/application/export")
+    async def export_application_logs(format: str = "ndjson", compress: bool = Query(False, alias="gzip"),
+                                      db: AsyncSession = Depends(read_db)):
+        return export_response(db, "application", format, compress, {})
+
+    app = FastAPI()
+    app.include_router(router)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/logs/application/export", params={"format": "ndjson"})
+        compressed = await client.get("/logs/application/export", params={"format": "csv", "gzip": "true"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert 'filename="application_logs_' in response.headers["content-disposition"]
+    assert [json.loads(line)["message"] for line in response.text.splitlines()] == ["m2", "m1", "m0"]
+    assert compressed.headers["content-type"] == "application/gzip"
+    assert compressed.headers["content-disposition"].endswith('.csv.gz"')
+    assert len(list(csv.DictReader(io.StringIO(gzip.decompress(compressed.content).decode())))) == 3
+    assert used_in_dependency == [False, False]
+    await engine.dispose()
@@ -0,0 +1,48 @@
+"""
+レイテンシヒストグラムのテスト
+"""
+import pytest
+from app.logs.histogram import BUCKET_COUNT, LatencyHistogram, merge_histograms
+
+def test_quantile_within_relative_error():
+    """分位点の推定が相対誤差の範囲に収まるテスト"""
+    histogram = LatencyHistogram()
+    for value in range(1, 1001):
+        histogram.record(value)
+
+    assert histogram.total == 1000
+    assert histogram.quantile(0.5) == pytest.approx(500, rel=0.1)
+    assert histogram.quantile(0.95) == pytest.approx(950, rel=0.1)
+
+def test_quantile_of_empty_histogram_is_none():
+    """件数0のヒストグラムの分位点はNoneになるテスト"""
+    assert LatencyHistogram().quantile(0.95) is None
+
+def test_merge_equals_recording_all_values():
+    """マージした結果がまとめて記録した結果と一致するテスト"""
+    first, second, combined = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for value in (3, 40, 120):
+        first.record(value)
+        combined.record(value)
+    for value in (5, 900, 70000):
+        second.record(value)
+        combined.record(value)
+
+    assert first.merge(second).to_list() == combined.to_list()
+    assert merge_histograms([first.to_list(), None, []]).to_list() == combined.to_list()
+
+def test_from_list_validates_bucket_count():
+    """バケット数が異なるリストを拒否するテスト"""
+    assert LatencyHistogram.from_list(None).total == 0
+    with pytest.raises(ValueError):
+        LatencyHistogram.from_list([1] * (BUCKET_COUNT - 1))
+
+def test_quantiles_matches_single_quantile():
+    """複数分位点の一括推定が個別の推定と一致するテスト"""
+    histogram = LatencyHistogram()
+    for value in (1, 2, 5, 8, 13, 400, 2500):
+        histogram.record(value)
+
+    qs = (0.5, 0.95, 0.99)
+    assert histogram.quantiles(qs) == [histogram.quantile(q) for q in qs]
+    assert LatencyHistogram().quantiles(qs) == [None, None, None]
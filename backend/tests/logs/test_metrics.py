@@ -0,0 +1,73 @@
+"""
+プロセス内メトリクスと/metrics出力のテスト
+"""
+from unittest.mock import MagicMock
+from app.logs.metrics import MetricsRegistry, render_metrics, render_pool_stats, metrics
+
+def test_observe_counts_by_route_method_and_status():
+    """ルート・メソッド・ステータスごとに件数と分位点を集計するテスト"""
+    registry = MetricsRegistry()
+    for value in range(1, 101):
+        registry.observe("/api/v1/tasks/{task_id}", "GET", 200, float(value))
+    registry.observe("/api/v1/tasks/{task_id}", "GET", 404, 3.0)
+    registry.observe(None, "GET", 404, 1.0)
+
+    lines = registry.render()
+
+    assert 'http_requests_total{route="/api/v1/tasks/{task_id}",method="GET",status="200"} 100' in lines
+    assert 'http_requests_total{route="/api/v1/tasks/{task_id}",method="GET",status="404"} 1' in lines
+    assert 'http_requests_total{route="<unmatched>",method="GET",status="404"} 1' in lines
+    assert 'http_request_duration_seconds_count{route="/api/v1/tasks/{task_id}",method="GET"} 101' in lines
+
+def test_latency_is_rendered_as_cumulative_histogram():
+    """レイテンシを分位点ではなく累積のバケット件数として出力するテスト"""
+    registry = MetricsRegistry()
+    for value in (0.5, 3.0, 3.0, 40.0, 60000.0):
+        registry.observe("/ping", "GET", 200, value)
+
+    lines = registry.render()
+    labels = 'route="/ping",method="GET"'
+
+    assert "# TYPE http_request_duration_seconds histogram" in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.001"}} 1' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.005"}} 3' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.05"}} 4' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="30.0"}} 4' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 5' in lines
+    assert f"http_request_duration_seconds_sum{{{labels}}} {60046.5 / 1000!r}" in lines
+    assert not any("quantile=" in line for line in lines)
+
+def test_label_values_are_escaped():
+    """ラベル値の引用符とバックスラッシュをエスケープするテスト"""
+    registry = MetricsRegistry()
+    registry.observe('/a"b\\c', "GET", 200, 1.0)
+
+    assert 'http_requests_total{route="/a\\"b\\\\c",method="GET",status="200"} 1' in registry.render()
+
+def test_pool_stats_skip_pools_without_counters():
+    """QueuePool以外（NullPoolなど）とNoneのエンジンは出力しないテスト"""
+    engine = MagicMock()
+    engine.pool.size.return_value = 20
+    engine.pool.checkedout.return_value = 3
+    engine.pool.checkedin.return_value = 17
+    engine.pool.overflow.return_value = -17
+    null_engine = MagicMock()
+    null_engine.pool = object()
+
+    lines = render_pool_stats({"app": engine, "log": None, "other": null_engine})
+
+    assert 'db_pool_checked_out{pool="app"} 3' in lines
+    assert 'db_pool_size{pool="app"} 20' in lines
+    assert not any('pool="other"' in line or 'pool="log"' in line for line in lines)
+
+def test_render_metrics_includes_cache_and_log_queue_stats():
+    """キャッシュとログキューの状態も出力に含まれるテスト"""
+    metrics.observe("/ping", "GET", 200, 0.5)
+
+    body = render_metrics()
+
+    assert body.endswith("\n")
+    assert 'log_queue_size{queue="performance"}' in body
+    assert "cache_local_entries " in body
+    assert 'http_requests_total{route="/ping",method="GET",status="200"}' in body
+    metrics.reset()
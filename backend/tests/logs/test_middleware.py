@@ -0,0 +1,178 @@
+"""
+ロギングミドルウェアのテスト
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.logs.metrics import metrics
+from app.logs.middleware import LoggingMiddleware
+
+def make_scope(path="/api/v1/tasks"):
+    """HTTPリクエストのASGIスコープを作成"""
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": b"",
+        "headers": [(b"user-agent", b"pytest")],
+        "client": ("192.168.1.1", 50000),
+    }
+
+async def ok_app(scope, receive, send):
+    """200を返す後段のASGIアプリ"""
+    await send({"type": "http.response.start", "status": 201, "headers": [(b"content-length", b"2")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+async def streaming_app(scope, receive, send):
+    """Content-Lengthなしで本文を分割して送信する後段のASGIアプリ（StreamingResponse相当）"""
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    for chunk in (b"a" * 100, b"b" * 50, b""):
+        await send({"type": "http.response.body", "body": chunk, "more_body": bool(chunk)})
+
+async def failing_after_start_app(scope, receive, send):
+    """レスポンスの送信を始めてから例外を送出する後段のASGIアプリ"""
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"x" * 10, "more_body": True})
+    raise RuntimeError("stream broken")
+
+async def failing_app(scope, receive, send):
+    """例外を送出する後段のASGIアプリ"""
+    raise RuntimeError("boom")
+
+@pytest.fixture
+def log_handler():
+    """AsyncLogHandlerのモック"""
+    handler = MagicMock()
+    handler.add_performance_log = AsyncMock()
+    handler.add_application_log = AsyncMock()
+    with patch("app.logs.middleware.async_log_handler", handler):
+        yield handler
+
+@pytest.fixture
+def db_calls():
+    """リクエスト処理中のDBセッション操作を検知する"""
+    with patch("app.database.AsyncSessionLocal") as session_factory, \
+            patch.object(AsyncSession, "add") as add, \
+            patch.object(AsyncSession, "flush", new_callable=AsyncMock) as flush:
+        yield session_factory, add, flush
+
+async def run_middleware(middleware, scope):
+    """ミドルウェアを実行し、送信されたメッセージを返す"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    return messages
+
+@pytest.mark.asyncio
+async def test_logging_middleware_enqueues_performance_log(log_handler, db_calls):
+    """パフォーマンスログはキューに積むだけでDB操作を行わないテスト"""
+    middleware = LoggingMiddleware(ok_app)
+
+    messages = await run_middleware(middleware, make_scope())
+
+    assert messages[0]["status"] == 201
+    log_handler.add_performance_log.assert_awaited_once()
+    entry = log_handler.add_performance_log.call_args.args[0]
+    # ルートに一致していない（後段がrouteを設定しない）ので実パスは追加情報に残る
+    assert entry["endpoint"] == "<unmatched>"
+    assert entry["additional_metrics"] == {"path": "/api/v1/tasks"}
+    assert entry["status_code"] == 201
+    assert entry["request_method"] == "GET"
+    assert entry["response_size"] == 2
+    assert entry["ip_address"] == "192.168.1.1"
+    assert entry["user_agent"] == "pytest"
+    assert entry["response_time"] >= 0
+    log_handler.add_application_log.assert_not_called()
+
+    # DBセッションの生成・追加・フラッシュは一切行われない
+    session_factory, add, flush = db_calls
+    session_factory.assert_not_called()
+    add.assert_not_called()
+    flush.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_logging_middleware_enqueues_error_log(log_handler, db_calls):
+    """例外時はエラーログとステータス500のパフォーマンスログをキューに積むテスト"""
+    middleware = LoggingMiddleware(failing_app)
+
+    with pytest.raises(RuntimeError):
+        await run_middleware(middleware, make_scope())
+
+    app_entry = log_handler.add_application_log.call_args.args[0]
+    assert app_entry["level"] == "ERROR"
+    assert app_entry["source"] == "MIDDLEWARE"
+    assert app_entry["request_id"]
+    assert "boom" in app_entry["additional_data"]["exception"]
+    perf_entry = log_handler.add_performance_log.call_args.args[0]
+    assert perf_entry["status_code"] == 500
+    # 正常時と同じ項目を記録する
+    assert perf_entry["user_agent"] == "pytest"
+    assert perf_entry["response_size"] == 0
+
+    session_factory, add, flush = db_calls
+    session_factory.assert_not_called()
+    add.assert_not_called()
+    flush.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_logging_middleware_sets_request_state(log_handler):
+    """リクエストIDなどをスコープのstateに保存するテスト"""
+    middleware = LoggingMiddleware(ok_app)
+    scope = make_scope()
+
+    await run_middleware(middleware, scope)
+
+    assert scope["state"]["request_id"]
+    assert scope["state"]["path"] == "/api/v1/tasks"
+    assert scope["state"]["method"] == "GET"
+
+@pytest.mark.asyncio
+async def test_logging_middleware_records_metrics_by_route_template(log_handler):
+    """メトリクスとパフォーマンスログはパスではなく一致したルートのテンプレートで記録されるテスト"""
+    async def routed_app(scope, receive, send):
+        # ルーティング時にFastAPIがscopeへrouteを設定する
+        scope["route"] = MagicMock(path="/api/v1/tasks/{task_id}")
+        await ok_app(scope, receive, send)
+
+    metrics.reset()
+    middleware = LoggingMiddleware(routed_app)
+    await run_middleware(middleware, make_scope("/api/v1/tasks/1"))
+    await run_middleware(middleware, make_scope("/api/v1/tasks/2"))
+
+    lines = metrics.render()
+    assert 'http_requests_total{route="/api/v1/tasks/{task_id}",method="GET",status="201"} 2' in lines
+    entries = [call.args[0] for call in log_handler.add_performance_log.call_args_list]
+    assert [entry["endpoint"] for entry in entries] == ["/api/v1/tasks/{task_id}"] * 2
+    assert entries[0]["additional_metrics"] is None
+    assert not any("/api/v1/tasks/1" in line for line in lines)
+    metrics.reset()
+
+@pytest.mark.asyncio
+async def test_logging_middleware_counts_streamed_body(log_handler):
+    """Content-Lengthのないストリーミングレスポンスは送信した本文のバイト数を記録するテスト"""
+    await run_middleware(LoggingMiddleware(streaming_app), make_scope())
+
+    entry = log_handler.add_performance_log.call_args.args[0]
+    assert entry["status_code"] == 200
+    assert entry["response_size"] == 150
+
+@pytest.mark.asyncio
+async def test_logging_middleware_error_after_response_started(log_handler):
+    """レスポンス開始後の例外は送信済みのステータスとサイズで記録するテスト"""
+    metrics.reset()
+    with pytest.raises(RuntimeError):
+        await run_middleware(LoggingMiddleware(failing_after_start_app), make_scope())
+
+    entry = log_handler.add_performance_log.call_args.args[0]
+    assert entry["status_code"] == 200
+    assert entry["response_size"] == 10
+    assert entry["user_agent"] == "pytest"
+    log_handler.add_application_log.assert_awaited_once()
+    assert any('status="200"' in line for line in metrics.render() if line.startswith("http_requests_total"))
+    metrics.reset()
@@ -0,0 +1,75 @@
+"""
+ログ検索のキーセットページネーションのテスト
+"""
+from datetime import datetime, timedelta, timezone
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app.db.base import Base
+from app.db.models.logs import PerformanceLog
+from app.exceptions import BadRequestException
+from app.logs.log_manager import LogManager
+from app.logs.pagination import decode_cursor, encode_cursor, next_cursor
+
+BASE_TIME = datetime(2025, 7, 1, 12, 0, tzinfo=timezone.utc)
+
+@pytest_asyncio.fixture
+async def session():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[PerformanceLog.__table__])
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        # 同じtimestampの行を含めて25件（idで順序が決まることを確認する）
+        session.add_all([
+            PerformanceLog(
+                endpoint="/api/v1/tasks/{task_id}" if i % 2 else "/ping",
+                response_time=i,
+                status_code=200,
+                timestamp=BASE_TIME + timedelta(seconds=i // 3),
+            )
+            for i in range(25)
+        ])
+        await session.commit()
+        yield session
+    await engine.dispose()
+
+def test_cursor_round_trip():
+    """カーソルの作成と復元のテスト"""
+    cursor = encode_cursor(BASE_TIME, 42)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (BASE_TIME, 42)
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor(BASE_TIME, 1)[:-3], "W10"])
+def test_invalid_cursor_is_rejected(cursor):
+    """不正なカーソルは400（BadRequestException）になるテスト"""
+    with pytest.raises(BadRequestException):
+        decode_cursor(cursor)
+
+@pytest.mark.asyncio
+async def test_keyset_pages_match_offset_pages(session):
+    """カーソルで辿った結果がOFFSETでの全件取得と一致するテスト"""
+    manager = LogManager(session)
+    expected = [log.id for log in await manager.get_performance_logs(limit=100)]
+
+    seen, cursor = [], None
+    while True:
+        page = await manager.get_performance_logs(limit=10, cursor=cursor)
+        seen += [log.id for log in page]
+        cursor = next_cursor(page, 10)
+        if cursor is None:
+            break
+
+    assert seen == expected
+    assert len(seen) == 25
+
+@pytest.mark.asyncio
+async def test_keyset_applies_filters(session):
+    """カーソル指定時も検索条件が適用されるテスト"""
+    manager = LogManager(session)
+    first = await manager.get_performance_logs(endpoint="/ping", limit=5)
+    second = await manager.get_performance_logs(endpoint="/ping", limit=5, cursor=next_cursor(first, 5))
+
+    assert all(log.endpoint == "/ping" for log in first + second)
+    assert not {log.id for log in first} & {log.id for log in second}
+    assert (second[0].timestamp, second[0].id) < (first[-1].timestamp, first[-1].id)
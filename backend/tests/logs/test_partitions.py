@@ -0,0 +1,271 @@
+"""
+ログテーブルのパーティション管理のテスト
+"""
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.logs.partitions import (
+    expired_partitions,
+    maintain_partitions,
+    partition_name,
+    planned_partitions,
+    run_partition_maintenance,
+)
+
+def test_planned_partitions_daily():
+    """日次パーティションを当日から事前作成数分計画するテスト"""
+    planned = planned_partitions(date(2025, 6, 14), "daily", precreate=2)
+
+    assert planned == [
+        (date(2025, 6, 14), date(2025, 6, 15)),
+        (date(2025, 6, 15), date(2025, 6, 16)),
+        (date(2025, 6, 16), date(2025, 6, 17)),
+    ]
+
+def test_planned_partitions_weekly():
+    """週次パーティションは月曜始まりになるテスト"""
+    planned = planned_partitions(date(2025, 6, 14), "weekly", precreate=1)
+
+    assert planned == [
+        (date(2025, 6, 9), date(2025, 6, 16)),
+        (date(2025, 6, 16), date(2025, 6, 23)),
+    ]
+
+def test_planned_partitions_rejects_unknown_interval():
+    """未対応の間隔を拒否するテスト"""
+    with pytest.raises(ValueError):
+        planned_partitions(date(2025, 6, 14), "monthly")
+
+def test_partition_name():
+    """パーティション名の形式のテスト"""
+    assert partition_name("audit_logs", date(2025, 6, 9)) == "audit_logs_p20250609"
+
+def test_expired_partitions():
+    """終了日が保持期間より前のパーティションのみ対象になるテスト"""
+    partitions = [
+        ("logs_p20250512", date(2025, 5, 12), date(2025, 5, 13)),
+        ("logs_p20250514", date(2025, 5, 14), date(2025, 5, 15)),
+        ("logs_p20250515", date(2025, 5, 15), date(2025, 5, 16)),
+        ("logs_default", None, None),
+    ]
+
+    # 2025-06-14の30日前は2025-05-15
+    assert expired_partitions(partitions, date(2025, 6, 14), 30) == ["logs_p20250512", "logs_p20250514"]
+
+def make_connection(partitions, default_rows=False, locked=True, pending=False):
+    """
+    パーティション一覧を返す接続のモック
+    statementsには実行したSQL、BEGIN/COMMIT、分離レベルの変更（ISOLATION ...）を記録する。
+    """
+    conn = MagicMock()
+    statements = []
+
+    async def execute(statement, params=None):
+        sql = str(statement)
+        statements.append(sql)
+        if "relpartbound" in sql:
+            return [
+                (f"{params['table']}{suffix}", bound) for suffix, bound in partitions
+            ]
+        result = MagicMock()
+        if "pg_try_advisory_lock" in sql:
+            result.scalar.return_value = locked
+        elif "inhdetachpending" in sql:
+            result.scalar.return_value = pending
+        else:
+            result.scalar.return_value = default_rows
+        result.rowcount = 3
+        return result
+
+    @asynccontextmanager
+    async def begin():
+        statements.append("BEGIN")
+        yield
+        statements.append("COMMIT")
+
+    async def execution_options(isolation_level):
+        statements.append(f"ISOLATION {isolation_level}")
+        return conn
+
+    conn.execute = AsyncMock(side_effect=execute)
+    conn.execution_options = AsyncMock(side_effect=execution_options)
+    conn.sync_connection.default_isolation_level = "READ COMMITTED"
+    conn.begin = begin
+    conn.commit = AsyncMock()
+    return conn, statements
+
+def transactions(statements):
+    """BEGIN〜COMMITごとのSQLのリスト"""
+    result, current = [], None
+    for sql in statements:
+        if sql == "BEGIN":
+            current = []
+        elif sql == "COMMIT":
+            result.append(current)
+            current = None
+        elif current is not None:
+            current.append(sql)
+    return result
+
+@pytest.mark.asyncio
+async def test_maintain_partitions_creates_and_drops():
+    """不足分を作成し、期限切れをDROPするテスト（パーティションの行はDELETEしない）"""
+    conn, statements = make_connection([
+        ("_p20250501", "FOR VALUES FROM ('2025-05-01 00:00:00+00') TO ('2025-05-02 00:00:00+00')"),
+        ("_p20250614", "FOR VALUES FROM ('2025-06-14 00:00:00+00') TO ('2025-06-15 00:00:00+00')"),
+        ("_default", "DEFAULT"),
+    ])
+
+    created, dropped = await maintain_partitions(
+        conn, today=date(2025, 6, 14), interval="daily", precreate=1, retention_days=30
+    )
+
+    assert "pg_try_advisory_lock" in statements[0]
+    assert "pg_advisory_unlock" in statements[-1]
+    assert created == ["application_logs_p20250615", "audit_logs_p20250615", "performance_logs_p20250615"]
+    assert dropped == ["application_logs_p20250501", "audit_logs_p20250501", "performance_logs_p20250501"]
+    assert any(
+        'CREATE TABLE IF NOT EXISTS "audit_logs_p20250615" PARTITION OF "audit_logs" '
+        "FOR VALUES FROM ('2025-06-15 00:00:00+00') TO ('2025-06-16 00:00:00+00')" in sql
+        for sql in statements
+    )
+    assert [sql for sql in statements if "DELETE" in sql] == [
+        f'DELETE FROM "{table}_default" WHERE timestamp < :cutoff'
+        for table in ("application_logs", "audit_logs", "performance_logs")
+    ]
+
+@pytest.mark.asyncio
+async def test_maintain_partitions_commits_each_operation():
+    """作成・削除を1つずつ別のトランザクションで実行するテスト"""
+    conn, statements = make_connection([
+        ("_p20250501", "FOR VALUES FROM ('2025-05-01 00:00:00+00') TO ('2025-05-02 00:00:00+00')"),
+    ])
+
+    await maintain_partitions(conn, today=date(2025, 6, 14), interval="daily", precreate=0, retention_days=30)
+
+    ddl = [
+        [sql for sql in transaction if "CREATE" in sql or "DROP" in sql]
+        for transaction in transactions(statements)
+    ]
+    # テーブルごとに 一覧の取得 / 作成 / 削除 の3つのトランザクション
+    assert len(ddl) == 9
+    assert all(len(statements_in_tx) <= 1 for statements_in_tx in ddl)
+
+@pytest.mark.asyncio
+async def test_maintain_partitions_moves_rows_out_of_default():
+    """デフォルトパーティションに範囲内の行があれば、移してからATTACHするテスト"""
+    conn, statements = make_connection([("_default", "DEFAULT")], default_rows=True)
+
+    created, _ = await maintain_partitions(
+        conn, today=date(2025, 6, 14), interval="daily", precreate=0, retention_days=30
+    )
+
+    assert created == ["application_logs_p20250614", "audit_logs_p20250614", "performance_logs_p20250614"]
+    create = next(tx for tx in transactions(statements) if any("audit_logs_p20250614" in sql for sql in tx))
+    assert create[1] == 'CREATE TABLE "audit_logs_p20250614" (LIKE "audit_logs" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+    assert create[2].startswith('WITH moved AS (DELETE FROM "audit_logs_default"')
+    assert create[3] == (
+        'ALTER TABLE "audit_logs" ATTACH PARTITION "audit_logs_p20250614" '
+        "FOR VALUES FROM ('2025-06-14 00:00:00+00') TO ('2025-06-15 00:00:00+00')"
+    )
+    # 範囲内の行はUTCの0時を境界に判定する
+    params = [call.args[1] for call in conn.execute.await_args_list if "SELECT EXISTS" in str(call.args[0])]
+    assert params[0]["start"] == datetime(2025, 6, 14, tzinfo=timezone.utc)
+    assert params[0]["end"] == datetime(2025, 6, 15, tzinfo=timezone.utc)
+
+@pytest.mark.asyncio
+async def test_maintain_partitions_skips_when_locked_elsewhere():
+    """他のワーカーがロックを持っていれば何もしないテスト"""
+    conn, statements = make_connection([], locked=False)
+
+    assert await maintain_partitions(conn, today=date(2025, 6, 14)) == ([], [])
+    assert len(statements) == 1
+
+@pytest.mark.asyncio
+async def test_maintain_partitions_skips_overlapping_ranges():
+    """間隔の変更で既存パーティションと重なる範囲は作成しないテスト"""
+    conn, _ = make_connection([
+        ("_p20250614", "FOR VALUES FROM ('2025-06-14 00:00:00+00') TO ('2025-06-15 00:00:00+00')"),
+    ])
+
+    created, _ = await maintain_partitions(
+        conn, today=date(2025, 6, 14), interval="weekly", precreate=1, retention_days=30
+    )
+
+    assert created == ["application_logs_p20250616", "audit_logs_p20250616", "performance_logs_p20250616"]
+
+@pytest.mark.asyncio
+async def test_run_partition_maintenance_skips_non_postgres():
+    """PostgreSQL以外では何もしないテスト"""
+    engine = MagicMock()
+    engine.dialect.name = "sqlite"
+
+    assert await run_partition_maintenance(engine) == ([], [])
+    engine.connect.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_drop_detaches_concurrently_without_default():
+    """デフォルトパーティションがなければトランザクションの外でCONCURRENTLYで切り離してからDROPするテスト"""
+    conn, statements = make_connection([
+        ("_p20250501", "FOR VALUES FROM ('2025-05-01 00:00:00+00') TO ('2025-05-02 00:00:00+00')"),
+    ])
+
+    await maintain_partitions(conn, today=date(2025, 6, 14), interval="daily", precreate=0, retention_days=30)
+
+    start = statements.index("ISOLATION AUTOCOMMIT")
+    assert "inhdetachpending" in statements[start + 1]
+    assert statements[start + 2:start + 7] == [
+        'ALTER TABLE "application_logs" DETACH PARTITION "application_logs_p20250501" CONCURRENTLY',
+        "ISOLATION READ COMMITTED",
+        "BEGIN",
+        'DROP TABLE IF EXISTS "application_logs_p20250501"',
+        "COMMIT",
+    ]
+
+@pytest.mark.asyncio
+async def test_drop_finalizes_pending_detach():
+    """中断された切り離しはFINALIZEで完了させるテスト"""
+    conn, statements = make_connection([
+        ("_p20250501", "FOR VALUES FROM ('2025-05-01 00:00:00+00') TO ('2025-05-02 00:00:00+00')"),
+    ], pending=True)
+
+    await maintain_partitions(conn, today=date(2025, 6, 14), interval="daily", precreate=0, retention_days=30)
+
+    assert 'ALTER TABLE "audit_logs" DETACH PARTITION "audit_logs_p20250501" FINALIZE' in statements
+    assert not [sql for sql in statements if "CONCURRENTLY" in sql]
+
+@pytest.mark.asyncio
+async def test_drop_detaches_with_lock_timeout_when_default_exists():
+    """デフォルトパーティションがある場合はlock_timeout付きのトランザクションで切り離し、別にDROPするテスト"""
+    conn, statements = make_connection([
+        ("_p20250501", "FOR VALUES FROM ('2025-05-01 00:00:00+00') TO ('2025-05-02 00:00:00+00')"),
+        ("_default", "DEFAULT"),
+    ])
+
+    await maintain_partitions(conn, today=date(2025, 6, 14), interval="daily", precreate=0, retention_days=30)
+
+    tx = transactions(statements)
+    detach = tx.index([
+        "SET LOCAL lock_timeout = '5s'",
+        'ALTER TABLE "performance_logs" DETACH PARTITION "performance_logs_p20250501"',
+    ])
+    assert tx[detach + 1] == ['DROP TABLE IF EXISTS "performance_logs_p20250501"']
+    assert "ISOLATION AUTOCOMMIT" not in statements
+
+@pytest.mark.asyncio
+async def test_partition_bounds_read_as_utc():
+    """セッションのTimeZoneで表示された境界をUTCの日付として扱うテスト"""
+    conn, _ = make_connection([
+        # UTCの2025-05-01 0時〜2025-05-02 0時をUTC-4のセッションで表示したもの
+        ("_p20250501", "FOR VALUES FROM ('2025-04-30 20:00:00-04') TO ('2025-05-01 20:00:00-04')"),
+        ("_p20250614", "FOR VALUES FROM ('2025-06-14 09:00:00+09') TO ('2025-06-15 09:00:00+09')"),
+    ])
+
+    created, dropped = await maintain_partitions(
+        conn, today=date(2025, 6, 14), interval="daily", precreate=0, retention_days=44
+    )
+
+    # 2025-06-14の44日前は2025-05-01（終了日が2025-05-02のパーティションはまだ残す）
+    assert dropped == []
+    assert created == []
@@ -0,0 +1,127 @@
+"""
+パフォーマンスログのロールアップのテスト
+"""
+from datetime import datetime, timedelta, timezone
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app.db.base import Base
+from app.db.models.logs import PerformanceLog, PerformanceRollup
+from app.logs.log_manager import LogManager
+from app.logs.rollups import apply_rollups, bucket_start, build_rollups, prune_rollups, status_class
+
+NOW = datetime(2025, 6, 21, 10, 15, 30, tzinfo=timezone.utc)
+
+@pytest_asyncio.fixture
+async def engine():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[PerformanceLog.__table__, PerformanceRollup.__table__])
+    yield engine
+    await engine.dispose()
+
+async def write(engine, logs, now=NOW):
+    async with AsyncSession(engine) as session:
+        async with session.begin():
+            await apply_rollups(session, build_rollups(logs, now=now))
+
+def perf_log(endpoint="/api/v1/tasks", response_time=100, status_code=200, method="GET", **extra):
+    return {
+        "endpoint": endpoint,
+        "response_time": response_time,
+        "status_code": status_code,
+        "request_method": method,
+        **extra,
+    }
+
+def test_status_class_and_bucket_start():
+    """ステータスクラスとバケット開始時刻の計算のテスト"""
+    assert status_class(404) == "4xx"
+    assert status_class(None) == ""
+    assert bucket_start(NOW, "minute") == datetime(2025, 6, 21, 10, 15, tzinfo=timezone.utc)
+    assert bucket_start(NOW, "hour") == datetime(2025, 6, 21, 10, tzinfo=timezone.utc)
+
+def test_build_rollups_groups_by_key():
+    """エンドポイント・メソッド・ステータスクラスごとに分と時間で集計するテスト"""
+    deltas = build_rollups(
+        [perf_log(response_time=10), perf_log(response_time=30, status_code=201), perf_log(status_code=500)],
+        now=NOW,
+    )
+
+    hour = bucket_start(NOW, "hour")
+    ok = deltas[("hour", hour, "/api/v1/tasks", "GET", "2xx")]
+    assert (ok.count, ok.total, ok.min, ok.max) == (2, 40, 10, 30)
+    assert deltas[("hour", hour, "/api/v1/tasks", "GET", "5xx")].count == 1
+    assert len(deltas) == 4
+
+@pytest.mark.asyncio
+async def test_apply_rollups_accumulates_incrementally(engine):
+    """既存のロールアップ行に加算されるテスト"""
+    await write(engine, [perf_log(response_time=50), perf_log(response_time=150)])
+    await write(engine, [perf_log(response_time=20), perf_log(response_time=400)])
+
+    async with AsyncSession(engine) as session:
+        rows = (await session.execute(
+            select(PerformanceRollup).order_by(PerformanceRollup.granularity)
+        )).scalars().all()
+
+    assert [row.granularity for row in rows] == ["hour", "minute"]
+    for row in rows:
+        assert row.request_count == 4
+        assert row.total_time_ms == 620
+        assert (row.min_time_ms, row.max_time_ms) == (20, 400)
+        assert sum(row.histogram) == 4
+
+@pytest.mark.asyncio
+async def test_prune_rollups_keeps_recent_rows(engine):
+    """保持期間を過ぎた分単位のロールアップだけを削除するテスト"""
+    await write(engine, [perf_log()], now=NOW - timedelta(days=3))
+    await write(engine, [perf_log()], now=NOW)
+
+    deleted = await prune_rollups(engine, now=NOW)
+
+    async with AsyncSession(engine) as session:
+        rows = (await session.execute(select(PerformanceRollup.granularity))).scalars().all()
+    assert deleted == 1
+    assert sorted(rows) == ["hour", "hour", "minute"]
+
+@pytest.mark.asyncio
+async def test_analyze_performance_reads_rollups(engine):
+    """分析結果が時間単位のロールアップから集計されるテスト"""
+    now = datetime.now(timezone.utc)
+    await write(engine, [perf_log(response_time=t) for t in range(1, 101)], now=now)
+    await write(engine, [perf_log(endpoint="/slow", response_time=900, status_code=503)] * 3, now=now)
+    async with AsyncSession(engine) as session:
+        # 個別のステータスコードは生ログから集計する
+        session.add_all(
+            PerformanceLog(timestamp=now, **perf_log(status_code=code))
+            for code in [200] * 98 + [201, 201] + [503] * 3
+        )
+        await session.commit()
+
+    async with AsyncSession(engine) as session:
+        manager = LogManager(session)
+        result = await manager.analyze_performance(days=1, min_requests=5)
+        slow = await manager.get_slow_endpoints(threshold_ms=500)
+
+    assert result["total_requests"] == 103
+    assert result["status_code_distribution"] == {"200": 98, "503": 3, "201": 2}
+    assert result["status_class_distribution"] == {"2xx": 100, "5xx": 3}
+    assert result["min_response_time_ms"] == 1
+    assert result["avg_response_time_ms"] == round((5050 + 2700) / 103)
+    assert result["max_response_time_ms"] == 900
+    [tasks] = result["all_endpoints"]  # /slowは件数がmin_requests未満
+    assert tasks["request_count"] == 100
+    assert tasks["avg_time_ms"] == 50
+    assert tasks["p95_time_ms"] == pytest.approx(95, rel=0.1)
+    assert tasks["error_count"] == 0
+    assert [row["endpoint"] for row in slow] == ["/slow"]
+
+    async with AsyncSession(engine) as session:
+        result = await LogManager(session).analyze_performance(days=1, min_requests=1)
+    slow_stats = next(stat for stat in result["all_endpoints"] if stat["endpoint"] == "/slow")
+    assert slow_stats["error_count"] == 3
+    # ヒストグラムは/slowの行だけから作る（同じバケット内なので上限側に推定される）
+    assert 900 <= slow_stats["p95_time_ms"] <= 900 * 1.2
+    assert slow[0]["avg_time"] == 900
@@ -0,0 +1,67 @@
+"""
+ルートテンプレートの逆引きのテスト
+"""
+import importlib.util
+import sys
+from pathlib import Path
+from fastapi import APIRouter
+from app.logs.route_templates import compile_route_templates, endpoint_rewrites, match_route_template
+
+def make_templates():
+    router = APIRouter()
+
+    @router.get("/tasks/{task_id}")
+    def get_task(task_id: int):
+        return {}
+
+    @router.get("/tasks/{task_id}/comments/{comment_id}")
+    def get_comment(task_id: int, comment_id: int):
+        return {}
+
+    @router.get("/tasks")
+    def list_tasks():
+        return {}
+
+    return compile_route_templates(router.routes, "/api/v1")
+
+def test_match_route_template_with_prefix():
+    """プレフィックス付きの実パスからテンプレートを逆引きするテスト"""
+    templates = make_templates()
+
+    assert match_route_template("/api/v1/tasks/12", templates) == "/api/v1/tasks/{task_id}"
+    assert match_route_template("/api/v1/tasks/1/comments/2", templates) == "/api/v1/tasks/{task_id}/comments/{comment_id}"
+    assert match_route_template("/api/v1/tasks", templates) == "/api/v1/tasks"
+    assert match_route_template("/tasks/12", templates) is None
+
+def test_endpoint_rewrites_skips_templates_and_unknown_paths():
+    """テンプレート済み・一致しないエンドポイントは書き換え対象外になるテスト"""
+    rewrites = endpoint_rewrites(
+        ["/api/v1/tasks/1", "/api/v1/tasks/2", "/api/v1/tasks/{task_id}", "/api/v1/tasks",
+         "/wp-login.php", "<unmatched>", None],
+        make_templates(),
+    )
+
+    assert rewrites == {
+        "/api/v1/tasks/1": "/api/v1/tasks/{task_id}",
+        "/api/v1/tasks/2": "/api/v1/tasks/{task_id}",
+    }
+
+def test_migration_uses_frozen_templates():
+    """マイグレーションはアプリのルーターや設定を読み込まず、固定したテンプレートで書き換えるテスト"""
+    path = Path(__file__).parents[2] / "alembic" / "versions" / "d41a7c9e5f20_route_template_endpoints.py"
+    spec = importlib.util.spec_from_file_location("route_template_migration", path)
+    migration = importlib.util.module_from_spec(spec)
+    loaded = set(sys.modules)
+    spec.loader.exec_module(migration)
+
+    assert not [name for name in set(sys.modules) - loaded
+                if name.startswith(("app.api", "app.config", "app.main"))]
+    rewrites = endpoint_rewrites(
+        ["/api/v1/qrcodes/batch", "/api/v1/qrcodes/3", "/api/v1/users/me", "/api/v1/tasks/users/4"],
+        migration._route_templates(),
+    )
+    # 固定のパスはパラメータ付きのテンプレートに書き換えない
+    assert rewrites == {
+        "/api/v1/qrcodes/3": "/api/v1/qrcodes/{qrcode_id}",
+        "/api/v1/tasks/users/4": "/api/v1/tasks/users/{user_id}",
+    }
@@ -0,0 +1,73 @@
+"""
+ログ退避用ディスクバッファのテスト
+"""
+from datetime import datetime
+import pytest
+from app.logs.spill_buffer import SpillBuffer
+
+def test_append_and_read_in_order(tmp_path):
+    """追記したレコードを順に読み出せるテスト"""
+    buffer = SpillBuffer(str(tmp_path), segment_size=4096)
+    buffer.append([("audit", {"action": "CREATE"}), ("performance", {"endpoint": "/a"})])
+
+    path, records = buffer.oldest()
+
+    assert [kind for kind, _ in records] == ["audit", "performance"]
+    assert records[0][1]["action"] == "CREATE"
+    # 時刻は退避時点で確定し、datetimeとして復元される
+    assert isinstance(records[1][1]["timestamp"], datetime)
+    buffer.remove(path, len(records))
+    assert not buffer.has_pending()
+    assert buffer.replayed == 2
+
+def test_rolls_over_to_new_segment(tmp_path):
+    """セグメントが一杯になると次のセグメントへ追記するテスト"""
+    buffer = SpillBuffer(str(tmp_path), segment_size=256, fsync="always")
+    for i in range(10):
+        buffer.append([("performance", {"endpoint": f"/{i}"})])
+    buffer.close()
+
+    endpoints = []
+    while buffer.has_pending():
+        path, records = buffer.oldest()
+        endpoints.extend(data["endpoint"] for _, data in records)
+        buffer.remove(path)
+
+    assert len(list(tmp_path.iterdir())) == 0
+    assert endpoints == [f"/{i}" for i in range(10)]
+
+def test_reopen_after_restart(tmp_path):
+    """別のインスタンス（再起動後）から退避分を読めるテスト"""
+    buffer = SpillBuffer(str(tmp_path), segment_size=4096, fsync="never")
+    buffer.append([("application", {"level": "ERROR", "message": "boom"})])
+    buffer.close()
+
+    reopened = SpillBuffer(str(tmp_path), segment_size=4096)
+    reopened.append([("application", {"level": "INFO", "message": "after"})])
+
+    messages = []
+    while reopened.has_pending():
+        path, records = reopened.oldest()
+        messages.extend(data["message"] for _, data in records)
+        reopened.remove(path)
+    assert messages == ["boom", "after"]
+
+def test_ignores_torn_record(tmp_path):
+    """書き込み途中で壊れたレコード以降を読み飛ばすテスト"""
+    buffer = SpillBuffer(str(tmp_path), segment_size=4096)
+    buffer.append([("audit", {"action": "CREATE"}), ("audit", {"action": "UPDATE"})])
+    buffer.close()
+    [segment] = list(tmp_path.glob("*.seg"))
+    data = bytearray(segment.read_bytes())
+    # 2件目の本文を壊す
+    data[data.index(b"UPDATE")] = ord("X")
+    segment.write_bytes(bytes(data))
+
+    _, records = SpillBuffer(str(tmp_path)).oldest()
+
+    assert [data["action"] for _, data in records] == ["CREATE"]
+
+def test_rejects_unknown_fsync_policy(tmp_path):
+    """未対応のfsync方式を拒否するテスト"""
+    with pytest.raises(ValueError):
+        SpillBuffer(str(tmp_path), fsync="sometimes")